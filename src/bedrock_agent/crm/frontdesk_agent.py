@@ -1,29 +1,127 @@
+import copy
+import functools
+import json
+import logging
 import os
 import uuid
 from abc import ABC
+from types import MappingProxyType
 
-import boto3
 from dotenv import load_dotenv
 
 from bedrock_agent.crm.marketing_agent import MarketingAgent
-from bedrock_agent.crm.orders_support_agent import OrderSupportAgent
+from bedrock_agent.crm.non_collaborating_agent import REQUEST_TEMPLATE_ATTRIBUTES
+from bedrock_agent.crm.orders_support_agent import ORDERS_PAYLOAD_FILE, OrderSupportAgent
 from bedrock_agent.crm.product_support_agent import ProductSupportAgent
-from bedrock_agent.utils.inline_agent_utils import invoke_inline_agent_helper
+from bedrock_agent.utils.aws_clients import get_client
+from bedrock_agent.utils.inline_agent_utils import invoke_inline_agent, invoke_inline_agent_helper, load_json_file
+from bedrock_agent.utils.intent_router import IntentRouter, RoutingDecision
+from bedrock_agent.utils.invocation_metrics import InvocationResult
+from bedrock_agent.utils.request_compaction import PayloadSizeReport, compact_request_params, request_size
+
+logger = logging.getLogger(__name__)
 
 DEFAULT_FOUNDATIONAL_MODEL = "eu.amazon.nova-lite-v1:0"
 
 
+# Changing one of these attributes invalidates the cached request template
+FRONT_DESK_TEMPLATE_ATTRIBUTES = REQUEST_TEMPLATE_ATTRIBUTES | frozenset({"order_support_agent", "marketing_agent",
+                                                                           "product_support_agent", "compact_schemas"})
+
+# Messages that clearly belong to one collaborator, routed without asking the supervisor. The first matching
+# rule wins, so a message about ordering a product goes to order support and one about a product to product support.
+FRONT_DESK_ROUTING_RULES = {
+    "order_support_agent": [
+        r"\border\s*(?:id|number|no\.?)?\s*(?:#\s*)?\d+",
+        r"\b(?:cancel|track|change|update|delete|add|remove)\b.*\borders?\b",
+        r"\bwhere is my (?:order|package|delivery)\b",
+        r"\b(?:my|open|pending|which|all) (?:orders?|purchases?|packages?|deliver(?:y|ies)|shipments?)\b",
+        r"\b(?:purchased|bought|dispatched|shipped)\b",
+        r"\bi (?:would like|want) to (?:buy|order)\b",
+    ],
+    "product_support_agent": [
+        r"\b(?:headphones?|earbuds?|thermostats?|laptops?|keyboards?|fitness (?:bands?|trackers?))\b",
+        r"\b(?:sony|nest|dell|xps|fitbit|logitech|mx keys)\b",
+        r"\b(?:battery|single charge|waterproof|screen resolution|bluetooth)\b",
+    ],
+    "marketing_agent": [
+        r"\b(?:mission|vision)\b.*\bcompany\b",
+        r"\bcompany\b.*\b(?:mission|vision)\b",
+        r"\b(?:your|this|the) (?:company|firm|business|organi[sz]ation)\b",
+        r"\bas an? (?:company|firm|business|organi[sz]ation)\b",
+        r"\b(?:your|the) (?:offices?|headquarters|employees|founders?|competitors)\b",
+    ],
+}
+FRONT_DESK_ROUTING_EXAMPLES = {
+    "order_support_agent": [
+        "What is the status of my order",
+        "I want to order a product",
+        "Create a new order for two items",
+        "Show me the orders of a customer",
+        "Has my order been shipped",
+        "Change the quantity of my order",
+        "Cancel my order",
+    ],
+    "marketing_agent": [
+        "What is the mission of your company",
+        "Tell me about the vision of the company",
+        "When was the company founded",
+        "What values does your company stand for",
+        "Who are you as a company",
+        "Where is your headquarters",
+    ],
+    "product_support_agent": [
+        "Which device can monitor my heart rate",
+        "How long does the battery last",
+        "Can I use the headphones with a wired connection",
+        "Does the thermostat work with a voice assistant",
+        "How do I pair the keyboard with my laptop",
+        "Is the fitness tracker waterproof",
+        "What laptop do you sell",
+        "How do I install and set up the device",
+    ],
+}
+
+
+def default_front_desk_router() -> IntentRouter:
+    return IntentRouter(rules=FRONT_DESK_ROUTING_RULES, examples=FRONT_DESK_ROUTING_EXAMPLES)
+
+
 class FrontDeskAgent(ABC):
 
-    def __init__(self, foundational_model: str = None, session_id: str = None, order_support_agent: OrderSupportAgent = None, marketing_agent: MarketingAgent = None, product_support_agent: ProductSupportAgent = None):
+    def __init__(self, foundational_model: str = None, session_id: str = None, order_support_agent: OrderSupportAgent = None, marketing_agent: MarketingAgent = None, product_support_agent: ProductSupportAgent = None,
+                 router: IntentRouter = None, prune_collaborators: bool = False, compact_schemas: bool = False):
+        self._request_templates = {}
+        self._collaborator_versions = None
+        self._included_collaborators = set()
         self.foundational_model = foundational_model if foundational_model else DEFAULT_FOUNDATIONAL_MODEL
         self.session_id = session_id if session_id else str(uuid.uuid4())
         self.order_support_agent: OrderSupportAgent = order_support_agent
         self.marketing_agent: MarketingAgent = marketing_agent
         self.product_support_agent: ProductSupportAgent = product_support_agent
+        # Optional, sends clear messages straight to a collaborator and skips the supervisor LLM call
+        self.router = router
+        self.last_routing_decision = None
+        # Only send the collaborators the conversation so far needs, decided by the router or the default one
+        self.prune_collaborators = prune_collaborators
+        # Send minified action group schemas without the documentation the model does not use
+        self.compact_schemas = compact_schemas
+        self.last_payload_size = None
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if name in FRONT_DESK_TEMPLATE_ATTRIBUTES:
+            self._request_templates = {}
+        if name == "session_id":
+            # A new conversation starts without collaborators
+            self._included_collaborators = set()
 
+    def _collaborating_agents(self) -> list:
+        return [self.order_support_agent, self.marketing_agent, self.product_support_agent]
 
-    def agent_request_params(self) -> dict:
+    def _build_request_template(self, collaborator_names: frozenset = None, compact: bool = False) -> dict:
+        collaborators = [agent for agent in self._collaborating_agents() if agent is not None
+                         and (collaborator_names is None or agent.name in collaborator_names)]
         basic_config = {
             "enableTrace": True,
             "endSession": False,
@@ -34,7 +132,6 @@ class FrontDeskAgent(ABC):
                 "then relay the information to the Order Support Agent and Marketing Agent. "
             ),
             "agentCollaboration": "SUPERVISOR_ROUTER",
-            "sessionId": self.session_id,
             "collaboratorConfigurations": [
                 {
                     "collaboratorInstruction": "Use to answer questions about the company.",
@@ -52,29 +149,201 @@ class FrontDeskAgent(ABC):
                     "relayConversationHistory": "TO_COLLABORATOR"
                 }
             ],
-            "collaborators": [
-                self.order_support_agent.agent_request_params(as_collaborator=True),
-                self.marketing_agent.agent_request_params(as_collaborator=True),
-                self.product_support_agent.agent_request_params(as_collaborator=True)
-            ],
+            "collaborators": [agent.agent_request_params(as_collaborator=True) for agent in collaborators],
         }
+        names = {agent.name for agent in collaborators}
+        basic_config["collaboratorConfigurations"] = [
+            configuration for configuration in basic_config["collaboratorConfigurations"]
+            if configuration["collaboratorName"] in names
+        ]
+        if compact:
+            basic_config["collaborators"] = [compact_request_params(collaborator)
+                                             for collaborator in basic_config["collaborators"]]
         return basic_config
 
-    def prepare_input(self, input_text: str) -> dict:
+    def _template_and_size(self, collaborator_names: frozenset = None, compact: bool = None) -> tuple:
+        compact = self.compact_schemas if compact is None else compact
+        collaborator_versions = self._collaborator_template_versions()
+        if collaborator_versions != self._collaborator_versions:
+            self._request_templates = {}
+        key = (collaborator_names, compact)
+        entry = self._request_templates.get(key)
+        if entry is None:
+            template = MappingProxyType(self._build_request_template(collaborator_names, compact))
+            entry = (template, request_size(template))
+            self._request_templates[key] = entry
+            # Building can resolve lazy collaborator resources, which bumps their versions
+            self._collaborator_versions = self._collaborator_template_versions()
+        return entry
+
+    def _collaborator_template_versions(self) -> tuple:
+        return tuple(agent.template_version if agent is not None else None for agent in self._collaborating_agents())
+
+    def request_template(self, collaborator_names: frozenset = None, compact: bool = None) -> MappingProxyType:
+        """Read-only request parameters without the session, rebuilt only when the agent or a collaborator changes.
+
+        Without collaborator names all collaborators are included, compact defaults to compact_schemas.
+        """
+        return self._template_and_size(collaborator_names, compact)[0]
+
+    def agent_request_params(self, collaborator_names: frozenset = None) -> dict:
+        # A deep copy, so callers can change the nested collaborators without changing the cached template
+        params = copy.deepcopy(dict(self.request_template(collaborator_names)))
+        params["sessionId"] = self.session_id
+        return params
+
+    def payload_size_report(self, collaborator_names: frozenset = None) -> PayloadSizeReport:
+        """Size of the request template that is sent, compared to one with all collaborators and full schemas."""
+        return PayloadSizeReport(full_bytes=self._template_and_size(None, False)[1],
+                                 sent_bytes=self._template_and_size(collaborator_names)[1])
+
+    def select_collaborators(self, input_text: str) -> frozenset:
+        """Names of the collaborators the conversation so far needs, None when all of them are needed.
+
+        Collaborators stay included for the rest of the session, so the supervisor can return to them.
+        When nothing is known about the conversation yet, all collaborators are included.
+        """
+        names = {agent.name for agent in self._collaborating_agents() if agent is not None}
+        router = self.router if self.router is not None else _pruning_router()
+        self._included_collaborators |= router.candidates(input_text) & names
+        if not self._included_collaborators or self._included_collaborators == names:
+            return None
+        return frozenset(self._included_collaborators)
+
+    def reset_session(self, session_id: str = None):
+        """Start a new conversation, the collaborators that get routed messages start a new one too."""
+        self.session_id = session_id if session_id else str(uuid.uuid4())
+        for agent in self._collaborating_agents():
+            if agent is not None:
+                agent.reset_session()
+
+    def end_session_requests(self) -> list[dict]:
+        """Request parameters that close the Bedrock session, and those of the collaborators when routing."""
         params = self.agent_request_params()
+        params["enableTrace"] = False
+        params["endSession"] = True
+        requests = [params]
+        if self.router is not None:
+            for agent in self._collaborating_agents():
+                if agent is not None:
+                    requests.extend(agent.end_session_requests())
+        return requests
+
+    def route(self, input_text: str) -> RoutingDecision:
+        """Decide locally which collaborator handles the message, the route is None for the supervisor."""
+        if self.router is None:
+            return RoutingDecision(reason="no router")
+        decision = self.router.route(input_text)
+        names = {agent.name for agent in self._collaborating_agents() if agent is not None}
+        if decision.route is not None and decision.route not in names:
+            return RoutingDecision(confidence=decision.confidence, reason=f"unknown collaborator {decision.route}")
+        return decision
+
+    def _routed_collaborator(self):
+        """The collaborator of the last routing decision, None when the supervisor handles the message."""
+        if self.last_routing_decision is None or self.last_routing_decision.route is None:
+            return None
+        return next(agent for agent in self._collaborating_agents()
+                    if agent is not None and agent.name == self.last_routing_decision.route)
+
+    def invoke(self, client, input_text: str, **kwargs) -> InvocationResult:
+        """Invoke the supervisor, or the routed collaborator with its response cache.
+
+        The keyword arguments go to invoke_inline_agent.
+        """
+        params = self.prepare_input(input_text)
+        collaborator = self._routed_collaborator()
+        if collaborator is not None:
+            kwargs.setdefault("response_cache", collaborator.response_cache)
+        return invoke_inline_agent(client, params, **kwargs)
+
+    def prepare_input(self, input_text: str) -> dict:
+        """Request parameters for the message, for the routed collaborator directly when the router is sure.
+
+        A routed message goes to the collaborator in the session of the collaborator. The collaborator
+        does not see the earlier turns of the supervisor session, and the supervisor never sees the
+        routed turns. Follow-up messages routed to the same collaborator do keep their context.
+        Only use a router when messages that can be routed stand on their own.
+        """
+        self.last_routing_decision = self.route(input_text)
+        collaborator = self._routed_collaborator()
+        if collaborator is not None:
+            return collaborator.prepare_input(input_text)
+
+        collaborator_names = self.select_collaborators(input_text) if self.prune_collaborators else None
+        params = self.agent_request_params(collaborator_names)
         params["inputText"] = input_text
+        if self.prune_collaborators or self.compact_schemas:
+            self.last_payload_size = self.payload_size_report(collaborator_names)
+            logger.debug("Request for %s saves %d bytes, about %d input tokens",
+                         sorted(collaborator_names) if collaborator_names else "all collaborators",
+                         self.last_payload_size.bytes_saved, self.last_payload_size.tokens_saved)
 
         return params
 
+
+@functools.cache
+def _pruning_router() -> IntentRouter:
+    return default_front_desk_router()
+
+
+def evaluate_default_router(test_set_file: str = None):
+    """Print the accuracy and saved time of the default router for the labelled messages in the test set."""
+    if test_set_file is None:
+        test_set_file = os.path.join(os.path.dirname(__file__), "..", "..", "..", "samples", "routing_test_set.json")
+    with open(test_set_file, "r") as file:
+        labelled = [(item["message"], item["route"]) for item in json.load(file)]
+    report = default_front_desk_router().evaluate(labelled)
+    print(f"Routed {report.routed} of {report.messages} messages locally ({report.coverage:.0%}), "
+          f"accuracy {report.accuracy:.0%}, {report.average_latency_ms:.3f} ms per message, "
+          f"about {report.estimated_seconds_saved:,.0f}s of supervisor calls saved")
+    for text, expected, routed in report.misrouted:
+        print(f"  misrouted: {text!r} expected {expected}, routed to {routed}")
+
+
+def report_payload_sizes(conversation: list[str] = None):
+    """Print the bytes and input tokens that pruning and compact schemas save per turn of a conversation.
+
+    Runs offline, the order support agent gets a placeholder lambda ARN instead of a deployed lambda.
+    """
+    conversation = conversation or ["Hi there", "Which keyboard do you sell?",
+                                    "How do I pair the Logitech keyboard with my laptop?",
+                                    "Please order one for customer Jettro", "Thanks for the help!"]
+    order_support_agent = OrderSupportAgent(aws_region="eu-west-1")
+    order_support_agent.action_group = {
+        "name": "HandleOrders",
+        "executor": "arn:aws:lambda:eu-west-1:000000000000:function:placeholder",
+        "payload": load_json_file(ORDERS_PAYLOAD_FILE),
+        "description": "This action group handles the orders."
+    }
+    front_desk_agent = FrontDeskAgent(order_support_agent=order_support_agent,
+                                      marketing_agent=MarketingAgent(),
+                                      product_support_agent=ProductSupportAgent(aws_region="eu-west-1",
+                                                                                knowledge_base_id="placeholder"),
+                                      prune_collaborators=True, compact_schemas=True)
+    for input_text in conversation:
+        params = front_desk_agent.prepare_input(input_text)
+        report = front_desk_agent.last_payload_size
+        collaborators = [collaborator["agentName"] for collaborator in params["collaborators"]]
+        print(f"{input_text!r}: {report.sent_bytes:,} of {report.full_bytes:,} bytes, "
+              f"saved {report.bytes_saved:,} bytes, about {report.tokens_saved:,} input tokens, "
+              f"collaborators {', '.join(collaborators)}")
+
+
 if __name__ == "__main__":
+    import sys
+    if sys.argv[1:] == ["evaluate-router"]:
+        evaluate_default_router()
+        sys.exit()
+    if sys.argv[1:2] == ["payload-report"]:
+        report_payload_sizes(sys.argv[2:])
+        sys.exit()
+
     _ = load_dotenv()
 
     # Register new client using AWS CLI Authentication and our default region
     region = "eu-west-1"
-    bedrock_rt_client = boto3.client(
-        "bedrock-agent-runtime",
-        region_name=region
-    )
+    bedrock_rt_client = get_client("bedrock-agent-runtime", region_name=region)
 
     foundational_model = "eu.amazon.nova-lite-v1:0"
 
@@ -1,21 +1,607 @@
+import base64
 import json
 import logging
+import random
+import sqlite3
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from abc import ABC, abstractmethod
 
 import boto3
+from botocore.exceptions import ClientError
 import os
 import re
 
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+# Fraction of the invocations that log their payloads at INFO, with DEBUG enabled every invocation does
+PAYLOAD_LOG_SAMPLE_RATE = float(os.environ.get('PAYLOAD_LOG_SAMPLE_RATE', '0'))
+LOG_MAX_PAYLOAD_CHARS = int(os.environ.get('LOG_MAX_PAYLOAD_CHARS', '1000'))
+LOG_REDACT_FIELDS = frozenset(name.strip() for name in os.environ.get('LOG_REDACT_FIELDS', 'customer').split(',')
+                              if name.strip())
+LOG_CONTEXT_FIELDS = ("requestId", "apiPath", "actionGroup", "httpMethod")
+
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(LOG_LEVEL)
 
 
-s3 = boto3.client('s3')
 BUCKET_NAME = os.environ.get('BUCKET_NAME', 'inline-agent-sample-orders-bucket')
+ORDER_STORAGE = os.environ.get('ORDER_STORAGE', 's3')
+ORDER_STORAGE_PATH = os.environ.get('ORDER_STORAGE_PATH', '/tmp/orders')
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+INDEXED_FIELDS = ("customer", "status")
+# Fields the API sets itself, an update without them keeps the values of the stored order
+PRESERVED_ORDER_FIELDS = ("status", "createdAt")
+MAX_INDEX_TIME = 10 ** 17
+ORDER_LOCK_STRIPES = 64
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', '16'))
+MAX_BATCH_SIZE = 50
+ORDER_CACHE_SIZE = int(os.environ.get('ORDER_CACHE_SIZE', '1024'))
+ORDER_CACHE_TTL = float(os.environ.get('ORDER_CACHE_TTL', '30'))
+
+# The OpenAPI spec of the action group is packaged next to the handler, the request validators are built from it
+ORDER_API_SPEC_PATH = os.environ.get('ORDER_API_SPEC_PATH',
+                                     os.path.join(os.path.dirname(os.path.abspath(__file__)), 'payload-orders.json'))
+# Mirrors components/schemas/Order in payload-orders.json, used when a deployment does not contain the spec
+ORDER_LINE_SCHEMA = {
+    "type": "object",
+    "required": ["product", "qty"],
+    "properties": {
+        "product": {"type": "string"},
+        "qty": {"type": "integer"},
+    },
+}
+ORDER_SCHEMA = {
+    "type": "object",
+    "required": ["orderId", "customer", "orderLines", "total"],
+    "properties": {
+        "orderId": {"type": "string"},
+        "customer": {"type": "string"},
+        "orderLines": {"type": "array", "items": ORDER_LINE_SCHEMA},
+        "total": {"type": "number"},
+        "status": {"type": "string"},
+        "createdAt": {"type": "string"},
+    },
+}
+# Names the model sometimes uses for the fields of an order line
+ORDER_LINE_KEY_ALIASES = {"item": "product", "name": "product", "quantity": "qty"}
+
+
+def _redact(value):
+    """Copy of the value with the configured fields masked, also in Bedrock name/value property lists."""
+    if isinstance(value, dict):
+        if value.get("name") in LOG_REDACT_FIELDS and "value" in value:
+            return {**value, "value": "***"}
+        return {key: "***" if key in LOG_REDACT_FIELDS else _redact(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_redact(item) for item in value]
+    return value
+
+
+class RedactedPayload:
+    """Log argument that redacts and truncates the payload only when the record is actually formatted."""
+    __slots__ = ("payload",)
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def __str__(self):
+        text = json.dumps(_redact(self.payload), default=str)
+        if len(text) > LOG_MAX_PAYLOAD_CHARS:
+            return f"{text[:LOG_MAX_PAYLOAD_CHARS]}... ({len(text)} chars)"
+        return text
+
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per record, so CloudWatch Logs Insights can filter on the fields."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        for name in LOG_CONTEXT_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class InvocationContextFilter(logging.Filter):
+    """Adds the fields of the current invocation to every record."""
+
+    def filter(self, record):
+        for name, value in _log_context.items():
+            setattr(record, name, value)
+        return True
+
+
+_log_context = {}
+_log_payloads = False
+
+
+def configure_logging():
+    """Install the JSON formatter and the invocation context on the handlers of the Lambda runtime."""
+    for handler in logging.getLogger().handlers:
+        if not any(isinstance(log_filter, InvocationContextFilter) for log_filter in handler.filters):
+            handler.addFilter(InvocationContextFilter())
+        if LOG_FORMAT == "json":
+            handler.setFormatter(JsonLogFormatter())
+
+
+def start_invocation_logging(event, context):
+    """Set the context fields for this invocation and decide whether it logs its payloads."""
+    global _log_payloads
+    _log_context.clear()
+    _log_context.update(
+        requestId=getattr(context, "aws_request_id", None),
+        apiPath=event.get("apiPath"),
+        actionGroup=event.get("actionGroup"),
+        httpMethod=event.get("httpMethod"),
+    )
+    _log_payloads = logger.isEnabledFor(logging.DEBUG) or (
+            PAYLOAD_LOG_SAMPLE_RATE > 0 and random.random() < PAYLOAD_LOG_SAMPLE_RATE)
+
+
+def log_payload(message, payload):
+    """Log a redacted payload for sampled invocations, costs a single check for the others."""
+    if _log_payloads:
+        logger.info("%s: %s", message, RedactedPayload(payload))
+
+
+configure_logging()
+
+
+class OrderStorage(ABC):
+    """Where the handler keeps its orders, one JSON document per order ID."""
+
+    @abstractmethod
+    def get(self, order_id):
+        """Return the order as a dict, or None when it does not exist."""
+
+    @abstractmethod
+    def put(self, order_id, order):
+        """Create or replace the order."""
+
+    @abstractmethod
+    def delete(self, order_id):
+        """Remove the order, removing an unknown order is not an error."""
+
+    @abstractmethod
+    def query(self, customer=None, status=None, limit=DEFAULT_PAGE_SIZE, next_token=None):
+        """Return a page of orders for the customer and/or status, newest first, and the token of the next page."""
+
+    def get_if_modified(self, order_id, etag=None):
+        """Return the order, its ETag and whether it changed since the given ETag.
+
+        Stores without ETags always return the order as modified.
+        """
+        return self.get(order_id), None, True
+
+
+def encode_page_token(order_id, created_at):
+    return base64.urlsafe_b64encode(json.dumps([created_at or "", str(order_id)]).encode("utf-8")).decode("ascii")
+
+
+def decode_page_token(next_token):
+    try:
+        created_at, order_id = json.loads(base64.urlsafe_b64decode(next_token.encode("ascii")))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid nextToken: {next_token}") from e
+    return created_at, order_id
+
+
+class IndexedDocumentStorage(OrderStorage):
+    """Base for stores that only know documents by key, like S3 or a directory.
+
+    Next to orders/{id}.json, every order has an empty marker document per secondary index, for example
+    indexes/customer/{customer}/{entry}. The entry name holds the inverted creation time, the order ID and
+    the status, so listing the keys of one customer or status returns its orders newest first. Writes touch
+    only the markers of one order, and a query lists keys from the page token on instead of reading all orders.
+    """
+
+    def __init__(self):
+        # Writes to one order are serialised, writes to different orders can run concurrently
+        self._order_locks = [threading.Lock() for _ in range(ORDER_LOCK_STRIPES)]
+
+    def _order_lock(self, order_id):
+        return self._order_locks[hash(str(order_id)) % ORDER_LOCK_STRIPES]
+
+    @abstractmethod
+    def _read_document(self, key):
+        """Return the parsed JSON document, or None when it does not exist."""
+
+    @abstractmethod
+    def _write_document(self, key, document):
+        """Create or replace the JSON document."""
+
+    @abstractmethod
+    def _delete_document(self, key):
+        """Remove the document, removing an unknown document is not an error."""
+
+    @abstractmethod
+    def _list_keys(self, prefix, start_after=None):
+        """Yield the keys that start with the prefix in ascending order, beginning after start_after."""
+
+    @staticmethod
+    def _order_key(order_id):
+        return f"orders/{order_id}.json"
+
+    @staticmethod
+    def _index_prefix(field, value):
+        return f"indexes/{field}/{urllib.parse.quote(str(value), safe='')}/"
+
+    @staticmethod
+    def _index_entry(order_id, order):
+        created_at = order.get("createdAt")
+        try:
+            micros = int(datetime.fromisoformat(created_at).timestamp() * 1_000_000) if created_at else 0
+        except ValueError:
+            micros = 0
+        # Keys are listed in ascending order, inverting the time puts the newest order first
+        inverted_time = f"{MAX_INDEX_TIME - micros:017d}"
+        return "!".join([inverted_time, urllib.parse.quote(str(order_id), safe=''),
+                         urllib.parse.quote(str(order.get("status") or ""), safe='')])
+
+    @staticmethod
+    def _parse_index_entry(entry):
+        _, order_id, status = entry.split("!")
+        return urllib.parse.unquote(order_id), urllib.parse.unquote(status)
+
+    def _index_keys(self, order_id, order):
+        if order is None:
+            return set()
+        entry = self._index_entry(order_id, order)
+        return {self._index_prefix(field, order[field]) + entry for field in INDEXED_FIELDS
+                if order.get(field) is not None}
+
+    def _read_document_if_modified(self, key, etag=None):
+        """Return the document, its ETag and whether it changed, stores without ETags always read the document."""
+        return self._read_document(key), None, True
+
+    def get(self, order_id):
+        return self._read_document(self._order_key(order_id))
+
+    def get_if_modified(self, order_id, etag=None):
+        return self._read_document_if_modified(self._order_key(order_id), etag)
+
+    def put(self, order_id, order):
+        with self._order_lock(order_id):
+            old_order = self.get(order_id)
+            self._write_document(self._order_key(order_id), order)
+            self._update_indexes(order_id, old_order, order)
+
+    def delete(self, order_id):
+        with self._order_lock(order_id):
+            old_order = self.get(order_id)
+            self._delete_document(self._order_key(order_id))
+            self._update_indexes(order_id, old_order, None)
+
+    def _update_indexes(self, order_id, old_order, new_order):
+        old_keys = self._index_keys(order_id, old_order)
+        new_keys = self._index_keys(order_id, new_order)
+        for key in new_keys - old_keys:
+            self._write_document(key, {})
+        for key in old_keys - new_keys:
+            self._delete_document(key)
+
+    def query(self, customer=None, status=None, limit=DEFAULT_PAGE_SIZE, next_token=None):
+        if customer is None and status is None:
+            raise ValueError("Query orders by customer, status or both")
+
+        # The index entries of a customer contain the status, so one listing is enough to filter on both
+        prefix = self._index_prefix("customer", customer) if customer is not None \
+            else self._index_prefix("status", status)
+        start_after = None
+        if next_token:
+            try:
+                start_after = prefix + base64.urlsafe_b64decode(next_token.encode("ascii")).decode("utf-8")
+            except ValueError as e:
+                raise ValueError(f"Invalid nextToken: {next_token}") from e
+
+        orders = []
+        last_entry = None
+        has_more = False
+        for key in self._list_keys(prefix, start_after):
+            entry = key[len(prefix):]
+            order_id, entry_status = self._parse_index_entry(entry)
+            if status is not None and entry_status != status:
+                continue
+            if len(orders) == limit:
+                has_more = True
+                break
+            last_entry = entry
+            # Concurrent writers can leave a marker behind that no longer matches the order, only the markers
+            # of the stored order count, so the order matches the query and is listed once
+            order = self.get(order_id)
+            if order is not None and key in self._index_keys(order_id, order):
+                orders.append(order)
+
+        token = None
+        if has_more:
+            token = base64.urlsafe_b64encode(last_entry.encode("utf-8")).decode("ascii")
+        return orders, token
+
+
+class S3OrderStorage(IndexedDocumentStorage):
+    """Stores every order as orders/{id}.json in an S3 bucket."""
+
+    def __init__(self, bucket_name, client=None):
+        super().__init__()
+        self.bucket_name = bucket_name
+        self.client = client if client else boto3.client('s3')
+
+    def _read_document(self, key):
+        try:
+            obj = self.client.get_object(Bucket=self.bucket_name, Key=key)
+        except self.client.exceptions.NoSuchKey:
+            return None
+        return json.loads(obj["Body"].read().decode("utf-8"))
+
+    def _read_document_if_modified(self, key, etag=None):
+        parameters = {"Bucket": self.bucket_name, "Key": key}
+        if etag:
+            parameters["IfNoneMatch"] = etag
+        try:
+            obj = self.client.get_object(**parameters)
+        except self.client.exceptions.NoSuchKey:
+            return None, None, True
+        except ClientError as e:
+            # S3 answers a matching If-None-Match with 304 and no body
+            if e.response["Error"]["Code"] in ("304", "NotModified"):
+                return None, etag, False
+            raise
+        return json.loads(obj["Body"].read().decode("utf-8")), obj["ETag"], True
+
+    def _write_document(self, key, document):
+        self.client.put_object(Bucket=self.bucket_name, Key=key, Body=json.dumps(document))
+
+    def _delete_document(self, key):
+        self.client.delete_object(Bucket=self.bucket_name, Key=key)
+
+    def _list_keys(self, prefix, start_after=None):
+        parameters = {"Bucket": self.bucket_name, "Prefix": prefix}
+        if start_after:
+            parameters["StartAfter"] = start_after
+        for page in self.client.get_paginator("list_objects_v2").paginate(**parameters):
+            for obj in page.get("Contents", []):
+                yield obj["Key"]
+
+
+class LocalDirectoryOrderStorage(IndexedDocumentStorage):
+    """Stores every order as orders/{id}.json in a local directory, the same layout as the S3 bucket."""
+
+    def __init__(self, directory):
+        super().__init__()
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        # Order IDs come from the agent, never let them escape the directory
+        parts = [part for part in key.split("/") if part not in ("", ".", "..")]
+        return os.path.join(self.directory, *parts)
+
+    def _read_document(self, key):
+        try:
+            with open(self._path(key), "r") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def _write_document(self, key, document):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(document, file)
+        os.replace(temp_path, path)
+
+    def _delete_document(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _list_keys(self, prefix, start_after=None):
+        try:
+            names = sorted(os.listdir(self._path(prefix)))
+        except FileNotFoundError:
+            return
+        for name in names:
+            key = prefix + name
+            if start_after is None or key > start_after:
+                yield key
+
+
+class SqliteOrderStorage(OrderStorage):
+    """Stores orders in a SQLite table with the customer and status as indexed columns."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            if path != ":memory:":
+                self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS orders ("
+                "order_id TEXT PRIMARY KEY, customer TEXT, status TEXT, created_at TEXT, body TEXT NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS orders_customer ON orders (customer, created_at, order_id)")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS orders_status ON orders (status, created_at, order_id)")
+
+    def get(self, order_id):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT body FROM orders WHERE order_id = ?", (str(order_id),)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, order_id, order):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO orders (order_id, customer, status, created_at, body) VALUES (?, ?, ?, ?, ?)",
+                (str(order_id), order.get("customer"), order.get("status"), order.get("createdAt") or "",
+                 json.dumps(order)),
+            )
+
+    def delete(self, order_id):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM orders WHERE order_id = ?", (str(order_id),))
+
+    def query(self, customer=None, status=None, limit=DEFAULT_PAGE_SIZE, next_token=None):
+        if customer is None and status is None:
+            raise ValueError("Query orders by customer, status or both")
+
+        conditions = []
+        parameters = []
+        if customer is not None:
+            conditions.append("customer = ?")
+            parameters.append(customer)
+        if status is not None:
+            conditions.append("status = ?")
+            parameters.append(status)
+        if next_token:
+            conditions.append("(created_at, order_id) < (?, ?)")
+            parameters.extend(decode_page_token(next_token))
+
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT order_id, created_at, body FROM orders WHERE {' AND '.join(conditions)} "
+                "ORDER BY created_at DESC, order_id DESC LIMIT ?",
+                parameters + [limit + 1],
+            ).fetchall()
+
+        token = None
+        if len(rows) > limit:
+            order_id, created_at, _ = rows[limit - 1]
+            token = encode_page_token(order_id, created_at)
+        return [json.loads(body) for _, _, body in rows[:limit]], token
+
+
+class CachingOrderStorage(OrderStorage):
+    """Keeps recently read orders of a warm container in a bounded LRU cache.
+
+    Within ttl_seconds an order is served from memory. After that it is revalidated with its ETag, so an
+    unchanged S3 object is not downloaded and parsed again. Writes through this storage invalidate the
+    order, writes from other containers are picked up after at most ttl_seconds. Treat returned orders
+    as read-only, they are shared with the cache.
+    """
+
+    def __init__(self, storage, max_entries=ORDER_CACHE_SIZE, ttl_seconds=ORDER_CACHE_TTL):
+        self.storage = storage
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+    def get(self, order_id):
+        key = str(order_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if entry[2] > now:
+                    self.hits += 1
+                    return entry[0]
+            writes_before_read = self._writes
+
+        order, etag, modified = self.storage.get_if_modified(order_id, entry[1] if entry else None)
+        with self._lock:
+            if modified:
+                self.misses += 1
+            else:
+                self.revalidations += 1
+                order = entry[0]
+            # Do not cache what we read when a write happened in the meantime
+            if order is None or self._writes != writes_before_read:
+                self._entries.pop(key, None)
+                return order
+            self._entries[key] = (order, etag, now + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return order
+
+    def invalidate(self, order_id=None):
+        """Forget one order, or all orders when no ID is given."""
+        with self._lock:
+            self._writes += 1
+            if order_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(order_id), None)
+
+    def put(self, order_id, order):
+        try:
+            self.storage.put(order_id, order)
+        finally:
+            self.invalidate(order_id)
+
+    def delete(self, order_id):
+        try:
+            self.storage.delete(order_id)
+        finally:
+            self.invalidate(order_id)
+
+    def query(self, customer=None, status=None, limit=DEFAULT_PAGE_SIZE, next_token=None):
+        return self.storage.query(customer=customer, status=status, limit=limit, next_token=next_token)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "revalidations": self.revalidations,
+                    "size": len(self._entries)}
+
+
+def create_order_storage(kind=ORDER_STORAGE, path=ORDER_STORAGE_PATH):
+    """Create the storage configured with ORDER_STORAGE: s3, local or sqlite."""
+    if kind == 's3':
+        return S3OrderStorage(BUCKET_NAME)
+    if kind == 'local':
+        return LocalDirectoryOrderStorage(path)
+    if kind == 'sqlite':
+        return SqliteOrderStorage(path)
+    raise ValueError(f"Unknown order storage: {kind}")
+
+
+_storage = None
+
+
+def get_order_storage():
+    """Return the storage of this container, created on first use so it is reused while the container is warm."""
+    global _storage
+    if _storage is None:
+        _storage = create_order_storage()
+        if ORDER_CACHE_SIZE > 0:
+            _storage = CachingOrderStorage(_storage)
+    return _storage
+
+
+def set_order_storage(storage):
+    """Replace the storage, for example with a local one to load test the handler."""
+    global _storage
+    _storage = storage
 
 
 def lambda_handler(event, context):
-    logger.info(f"Calling function with API path: {event['apiPath']}")
-    logger.info(f"Calling function from Action Group: {event['actionGroup']}")
+    start_invocation_logging(event, context)
+    logger.info("Handling %s %s", event.get("httpMethod"), event.get("apiPath"))
+    log_payload("Event", event)
 
     method = event.get("httpMethod")
     path_params = event.get("pathParameters") or {}
@@ -25,106 +611,550 @@ def lambda_handler(event, context):
         order_id = next((param['value'] for param in parameters if param['name'] == 'id'), None)
 
     try:
-        if method == "POST":
-            logger.info(f"Creating order")
+        if event.get("apiPath") == "/orders/batch":
+            logger.debug("Batch operation: %s", method)
+            return handle_batch(method, event)
+        elif method == "POST":
+            logger.debug("Creating order")
             return create_order(event)
+        elif method == "GET" and event.get("apiPath") == "/orders":
+            logger.debug("Listing orders")
+            return list_orders(event)
         elif method == "GET" and order_id:
-            logger.info(f"Getting order: {order_id}")
+            logger.debug("Getting order: %s", order_id)
             return get_order(order_id, event)
         elif method == "PUT" and order_id:
-            logger.info(f"Updating order: {order_id}")
+            logger.debug("Updating order: %s", order_id)
             return update_order(order_id, event)
         elif method == "DELETE" and order_id:
-            logger.info(f"Deleting order: {order_id}")
+            logger.debug("Deleting order: %s", order_id)
             return delete_order(order_id, event)
         else:
             if not order_id and method != "POST":
-                logger.info(f"Missing order ID")
+                logger.warning("Missing order ID")
                 return response(400, {"error": "Missing order ID"}, event)
-            logger.info(f"Unsupported method: {method}")
+            logger.warning("Unsupported method: %s", method)
             return response(400, {"error": "Unsupported method or missing order ID"}, event)
+    except RequestValidationError as e:
+        logger.warning("Invalid request: %s", e)
+        return response(400, {"error": "Invalid request", "details": e.errors}, event)
+    except BedrockValueSyntaxError as e:
+        logger.warning("Could not parse the request: %s", e)
+        return response(400, {"error": str(e)}, event)
     except Exception as e:
+        logger.exception("Request failed")
         return response(500, {"error": str(e)}, event)
+    finally:
+        _log_cache_stats()
+
+
+def _log_cache_stats():
+    if isinstance(_storage, CachingOrderStorage) and logger.isEnabledFor(logging.INFO):
+        logger.info("Order cache: %s", _storage.stats())
+
+
+class BedrockValueSyntaxError(ValueError):
+    """Raised when a value from Bedrock cannot be parsed, the message holds the position."""
+
+
+_BARE_VALUE_END = re.compile(r"[,}\]]")
+_BARE_KEY_END = re.compile(r"[=:,}\]]")
+_QUOTED = {
+    '"': re.compile(r'"((?:[^"\\]|\\.)*)"', re.DOTALL),
+    "'": re.compile(r"'((?:[^'\\]|\\.)*)'", re.DOTALL),
+}
+_ESCAPE = re.compile(r"\\(.)", re.DOTALL)
+
+
+class _BedrockValueParser:
+    """Single pass parser for the Java Map.toString() like syntax Bedrock uses for arrays and objects,
+    for example [{product=Fries, qty=2}]. Also accepts JSON, quoted strings and ':' between keys and values.
+
+    Bare values stay strings, coerce_to_schema turns them into the types of the schema.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+
+    def error(self, message):
+        return BedrockValueSyntaxError(f"{message} at position {self.pos} of {len(self.text)}")
+
+    def skip_whitespace(self):
+        text, pos = self.text, self.pos
+        while pos < len(text) and text[pos].isspace():
+            pos += 1
+        self.pos = pos
+
+    def peek(self):
+        self.skip_whitespace()
+        return self.text[self.pos] if self.pos < len(self.text) else ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise self.error(f"Expected '{char}'")
+        self.pos += 1
+
+    def parse(self):
+        value = self.parse_value()
+        if self.peek():
+            raise self.error("Unexpected trailing text")
+        return value
+
+    def parse_value(self):
+        char = self.peek()
+        if char == "[":
+            return self.parse_list()
+        if char == "{":
+            return self.parse_map()
+        if char in _QUOTED:
+            return self.parse_quoted()
+        return self.parse_bare(_BARE_VALUE_END)
+
+    def parse_quoted(self):
+        match = _QUOTED[self.text[self.pos]].match(self.text, self.pos)
+        if not match:
+            raise self.error("Unterminated string")
+        self.pos = match.end()
+        return _ESCAPE.sub(r"\1", match.group(1))
+
+    def parse_bare(self, end_pattern):
+        match = end_pattern.search(self.text, self.pos)
+        end = match.start() if match else len(self.text)
+        value = self.text[self.pos:end].strip()
+        self.pos = end
+        return value
+
+    def parse_list(self):
+        self.pos += 1
+        items = []
+        if self.peek() == "]":
+            self.pos += 1
+            return items
+        while True:
+            items.append(self.parse_value())
+            char = self.peek()
+            self.pos += 1
+            if char == "]":
+                return items
+            if char != ",":
+                self.pos -= 1
+                raise self.error("Expected ',' or ']'")
+
+    def parse_map(self):
+        self.pos += 1
+        result = {}
+        if self.peek() == "}":
+            self.pos += 1
+            return result
+        while True:
+            key = self.parse_quoted() if self.peek() in _QUOTED else self.parse_bare(_BARE_KEY_END)
+            if not key or self.peek() not in ("=", ":"):
+                raise self.error("Expected a key followed by '=' or ':'")
+            self.pos += 1
+            if self.peek() in _QUOTED or self.peek() in ("[", "{"):
+                result[key] = self.parse_value()
+            else:
+                result[key] = self.parse_bare_map_value()
+            char = self.peek()
+            self.pos += 1
+            if char == "}":
+                return result
+            if char != ",":
+                self.pos -= 1
+                raise self.error("Expected ',' or '}'")
+
+    def parse_bare_map_value(self):
+        """Java does not quote strings, so a ',' that is not followed by a key is part of the value."""
+        parts = [self.parse_bare(_BARE_VALUE_END)]
+        text = self.text
+        while self.pos < len(text) and text[self.pos] == ",":
+            match = _BARE_KEY_END.search(text, self.pos + 1)
+            end = match.start() if match else len(text)
+            segment = text[self.pos + 1:end]
+            if text[end:end + 1] in ("=", ":") or segment.lstrip()[:1] in _QUOTED:
+                break
+            # Joined once at the end, concatenating every segment would copy the value for each ','
+            parts.append(segment.rstrip())
+            self.pos = end
+        return ",".join(parts).strip()
+
+
+def parse_bedrock_value(text):
+    """Parse an array or object that Bedrock passed as a string, raises BedrockValueSyntaxError."""
+    return _BedrockValueParser(text).parse()
+
+
+def _coerce_scalar(value, value_type):
+    if not isinstance(value, str) or value_type == "string":
+        return value
+    if value == "null":
+        return None
+    try:
+        if value_type == "integer":
+            try:
+                # Exact for large numbers, a float only keeps 53 bits
+                return int(value)
+            except ValueError:
+                number = float(value)
+                return int(number) if number.is_integer() else value
+        if value_type == "number":
+            return float(value)
+    except ValueError:
+        return value
+    if value_type == "boolean" and value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    return value
+
+
+class RequestValidationError(ValueError):
+    """Raised when a request body does not match its schema, errors holds one entry per problem."""
+
+    def __init__(self, errors):
+        super().__init__("; ".join(f"{error['field']} {error['message']}" for error in errors))
+        self.errors = errors
+
+
+_SCALAR_TYPES = {
+    "string": (str,),
+    "integer": (int,),
+    "number": (int, float),
+    "boolean": (bool,),
+}
+
+
+def _field(path, name):
+    return f"{path}.{name}" if path else name
+
+
+def compile_validator(schema):
+    """Turn an OpenAPI schema into a function (value, path, errors) -> value that coerces the strings
+    Bedrock sends into the types of the schema and appends what does not fit to errors."""
+    value_type = schema.get("type")
+
+    if value_type == "object":
+        properties = {name: compile_validator(property_schema)
+                      for name, property_schema in schema.get("properties", {}).items()}
+        required = tuple(schema.get("required", ()))
+
+        def validate_object(value, path, errors):
+            if isinstance(value, str) and value.lstrip().startswith("{"):
+                try:
+                    value = parse_bedrock_value(value)
+                except BedrockValueSyntaxError as e:
+                    errors.append({"field": path, "message": f"is not a valid object: {e}"})
+                    return value
+            if not isinstance(value, dict):
+                errors.append({"field": path, "message": "must be an object"})
+                return value
+            for name in required:
+                if value.get(name) in (None, ""):
+                    errors.append({"field": _field(path, name), "message": "is required"})
+            return {name: properties[name](item, _field(path, name), errors) if name in properties else item
+                    for name, item in value.items()}
+        return validate_object
+
+    if value_type == "array":
+        validate_item = compile_validator(schema.get("items", {}))
+
+        def validate_array(value, path, errors):
+            if isinstance(value, str):
+                try:
+                    value = parse_bedrock_value(value)
+                except BedrockValueSyntaxError as e:
+                    errors.append({"field": path, "message": f"is not a valid list: {e}"})
+                    return value
+            if not isinstance(value, list):
+                errors.append({"field": path, "message": "must be a list"})
+                return value
+            return [validate_item(item, f"{path}[{index}]", errors) for index, item in enumerate(value)]
+        return validate_array
+
+    expected = _SCALAR_TYPES.get(value_type)
+    if expected is None:
+        return lambda value, path, errors: value
+
+    def validate_scalar(value, path, errors):
+        if value_type == "string" and isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = str(value)
+        value = _coerce_scalar(value, value_type)
+        if value is not None and (not isinstance(value, expected)
+                                  or (value_type != "boolean" and isinstance(value, bool))):
+            errors.append({"field": path, "message": f"must be of type {value_type}"})
+        return value
+    return validate_scalar
+
+
+def _resolve_refs(schema, spec):
+    if isinstance(schema, dict):
+        if "$ref" in schema:
+            target = spec
+            for part in schema["$ref"].lstrip("#/").split("/"):
+                target = target[part]
+            return _resolve_refs(target, spec)
+        return {key: _resolve_refs(value, spec) for key, value in schema.items()}
+    if isinstance(schema, list):
+        return [_resolve_refs(item, spec) for item in schema]
+    return schema
+
+
+def load_request_validators(spec_path=ORDER_API_SPEC_PATH):
+    """Build a validator per (apiPath, httpMethod) from the request bodies in the OpenAPI spec."""
+    try:
+        with open(spec_path, "r") as file:
+            spec = json.load(file)
+        schemas = {}
+        for api_path, operations in spec.get("paths", {}).items():
+            for method, operation in operations.items():
+                body_schema = (operation.get("requestBody", {}).get("content", {})
+                               .get("application/json", {}).get("schema"))
+                if body_schema:
+                    schemas[(api_path, method.upper())] = _resolve_refs(body_schema, spec)
+    except FileNotFoundError:
+        logger.warning("No OpenAPI spec at %s, validating orders with the built-in schema", spec_path)
+        batch_schema = {"type": "object", "required": ["orders"],
+                        "properties": {"orders": {"type": "array", "items": ORDER_SCHEMA}}}
+        schemas = {
+            ("/orders", "POST"): ORDER_SCHEMA,
+            ("/orders/{id}", "PUT"): ORDER_SCHEMA,
+            ("/orders/batch", "POST"): batch_schema,
+            ("/orders/batch", "PUT"): batch_schema,
+        }
+    return {route: compile_validator(schema) for route, schema in schemas.items()}
+
+
+REQUEST_VALIDATORS = load_request_validators()
+
+
+def validate_request(event, body):
+    """Coerce the body with the validator of the route, returns the body and the problems found."""
+    validator = REQUEST_VALIDATORS.get((event.get("apiPath"), (event.get("httpMethod") or "").upper()))
+    if validator is None:
+        return body, []
+    errors = []
+    return validator(body, "", errors), errors
 
 
 def normalize_bedrock_event(event):
     """Parses Bedrock agent-style payload into a proper JSON dict."""
-    logger.info(f"Normalizing Bedrock event: {event}")
     props = event["requestBody"]["content"]["application/json"]["properties"]
-    logger.info(f"Properties: {props}")
-    payload = {prop["name"]: prop["value"] for prop in props}
-    logger.info(f"Payload: {payload}")
+    payload = {}
+    for prop in props:
+        value = prop["value"]
+        if isinstance(value, str) and prop.get("type") in ("array", "object"):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                value = parse_bedrock_value(value)
+        payload[prop["name"]] = value
 
-    # Normalize numeric values
-    if "total" in payload:
-        payload["total"] = float(payload["total"])
+    if isinstance(payload.get("orders"), list):
+        payload["orders"] = [normalize_order(order) if isinstance(order, dict) else order
+                             for order in payload["orders"]]
+        return payload
 
-    # Normalize nested orderLines if needed
+    return normalize_order(payload)
+
+
+def _rename_order_line_keys(line):
+    if not isinstance(line, dict):
+        return line
+    return {ORDER_LINE_KEY_ALIASES.get(key, key): value for key, value in line.items()}
+
+
+def normalize_order(payload):
+    """Coerce the fields of an order that Bedrock passes as strings."""
     raw_order_lines = payload.get("orderLines")
-    logger.info(f"Raw order lines: {raw_order_lines}")
     if isinstance(raw_order_lines, str):
-        logger.info(f"Raw order lines is a string: {raw_order_lines}")
-
-        pattern = r"{(?:item|product)=([^,]+), quantity=(\d+)}"
-        matches = re.findall(pattern, raw_order_lines)
-        payload["orderLines"] = [
-            {"product": item.strip(), "qty": int(qty)}
-            for item, qty in matches
-        ]
-    logger.info(f"Payload: {payload}")
+        raw_order_lines = parse_bedrock_value(raw_order_lines)
+    if isinstance(raw_order_lines, list):
+        payload["orderLines"] = [_rename_order_line_keys(line) for line in raw_order_lines]
 
     return payload
 
-def create_order(event):
-    logger.info(f"In the create_order method with event {event}")
-
+def request_body(event):
     # Determine if this is a Bedrock invocation
     if "requestBody" in event:
-        body = normalize_bedrock_event(event)
-    else:
-        body = json.loads(event["body"])
+        return normalize_bedrock_event(event)
+    return json.loads(event["body"])
+
 
-    logger.info(f"Parsed body: {body}")
+def validated_request_body(event):
+    body, errors = validate_request(event, request_body(event))
+    if errors:
+        raise RequestValidationError(errors)
+    return body
+
+
+def store_new_order(body):
+    """Store one new order, returns the status code and the response body."""
     order_id = body.get("orderId")
     if not order_id:
-        logger.info("Missing orderId in body")
-        return response(400, {"error": "Missing orderId in body"}, event)
+        logger.warning("Missing orderId in body")
+        return 400, {"error": "Missing orderId in body"}
 
-    key = f"orders/{order_id}.json"
-    logger.info(f"Creating order: {order_id} and body {json.dumps(body)}")
+    body.setdefault("status", "created")
+    body.setdefault("createdAt", datetime.now(timezone.utc).isoformat())
     try:
-        # Check if the order already exists
-        s3.put_object(Bucket=BUCKET_NAME, Key=key, Body=json.dumps(body))
+        get_order_storage().put(order_id, body)
     except Exception as e:
-        logger.info(f"Error creating order: {e}")
-        return response(500, {"error": str(e)}, event)
+        logger.error("Error creating order %s: %s", order_id, e)
+        return 500, {"error": str(e)}
 
-    logger.info(f"Order created: {order_id} and stored in the S3 Bucket")
-    return response(200, {"confirmationMessage": "Order created", "orderId": order_id}, event)
+    logger.info("Order created: %s", order_id)
+    return 200, {"confirmationMessage": "Order created", "orderId": order_id}
+
+
+def store_updated_order(order_id, body):
+    """Replace one order, returns the status code and the response body."""
+    missing = [field for field in PRESERVED_ORDER_FIELDS if field not in body]
+    if missing:
+        # Keep the order in its place in the listings and in the status index
+        existing = get_order_storage().get(order_id) or {}
+        for field in missing:
+            if field in existing:
+                body[field] = existing[field]
+    get_order_storage().put(order_id, body)
+    return 200, {"message": "Order updated", "order_id": order_id}
+
+
+def create_order(event):
+    body = validated_request_body(event)
+    log_payload("Parsed body", body)
+    status_code, result = store_new_order(body)
+    return response(status_code, result, event)
+
+def _query_parameters(event):
+    """Collect query parameters from a Bedrock (parameters list) or API Gateway style event."""
+    query = dict(event.get("queryStringParameters") or {})
+    for param in event.get("parameters", []):
+        query.setdefault(param["name"], param["value"])
+    return query
+
+
+def list_orders(event):
+    query = _query_parameters(event)
+    customer = query.get("customer")
+    status = query.get("status")
+    if not customer and not status:
+        return response(400, {"error": "Provide a customer, a status or both to list orders"}, event)
 
-def get_order(order_id, event):
-    key = f"orders/{order_id}.json"
     try:
-        obj = s3.get_object(Bucket=BUCKET_NAME, Key=key)
-        order_data = json.loads(obj["Body"].read().decode("utf-8"))
-        return response(200, order_data, event)
-    except s3.exceptions.NoSuchKey:
+        limit = min(int(query.get("limit", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+        orders, next_token = get_order_storage().query(
+            customer=customer or None,
+            status=status or None,
+            limit=max(limit, 1),
+            next_token=query.get("nextToken") or None,
+        )
+    except ValueError as e:
+        return response(400, {"error": str(e)}, event)
+
+    return response(200, {"orders": orders, "nextToken": next_token}, event)
+
+
+def get_order(order_id, event):
+    order_data = get_order_storage().get(order_id)
+    if order_data is None:
         return response(404, {"error": "Order not found"}, event)
+    return response(200, order_data, event)
 
 
 def update_order(order_id, event):
-    body = json.loads(event["body"])
-    key = f"orders/{order_id}.json"
-    s3.put_object(Bucket=BUCKET_NAME, Key=key, Body=json.dumps(body))
-    return response(200, {"message": "Order updated", "order_id": order_id}, event)
+    status_code, result = store_updated_order(order_id, validated_request_body(event))
+    return response(status_code, result, event)
 
 
 def delete_order(order_id, event):
-    key = f"orders/{order_id}.json"
-    s3.delete_object(Bucket=BUCKET_NAME, Key=key)
+    get_order_storage().delete(order_id)
     return response(204, None, event)
 
 
+_batch_executor = None
+_BATCH_ITEM_FIELD = re.compile(r"orders\[(\d+)\]")
+
+
+def _run_batch(operation, items):
+    """Run the operation for every item on a thread pool that is reused while the container is warm."""
+    global _batch_executor
+    if _batch_executor is None:
+        _batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS)
+
+    def _safe(item):
+        try:
+            return operation(item)
+        except Exception as e:
+            return 500, {"error": str(e)}
+
+    return list(_batch_executor.map(_safe, items))
+
+
+def _batch_response(event, items, outcomes):
+    results = []
+    for item_id, (status_code, body) in zip(items, outcomes):
+        result = {"orderId": item_id, "statusCode": status_code}
+        if status_code >= 400:
+            result["error"] = body.get("error") if body else None
+        elif body is not None:
+            result["result"] = body
+        results.append(result)
+    succeeded = sum(1 for result in results if result["statusCode"] < 400)
+    return response(200, {"results": results, "succeeded": succeeded, "failed": len(results) - succeeded}, event)
+
+
+def _fetch_order(order_id):
+    order_data = get_order_storage().get(order_id)
+    if order_data is None:
+        return 404, {"error": "Order not found"}
+    return 200, order_data
+
+
+def _update_listed_order(order):
+    if not order.get("orderId"):
+        return 400, {"error": "Missing orderId in body"}
+    return store_updated_order(order["orderId"], order)
+
+
+def handle_batch(method, event):
+    """Create (POST), get (GET) or update (PUT) a list of orders, reporting the outcome per order."""
+    item_errors = {}
+    if method == "GET":
+        raw_ids = _query_parameters(event).get("ids") or ""
+        items = [order_id.strip() for order_id in raw_ids.split(",") if order_id.strip()]
+        operation = _fetch_order
+    elif method in ("POST", "PUT"):
+        body, errors = validate_request(event, request_body(event))
+        for error in errors:
+            match = _BATCH_ITEM_FIELD.match(error["field"])
+            if match is None:
+                raise RequestValidationError(errors)
+            item_errors.setdefault(int(match.group(1)), []).append(error)
+        items = body.get("orders")
+        if not isinstance(items, list):
+            return response(400, {"error": "Provide the orders as a list in the orders field"}, event)
+        if not all(isinstance(order, dict) for order in items):
+            return response(400, {"error": "Every item in orders must be an order object"}, event)
+        operation = store_new_order if method == "POST" else _update_listed_order
+    else:
+        return response(400, {"error": f"Unsupported method for batch: {method}"}, event)
+
+    if not items:
+        return response(400, {"error": "The batch is empty"}, event)
+    if len(items) > MAX_BATCH_SIZE:
+        return response(400, {"error": f"A batch can hold at most {MAX_BATCH_SIZE} orders"}, event)
+
+    if item_errors:
+        # Invalid orders are reported in the results, the others are still processed
+        valid_outcomes = iter(_run_batch(operation, [order for index, order in enumerate(items)
+                                                     if index not in item_errors]))
+        outcomes = [(400, {"error": str(RequestValidationError(item_errors[index]))}) if index in item_errors
+                    else next(valid_outcomes) for index in range(len(items))]
+    else:
+        outcomes = _run_batch(operation, items)
+    item_ids = items if method == "GET" else [order.get("orderId") for order in items]
+    return _batch_response(event, item_ids, outcomes)
+
+
 def response(status_code, body, event):
     return {
         "response": {
@@ -138,4 +1168,4 @@ def response(status_code, body, event):
                 }
             }
         }
-    }
\ No newline at end of file
+    }
@@ -2,10 +2,11 @@ import uuid
 from abc import ABC
 
 from bedrock_agent.crm.non_collaborating_agent import NonCollaboratingAgent
+from bedrock_agent.utils.response_cache import ResponseCache
 
 
 class MarketingAgent(NonCollaboratingAgent):
-    def __init__(self, foundational_model: str = None, session_id: str = None):
+    def __init__(self, foundational_model: str = None, session_id: str = None, response_cache: ResponseCache = None):
         instructions = (
             "You are the Marketing Agent. Your primary goal is to provide detailed, accurate, and helpful information "
             "about our company. You can make up everything you want, but make sure it is believable."
@@ -14,5 +15,6 @@ class MarketingAgent(NonCollaboratingAgent):
             instructions=instructions,
             foundational_model=foundational_model,
             session_id=session_id,
-            name="marketing_agent"
+            name="marketing_agent",
+            response_cache=response_cache
         )
@@ -1,39 +1,65 @@
+import copy
 import uuid
 from abc import ABC
+from types import MappingProxyType
+
+from bedrock_agent.utils.inline_agent_utils import invoke_inline_agent
+from bedrock_agent.utils.invocation_metrics import InvocationResult
+from bedrock_agent.utils.local_tools import RETURN_CONTROL
+from bedrock_agent.utils.response_cache import ResponseCache
 
 
 DEFAULT_FOUNDATIONAL_MODEL = "eu.amazon.nova-lite-v1:0"
 
+# Changing one of these attributes invalidates the cached request template
+REQUEST_TEMPLATE_ATTRIBUTES = frozenset({"foundational_model", "instructions", "action_group", "knowledge_base", "name"})
+
 
 class NonCollaboratingAgent(ABC):
-    def __init__(self, instructions: str, name: str, foundational_model: str = None, session_id: str = None):
+    def __init__(self, instructions: str, name: str, foundational_model: str = None, session_id: str = None,
+                 response_cache: ResponseCache = None):
+        self._request_templates = {}
+        self.template_version = 0
         self.foundational_model = foundational_model if foundational_model else DEFAULT_FOUNDATIONAL_MODEL
         self.session_id = session_id if session_id else str(uuid.uuid4())
         self.instructions = instructions
         self.action_group = None
         self.knowledge_base = None
         self.name = name
+        # Opt-in for agents whose answers do not depend on the conversation, used by invoke
+        self.response_cache = response_cache
 
-    def agent_request_params(self, as_collaborator: bool = False) -> dict:
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if name in REQUEST_TEMPLATE_ATTRIBUTES:
+            self.invalidate_request_template()
+
+    def invalidate_request_template(self):
+        """Drop the cached request template, call this after changing the action group or knowledge base in place."""
+        self._request_templates = {}
+        self.template_version += 1
+
+    def _build_request_template(self, as_collaborator: bool) -> dict:
         basic_config = {
             "enableTrace": True,
             "endSession": False,
             "foundationModel": self.foundational_model,
             "instruction": self.instructions,
             "agentCollaboration": "DISABLED",
-            "sessionId": self.session_id,
         }
         if self.action_group:
-            basic_config["actionGroups"] = [{
-                "actionGroupName": self.action_group["name"],
-                "actionGroupExecutor": {
-                    "lambda": self.action_group["executor"]
-                },
-                "apiSchema": {
-                    "payload": self.action_group["payload"]
-                },
-                "description": self.action_group["description"]
-            }]
+            action_group = {"actionGroupName": self.action_group["name"]}
+            # A lambda ARN as executor, or RETURN_CONTROL for functions that run in this process
+            if self.action_group["executor"] == RETURN_CONTROL:
+                action_group["actionGroupExecutor"] = {"customControl": RETURN_CONTROL}
+            else:
+                action_group["actionGroupExecutor"] = {"lambda": self.action_group["executor"]}
+            if "functions" in self.action_group:
+                action_group["functionSchema"] = {"functions": self.action_group["functions"]}
+            else:
+                action_group["apiSchema"] = {"payload": self.action_group["payload"]}
+            action_group["description"] = self.action_group["description"]
+            basic_config["actionGroups"] = [action_group]
         if self.knowledge_base:
             basic_config["knowledgeBases"] = [
                 self.knowledge_base
@@ -42,13 +68,43 @@ class NonCollaboratingAgent(ABC):
         if as_collaborator:
             basic_config.pop("enableTrace", None)
             basic_config.pop("endSession", None)
-            basic_config.pop("sessionId", None)
             basic_config["agentName"] = self.name
 
         return basic_config
 
+    def request_template(self, as_collaborator: bool = False) -> MappingProxyType:
+        """Read-only request parameters without the session, built once until the agent changes."""
+        template = self._request_templates.get(as_collaborator)
+        if template is None:
+            template = MappingProxyType(self._build_request_template(as_collaborator))
+            self._request_templates[as_collaborator] = template
+        return template
+
+    def agent_request_params(self, as_collaborator: bool = False) -> dict:
+        # A deep copy, so callers can change the nested action groups without changing the cached template
+        params = copy.deepcopy(dict(self.request_template(as_collaborator)))
+        if not as_collaborator:
+            params["sessionId"] = self.session_id
+        return params
+
+    def reset_session(self, session_id: str = None):
+        """Start a new conversation with the same agent, for instance when a pooled agent serves another user."""
+        self.session_id = session_id if session_id else str(uuid.uuid4())
+
+    def end_session_requests(self) -> list[dict]:
+        """Request parameters that close the Bedrock session of the agent, send them with invoke_inline_agent."""
+        params = self.agent_request_params()
+        params["enableTrace"] = False
+        params["endSession"] = True
+        return [params]
+
     def prepare_input(self, input_text: str) -> dict:
         params = self.agent_request_params()
         params["inputText"] = input_text
 
-        return params
\ No newline at end of file
+        return params
+
+    def invoke(self, client, input_text: str, **kwargs) -> InvocationResult:
+        """Invoke the agent with the message and its response cache, the keyword arguments go to invoke_inline_agent."""
+        kwargs.setdefault("response_cache", self.response_cache)
+        return invoke_inline_agent(client, self.prepare_input(input_text), **kwargs)
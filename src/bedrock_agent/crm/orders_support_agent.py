@@ -1,18 +1,29 @@
+import functools
 import os
 
-import boto3
-
 from bedrock_agent.crm.non_collaborating_agent import NonCollaboratingAgent
+from bedrock_agent.utils.aws_clients import get_client, get_client_registry
 from bedrock_agent.utils.inline_agent_utils import load_json_file
 from bedrock_agent.utils.lambda_creator import create_lambda_function_and_its_resources, \
     remove_lambda_function_and_its_resources
+from bedrock_agent.utils.provisioning_registry import ProvisioningRegistry, get_provisioning_registry
 
 ORDER_SUPPORT_AGENT_LAMBDA_NAME = "inline-agent-order-handler"
 ORDER_SUPPORT_AGENT_BUCKET_NAME = "inline-agent-sample-orders-bucket"
 
 
+# The OpenAPI spec of the orders lambda, the lambda builds its request validators from it
+ORDERS_PAYLOAD_FILE = os.path.join(os.path.dirname(__file__), "lambdas", "payload-orders.json")
+
+
+@functools.cache
+def _load_orders_payload() -> str:
+    return load_json_file(ORDERS_PAYLOAD_FILE)
+
+
 class OrderSupportAgent(NonCollaboratingAgent):
-    def __init__(self, aws_region: str, foundational_model: str = None, session_id: str = None):
+    def __init__(self, aws_region: str, foundational_model: str = None, session_id: str = None,
+                 provisioning_registry: ProvisioningRegistry = None):
         instructions = (
             "You are the Order Support Agent. Your primary goal is to provide detailed, accurate, and helpful information "
             "about the orders. Use only the information from the provided tools. If order is not available, "
@@ -22,16 +33,29 @@ class OrderSupportAgent(NonCollaboratingAgent):
         super().__init__(instructions=instructions, foundational_model=foundational_model, session_id=session_id, name="order_support_agent")
         self.lambda_name = ORDER_SUPPORT_AGENT_LAMBDA_NAME
         self.bucket_name = ORDER_SUPPORT_AGENT_BUCKET_NAME
-
-        sts_client = boto3.client("sts")
-        self.account_id = sts_client.get_caller_identity()["Account"]
         self.aws_region = aws_region
+        self.provisioning_registry = provisioning_registry if provisioning_registry else get_provisioning_registry()
+
+        # The account id, lambda and ActionGroup are resolved when the first request needs them
+
+    @property
+    def account_id(self) -> str:
+        # Keyed on the credentials and kept in memory only, other credentials may belong to another account
+        access_key_id = get_client_registry().access_key_id()
+        return self.provisioning_registry.get_or_create(
+            f"account_id:{access_key_id}",
+            lambda: get_client("sts").get_caller_identity()["Account"],
+            persist=False
+        )
+
+    @property
+    def lambda_function_arn(self) -> str:
+        return self.provisioning_registry.get_or_create(self._lambda_arn_key(), self._verify_lambda)
 
-        # Initialise the ActionGroup
-        self._verify_lambda()
-        self._add_action_group()
+    def _lambda_arn_key(self) -> str:
+        return f"lambda_arn:{self.aws_region}:{self.account_id}:{self.lambda_name}"
 
-    def _verify_lambda(self):
+    def _verify_lambda(self) -> str:
         # Get the directory of the current script
         script_dir = os.path.dirname(__file__)
 
@@ -44,25 +68,24 @@ class OrderSupportAgent(NonCollaboratingAgent):
             custom_name=self.lambda_name,
             lambda_code_path=lambda_function_path,
             bucket_name=self.bucket_name,
+            extra_files=[ORDERS_PAYLOAD_FILE],
         )
         lambda_function = resources['lambda_function']
-        self.lambda_function_arn = lambda_function['FunctionArn']
+        return lambda_function['FunctionArn']
 
     def _add_action_group(self):
-        # Get the directory of the current script
-        script_dir = os.path.dirname(__file__)
-
-        # Construct the path to lambda_function_order_handler.py
-        handle_orders_file = os.path.join(script_dir, "lambdas", "payload-orders.json")
-        handle_orders_payload = load_json_file(handle_orders_file)
-
         self.action_group = {
             "name": "HandleOrders",
             "executor": self.lambda_function_arn,
-            "payload": handle_orders_payload,
+            "payload": _load_orders_payload(),
             "description": "This action group handles the orders."
         }
 
+    def _build_request_template(self, as_collaborator: bool) -> dict:
+        if self.action_group is None:
+            self._add_action_group()
+        return super()._build_request_template(as_collaborator)
+
     def clean_up(self):
         """Clean up the resources used by the agent"""
         # Remove the lambda function and its resources
@@ -72,3 +95,5 @@ class OrderSupportAgent(NonCollaboratingAgent):
             custom_name=self.lambda_name,
             bucket_name=self.bucket_name,
         )
+        self.provisioning_registry.invalidate(self._lambda_arn_key())
+        self.action_group = None
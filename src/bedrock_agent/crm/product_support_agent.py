@@ -1,11 +1,21 @@
-import boto3
+import uuid
+
 from botocore.exceptions import ClientError
 
 from bedrock_agent.crm.non_collaborating_agent import NonCollaboratingAgent
+from bedrock_agent.utils.aws_clients import get_client
+from bedrock_agent.utils.local_knowledge_base import DEFAULT_TOP_K, LocalKnowledgeBase
+from bedrock_agent.utils.local_tools import RETURN_CONTROL, get_local_tool_registry
+from bedrock_agent.utils.retrieval_cache import RetrievalCache
+
+LOCAL_SEARCH_ACTION_GROUP = "SearchProducts"
+LOCAL_SEARCH_FUNCTION = "search_products"
 
 
 class ProductSupportAgent(NonCollaboratingAgent):
-    def __init__(self, aws_region: str, knowledge_base_id: str, foundational_model: str = None, session_id: str = None):
+    def __init__(self, aws_region: str, knowledge_base_id: str = None, foundational_model: str = None,
+                 session_id: str = None, local_knowledge_base: LocalKnowledgeBase = None,
+                 retrieval_cache: RetrievalCache = None):
         instructions = (
             "You are the Product Support Agent. Your primary goal is to provide detailed, accurate, and helpful information "
             "about the products. Use only the information from the provided AWS knowledge base. If the information is not available, "
@@ -14,10 +24,17 @@ class ProductSupportAgent(NonCollaboratingAgent):
         super().__init__(instructions=instructions, foundational_model=foundational_model, session_id=session_id, name="product_support_agent")
         self.aws_region = aws_region
         self.knowledge_base_id = knowledge_base_id
+        self.local_knowledge_base = local_knowledge_base
+        self.retrieval_cache = retrieval_cache
+        self._runtime_client = None
+        self.local_search_action_group = None
 
-        # Initialise the KnowledgeBase
-        self._add_knowledge_base()
-        
+        # Initialise the KnowledgeBase. A local one, or a remote one with cached results, is searched
+        # in this process through a tool
+        if local_knowledge_base is not None or retrieval_cache is not None:
+            self._add_local_search_tool()
+        else:
+            self._add_knowledge_base()
 
     def _add_knowledge_base(self):
         # Add the knowledge base to the agent
@@ -25,3 +42,54 @@ class ProductSupportAgent(NonCollaboratingAgent):
             "description": "Knowledge base for product support, contains information about products that we sell.",
             "knowledgeBaseId": self.knowledge_base_id
         }
+
+    def _add_local_search_tool(self):
+        # The tool registry is shared by the process, a name per agent makes sure the agent that the model
+        # talks to answers the search, and the weak registration lets pooled agents be garbage collected
+        self.local_search_action_group = f"{LOCAL_SEARCH_ACTION_GROUP}-{uuid.uuid4().hex[:12]}"
+        get_local_tool_registry().register(self.local_search_action_group, LOCAL_SEARCH_FUNCTION,
+                                           self.search_products, weak=True)
+        self.action_group = {
+            "name": self.local_search_action_group,
+            "executor": RETURN_CONTROL,
+            "functions": [{
+                "name": LOCAL_SEARCH_FUNCTION,
+                "description": "Search the product documentation, returns the most relevant passages.",
+                "parameters": {
+                    "query": {
+                        "type": "string",
+                        "description": "The question or keywords to search for",
+                        "required": True
+                    }
+                }
+            }],
+            "description": "Knowledge base for product support, contains information about products that we sell."
+        }
+
+    def clean_up(self):
+        """Remove the local search tool of the agent from the tool registry."""
+        if self.local_search_action_group:
+            get_local_tool_registry().unregister(self.local_search_action_group)
+
+    def search_products(self, query: str) -> list[dict]:
+        if self.retrieval_cache is None:
+            return self._retrieve(query)
+        version = self.local_knowledge_base.version if self.local_knowledge_base is not None else None
+        return self.retrieval_cache.get_or_retrieve(query, self._retrieve, source_version=version)
+
+    def _retrieve(self, query: str) -> list[dict]:
+        if self.local_knowledge_base is not None:
+            return [hit.as_dict() for hit in self.local_knowledge_base.search(query, top_k=DEFAULT_TOP_K)]
+
+        if self._runtime_client is None:
+            self._runtime_client = get_client("bedrock-agent-runtime", region_name=self.aws_region)
+        response = self._runtime_client.retrieve(
+            knowledgeBaseId=self.knowledge_base_id,
+            retrievalQuery={"text": query},
+            retrievalConfiguration={"vectorSearchConfiguration": {"numberOfResults": DEFAULT_TOP_K}}
+        )
+        return [{
+            "source": result.get("location", {}).get("s3Location", {}).get("uri"),
+            "text": result["content"]["text"],
+            "score": result.get("score"),
+        } for result in response["retrievalResults"]]
@@ -1,8 +1,6 @@
 import uuid
 
-import boto3
-
-
+from bedrock_agent.utils.aws_clients import get_client
 from bedrock_agent.utils.inline_agent_utils import invoke_inline_agent_helper
 
 async def main():
@@ -14,10 +12,7 @@ async def main():
     region = "eu-west-1"
 
     # Runtime Endpoints
-    bedrock_rt_client = boto3.client(
-        "bedrock-agent-runtime",
-        region_name=region
-    )
+    bedrock_rt_client = get_client("bedrock-agent-runtime", region_name=region)
 
     session_id = str(uuid.uuid4())
     model_id = "eu.amazon.nova-lite-v1:0"
@@ -1,19 +1,9 @@
-import boto3
-
-from bedrock_agent.crm.orders_support_agent import ORDER_SUPPORT_AGENT_LAMBDA_NAME, ORDER_SUPPORT_AGENT_BUCKET_NAME
-from bedrock_agent.utils.lambda_creator import remove_lambda_function_and_its_resources
+from bedrock_agent.crm.orders_support_agent import OrderSupportAgent
 
 if __name__ == "__main__":
-    sts_client = boto3.client("sts")
-
     # Example usage
     region = "eu-west-1"
-    account_id = sts_client.get_caller_identity()["Account"]
 
-    # Remove Lambda function for Order Support Agent
-    remove_lambda_function_and_its_resources(
-        region,
-        account_id,
-        ORDER_SUPPORT_AGENT_LAMBDA_NAME,
-        ORDER_SUPPORT_AGENT_BUCKET_NAME
-    )
\ No newline at end of file
+    # Remove Lambda function for Order Support Agent, clean_up also forgets its cached ARN, so the next run
+    # provisions the lambda again
+    OrderSupportAgent(aws_region=region).clean_up()
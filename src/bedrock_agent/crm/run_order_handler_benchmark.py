@@ -0,0 +1,51 @@
+import json
+import os
+import sys
+import tempfile
+import time
+
+from bedrock_agent.crm.lambdas.lambda_function_order_handler import ORDER_SCHEMA, compile_validator, \
+    create_order_storage, lambda_handler, normalize_order, set_order_storage
+
+
+def benchmark_order_lines_parser(lines: int):
+    validator = compile_validator(ORDER_SCHEMA["properties"]["orderLines"])
+    text = "[" + ", ".join(f"{{product=Product {i}, extra, qty={i % 10 + 1}}}" for i in range(lines)) + "]"
+    start = time.perf_counter()
+    parsed = validator(normalize_order({"orderLines": text})["orderLines"], "orderLines", [])
+    duration = time.perf_counter() - start
+    if len(parsed) != lines or parsed[-1]["product"] != f"Product {lines - 1}, extra":
+        raise ValueError(f"Parsed {len(parsed)} order lines instead of {lines}")
+    print(f"parsed {lines:,} order lines ({len(text):,} chars) in {duration * 1000:,.1f} ms")
+
+
+def load_test_order_handler(kind: str, requests: int):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'orders.db' if kind == 'sqlite' else 'orders')
+        set_order_storage(create_order_storage(kind, path))
+
+        start = time.perf_counter()
+        for i in range(requests):
+            lambda_handler({
+                "apiPath": "/orders", "actionGroup": "HandleOrders", "httpMethod": "POST",
+                "body": json.dumps({"orderId": str(i), "customer": "Jettro", "total": 10.0,
+                                    "orderLines": [{"product": "Fries", "qty": 1}]}),
+            }, None)
+            lambda_handler({
+                "apiPath": "/orders/{id}", "actionGroup": "HandleOrders", "httpMethod": "GET",
+                "parameters": [{"name": "id", "type": "string", "value": str(i)}],
+            }, None)
+        duration = time.perf_counter() - start
+        set_order_storage(None)
+        print(f"{kind}: {2 * requests / duration:,.0f} requests/s")
+
+
+if __name__ == "__main__":
+    # Load test the order handler on a laptop: python -m bedrock_agent.crm.run_order_handler_benchmark
+    # [local|sqlite] [requests], or benchmark the orderLines parser with the arguments parse [lines]
+    kind = sys.argv[1] if len(sys.argv) > 1 else 'sqlite'
+    if kind == 'parse':
+        for lines in (10, 1000, int(sys.argv[2]) if len(sys.argv) > 2 else 100000):
+            benchmark_order_lines_parser(lines)
+    else:
+        load_test_order_handler(kind, int(sys.argv[2]) if len(sys.argv) > 2 else 5000)
@@ -0,0 +1,117 @@
+import json
+import threading
+
+import boto3
+from botocore.config import Config
+
+# Connections per client, enough for the sessions of ainvoke_inline_agent_many and parallel tool calls
+DEFAULT_MAX_POOL_CONNECTIONS = 50
+DEFAULT_CONNECT_TIMEOUT_SECONDS = 5
+# Agent answers stream for a long time, the read timeout applies to the gap between two events
+DEFAULT_READ_TIMEOUT_SECONDS = 120
+DEFAULT_CLIENT_OPTIONS = {
+    "max_pool_connections": DEFAULT_MAX_POOL_CONNECTIONS,
+    "tcp_keepalive": True,
+    "connect_timeout": DEFAULT_CONNECT_TIMEOUT_SECONDS,
+    "read_timeout": DEFAULT_READ_TIMEOUT_SECONDS,
+    "retries": {"mode": "adaptive", "max_attempts": 5},
+}
+# Options per service on top of DEFAULT_CLIENT_OPTIONS. Agent invocations are retried and rate limited by the
+# InvocationGuard, botocore retries inside every guarded attempt would multiply the attempts and run a second
+# rate limiter against the guard.
+SERVICE_CLIENT_OPTIONS = {
+    "bedrock-agent-runtime": {"retries": {"mode": "standard", "total_max_attempts": 1}},
+}
+
+
+class ClientRegistry:
+    """Thread-safe cache of boto3 clients, keyed on the service, region and config options.
+
+    A client is created on first use and then shared: boto3 clients are thread-safe, and sharing
+    one reuses its resolved credentials, loaded endpoint data and pool of open connections. The
+    options are botocore Config arguments on top of DEFAULT_CLIENT_OPTIONS and SERVICE_CLIENT_OPTIONS.
+    """
+
+    def __init__(self, session: boto3.session.Session = None, default_options: dict = None,
+                 service_options: dict = None):
+        self._session = session
+        self.default_options = DEFAULT_CLIENT_OPTIONS if default_options is None else default_options
+        self.service_options = SERVICE_CLIENT_OPTIONS if service_options is None else service_options
+        self._lock = threading.Lock()
+        self._clients = {}
+
+    def _options(self, service_name: str, config_options: dict) -> dict:
+        options = dict(self.default_options)
+        options.update(self.service_options.get(service_name, {}))
+        options.update(config_options)
+        return options
+
+    def client(self, service_name: str, region_name: str = None, **config_options):
+        # Most callers use the default options, their key skips serializing the options
+        key = (service_name, region_name, json.dumps(config_options, sort_keys=True, default=str)
+               if config_options else None)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        options = self._options(service_name, config_options)
+        with self._lock:
+            # Another thread may have created the client while we were waiting
+            client = self._clients.get(key)
+            if client is None:
+                # A boto3 session is not thread-safe, so clients are only created while holding the lock
+                if self._session is None:
+                    self._session = boto3.session.Session()
+                client = self._session.client(service_name, region_name=region_name, config=Config(**options))
+                self._clients[key] = client
+        return client
+
+    def access_key_id(self) -> str:
+        """Access key id of the credentials the clients sign with, None without credentials."""
+        with self._lock:
+            if self._session is None:
+                self._session = boto3.session.Session()
+            credentials = self._session.get_credentials()
+        return credentials.access_key if credentials else None
+
+    def clear(self):
+        """Forget all clients, for instance after the credentials changed."""
+        with self._lock:
+            self._clients = {}
+            self._session = None
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_client_registry() -> ClientRegistry:
+    """Return the registry shared by all agents and utilities in this process."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ClientRegistry()
+        return _registry
+
+
+def get_client(service_name: str, region_name: str = None, **config_options):
+    """Shared boto3 client for the service and region, created on first use."""
+    return get_client_registry().client(service_name, region_name, **config_options)
+
+
+if __name__ == "__main__":
+    import time
+
+    runs = 200
+    start = time.perf_counter()
+    for _ in range(runs):
+        boto3.client("bedrock-agent-runtime", region_name="eu-west-1")
+    per_new_client = (time.perf_counter() - start) / runs
+    start = time.perf_counter()
+    get_client("bedrock-agent-runtime", region_name="eu-west-1")
+    first_shared_client = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(runs):
+        get_client("bedrock-agent-runtime", region_name="eu-west-1")
+    per_shared_client = (time.perf_counter() - start) / runs
+    print(f"New client: {per_new_client * 1000:,.2f} ms, first shared client: {first_shared_client * 1000:,.2f} ms, "
+          f"shared client afterwards: {per_shared_client * 1000:,.4f} ms")
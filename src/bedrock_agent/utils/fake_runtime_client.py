@@ -0,0 +1,135 @@
+import asyncio
+import time
+import uuid
+
+DEFAULT_ANSWER = (
+    "Our mission is to bring healthy, connected devices to every home, "
+    "backed by support that actually listens."
+)
+
+
+def canned_events(answer: str = DEFAULT_ANSWER, chunk_size: int = 32, with_traces: bool = True) -> list:
+    """Create the events of a typical inline agent completion stream."""
+    events = []
+    if with_traces:
+        events.append({"trace": {"trace": {"preProcessingTrace": {
+            "modelInvocationOutput": {"metadata": {"usage": {"inputTokens": 512, "outputTokens": 48}}}
+        }}}})
+        events.append({"trace": {"trace": {"orchestrationTrace": {
+            "rationale": {"text": "The user asks about the order, I will look it up."}
+        }}}})
+        events.append({"trace": {"trace": {"orchestrationTrace": {
+            "invocationInput": {"actionGroupInvocationInput": {
+                "actionGroupName": "HandleOrders",
+                "apiPath": "/orders/{id}",
+                "verb": "get",
+                "parameters": [{"name": "id", "type": "string", "value": "123"}],
+            }}
+        }}}})
+        events.append({"trace": {"trace": {"orchestrationTrace": {
+            "observation": {"actionGroupInvocationOutput": {"text": '{"orderId": "123", "status": "shipped"}'}}
+        }}}})
+        events.append({"trace": {"trace": {"orchestrationTrace": {
+            "modelInvocationOutput": {"metadata": {"usage": {"inputTokens": 1024, "outputTokens": 96}}}
+        }}}})
+        events.append({"trace": {"trace": {"orchestrationTrace": {
+            "observation": {"finalResponse": {"text": answer}}
+        }}}})
+
+    data = answer.encode("utf8")
+    for start in range(0, len(data), chunk_size):
+        events.append({"chunk": {"bytes": data[start:start + chunk_size]}})
+
+    if with_traces:
+        events.append({"trace": {"trace": {"postProcessingTrace": {
+            "modelInvocationOutput": {"metadata": {"usage": {"inputTokens": 256, "outputTokens": 32}}}
+        }}}})
+    return events
+
+
+def _response(request_params, completion) -> dict:
+    return {
+        "ResponseMetadata": {
+            "RequestId": str(uuid.uuid4()),
+            "HTTPStatusCode": 200,
+            "RetryAttempts": 0,
+        },
+        "contentType": "application/json",
+        "sessionId": request_params.get("sessionId"),
+        "completion": completion,
+    }
+
+
+class FakeInlineAgentRuntimeClient:
+    """Offline stand-in for the bedrock-agent-runtime client.
+
+    invoke_inline_agent returns a blocking event stream with canned chunk and trace events,
+    sleeping event_delay seconds before every event to mimic the time Bedrock takes.
+    """
+
+    def __init__(self, events: list = None, event_delay: float = 0.0, call_delay: float = 0.0):
+        self.events = events if events is not None else canned_events()
+        self.event_delay = event_delay
+        self.call_delay = call_delay
+        self.calls = 0
+
+    def invoke_inline_agent(self, **request_params) -> dict:
+        self.calls += 1
+        if self.call_delay:
+            time.sleep(self.call_delay)
+        return _response(request_params, self._event_stream())
+
+    def _event_stream(self):
+        for event in self.events:
+            if self.event_delay:
+                time.sleep(self.event_delay)
+            yield event
+
+
+class AsyncFakeInlineAgentRuntimeClient(FakeInlineAgentRuntimeClient):
+    """Like FakeInlineAgentRuntimeClient, but with a coroutine method and an async event stream."""
+
+    async def invoke_inline_agent(self, **request_params) -> dict:
+        self.calls += 1
+        if self.call_delay:
+            await asyncio.sleep(self.call_delay)
+        return _response(request_params, self._async_event_stream())
+
+    async def _async_event_stream(self):
+        for event in self.events:
+            if self.event_delay:
+                await asyncio.sleep(self.event_delay)
+            yield event
+
+
+def sample_request_params(input_text: str) -> dict:
+    """Minimal request parameters for the fake clients, with a new session id."""
+    return {
+        "enableTrace": False,
+        "endSession": False,
+        "foundationModel": "eu.amazon.nova-lite-v1:0",
+        "instruction": "You are a helpful assistant.",
+        "sessionId": str(uuid.uuid4()),
+        "inputText": input_text,
+    }
+
+
+if __name__ == "__main__":
+    from bedrock_agent.utils.inline_agent_utils import ainvoke_inline_agent_many, invoke_inline_agent_helper
+
+    sessions = 200
+    event_delay = 0.005
+    params_list = [sample_request_params(f"What is the status of order {i}?") for i in range(sessions)]
+
+    sync_client = FakeInlineAgentRuntimeClient(event_delay=event_delay)
+    start = time.perf_counter()
+    for params in params_list[:20]:
+        invoke_inline_agent_helper(sync_client, params)
+    sync_rate = 20 / (time.perf_counter() - start)
+    print(f"Sequential helper: {sync_rate:,.1f} sessions/s")
+
+    async_client = AsyncFakeInlineAgentRuntimeClient(event_delay=event_delay)
+    start = time.perf_counter()
+    asyncio.run(ainvoke_inline_agent_many(async_client, params_list, max_concurrency=sessions))
+    async_rate = sessions / (time.perf_counter() - start)
+    print(f"Async fan-out of {sessions} sessions: {async_rate:,.1f} sessions/s")
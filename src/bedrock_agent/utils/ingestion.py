@@ -0,0 +1,297 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+
+from bedrock_agent.utils.local_knowledge_base import LocalKnowledgeBase, chunk_markdown
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 64
+
+
+@dataclass(slots=True)
+class SourceDocument:
+    source: str
+    path: str
+    sha256: str
+    size: int
+    mtime_ns: int
+
+
+@dataclass(slots=True)
+class IngestionReport:
+    added: list = field(default_factory=list)
+    updated: list = field(default_factory=list)
+    removed: list = field(default_factory=list)
+    unchanged: int = 0
+    chunks_written: int = 0
+    duration_seconds: float = 0.0
+
+
+class IngestionManifest:
+    """Content hash per ingested document, so a rerun only handles what changed.
+
+    Stored as JSON lines, save appends the entries that changed since the previous save and rewrites the
+    file only when it holds more outdated lines than entries. A line cut off by a crash is dropped.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}
+        self._changed = {}
+        self._lines = 0
+        self._size = 0
+        if path and os.path.exists(path):
+            try:
+                self._read()
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable ingestion manifest {path}: {str(e)}")
+                self.entries, self._lines, self._size = {}, 0, 0
+
+    def _read(self):
+        with open(self.path, "rb") as file:
+            data = file.read()
+        # Without a trailing newline, the last line was cut off while it was appended
+        complete = data[:data.rfind(b"\n") + 1]
+        for line in complete.decode("utf8").splitlines():
+            entry = json.loads(line)
+            source = entry.pop("source")
+            if entry:
+                self.entries[source] = entry
+            else:
+                self.entries.pop(source, None)
+            self._lines += 1
+        self._size = len(complete)
+
+    def record(self, document: SourceDocument):
+        self.entries[document.source] = {"sha256": document.sha256, "size": document.size,
+                                         "mtime_ns": document.mtime_ns}
+        self._changed[document.source] = self.entries[document.source]
+
+    def touch(self, source: str, mtime_ns: int):
+        """Record a new modification time of a document whose content did not change."""
+        self.entries[source]["mtime_ns"] = mtime_ns
+        self._changed[source] = self.entries[source]
+
+    def forget(self, source: str):
+        del self.entries[source]
+        self._changed[source] = None
+
+    def save(self):
+        if not self.path or not self._changed:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if self._lines + len(self._changed) > 2 * len(self.entries):
+            temp_file = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_file, "wb") as file:
+                file.write(_manifest_lines(self.entries).encode("utf8"))
+                size = file.tell()
+            os.replace(temp_file, self.path)
+            self._lines = len(self.entries)
+        else:
+            mode = "r+b" if os.path.exists(self.path) else "wb"
+            with open(self.path, mode) as file:
+                file.truncate(self._size)
+                file.seek(self._size)
+                file.write(_manifest_lines(self._changed).encode("utf8"))
+                size = file.tell()
+            self._lines += len(self._changed)
+        self._size = size
+        self._changed = {}
+
+
+def _manifest_lines(entries: dict) -> str:
+    return "".join(json.dumps({"source": source, **(entry or {})}) + "\n" for source, entry in entries.items())
+
+
+class IngestionTarget:
+    """Receives the changed and removed documents. The base class ignores everything."""
+
+    def upsert(self, documents: list[SourceDocument]) -> int:
+        """Replace the content of the documents, returns the number of chunks written."""
+        return 0
+
+    def remove(self, sources: list[str]):
+        pass
+
+    def checkpoint(self):
+        """Persist what was written so far, called before the manifest records a batch as done."""
+        pass
+
+    def finish(self):
+        pass
+
+
+class LocalIndexTarget(IngestionTarget):
+    """Chunks and embeds changed documents into a LocalKnowledgeBase, saved to directory when given.
+
+    Every checkpoint appends the batch to the saved knowledge base, see LocalKnowledgeBase.save.
+    """
+
+    def __init__(self, knowledge_base: LocalKnowledgeBase, directory: str = None, chunker=chunk_markdown):
+        self.knowledge_base = knowledge_base
+        self.directory = directory
+        self.chunker = chunker
+
+    def upsert(self, documents: list[SourceDocument]) -> int:
+        chunks = []
+        for document in documents:
+            self.knowledge_base.remove_source(document.source)
+            with open(document.path, "r", encoding="utf8") as file:
+                chunks.extend(self.chunker(file.read(), source=document.source))
+        # One call for the whole batch, so the embedder sees the chunks of many documents at once
+        self.knowledge_base.add(chunks)
+        return len(chunks)
+
+    def remove(self, sources: list[str]):
+        for source in sources:
+            self.knowledge_base.remove_source(source)
+
+    def checkpoint(self):
+        if self.directory:
+            self.knowledge_base.save(self.directory)
+
+    def finish(self):
+        self.checkpoint()
+
+
+class S3DataSourceTarget(IngestionTarget):
+    """Uploads changed documents to the S3 data source of a Bedrock knowledge base.
+
+    Bedrock chunks and embeds the documents itself. When the knowledge base and data source ids are
+    given, finish starts an ingestion job, which only processes the objects that changed.
+    """
+
+    def __init__(self, s3_client, bucket_name: str, prefix: str = "", bedrock_agent_client=None,
+                 knowledge_base_id: str = None, data_source_id: str = None):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.bedrock_agent_client = bedrock_agent_client
+        self.knowledge_base_id = knowledge_base_id
+        self.data_source_id = data_source_id
+        self.changed = False
+
+    def upsert(self, documents: list[SourceDocument]) -> int:
+        for document in documents:
+            self.s3_client.upload_file(document.path, self.bucket_name, f"{self.prefix}{document.source}")
+        self.changed = self.changed or bool(documents)
+        return 0
+
+    def remove(self, sources: list[str]):
+        for start in range(0, len(sources), 1000):
+            self.s3_client.delete_objects(Bucket=self.bucket_name, Delete={
+                "Objects": [{"Key": f"{self.prefix}{source}"} for source in sources[start:start + 1000]],
+                "Quiet": True,
+            })
+        self.changed = self.changed or bool(sources)
+
+    def finish(self):
+        if self.changed and self.bedrock_agent_client and self.knowledge_base_id and self.data_source_id:
+            job = self.bedrock_agent_client.start_ingestion_job(knowledgeBaseId=self.knowledge_base_id,
+                                                                dataSourceId=self.data_source_id)
+            logger.info(f"Started ingestion job {job['ingestionJob']['ingestionJobId']}")
+
+
+def _sha256(path: str) -> str:
+    with open(path, "rb") as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+
+def _changed_documents(directory: str, pattern: str, manifest: IngestionManifest, report: IngestionReport,
+                       seen: set):
+    """Yield the documents whose content differs from the manifest, one file at a time."""
+    for path in glob.iglob(os.path.join(directory, pattern), recursive=True):
+        if not os.path.isfile(path):
+            continue
+        source = os.path.relpath(path, directory)
+        seen.add(source)
+        stat = os.stat(path)
+        entry = manifest.entries.get(source)
+        # Only hash a file when its size or modification time changed
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            report.unchanged += 1
+            continue
+        sha256 = _sha256(path)
+        if entry and entry["sha256"] == sha256:
+            manifest.touch(source, stat.st_mtime_ns)
+            report.unchanged += 1
+            continue
+        (report.updated if entry else report.added).append(source)
+        yield SourceDocument(source, path, sha256, stat.st_size, stat.st_mtime_ns)
+
+
+def ingest_documents(directory: str, target: IngestionTarget, manifest: IngestionManifest,
+                     pattern: str = "product*.md", batch_size: int = DEFAULT_BATCH_SIZE) -> IngestionReport:
+    """Send the new and changed documents in directory to the target and remove the deleted ones.
+
+    Documents are streamed in batches of batch_size and the manifest is saved after every batch,
+    so an interrupted run continues where it stopped and a rerun without changes does nothing.
+    """
+    start = time.perf_counter()
+    report = IngestionReport()
+    seen = set()
+    batch = []
+
+    def _flush():
+        report.chunks_written += target.upsert(batch)
+        # The target first, a manifest that is ahead of the saved index would skip documents forever
+        target.checkpoint()
+        for document in batch:
+            manifest.record(document)
+        manifest.save()
+        batch.clear()
+
+    for document in _changed_documents(directory, pattern, manifest, report, seen):
+        batch.append(document)
+        if len(batch) >= batch_size:
+            _flush()
+    if batch:
+        _flush()
+
+    report.removed = [source for source in manifest.entries if source not in seen]
+    if report.removed:
+        target.remove(report.removed)
+        for source in report.removed:
+            manifest.forget(source)
+    target.finish()
+    manifest.save()
+
+    report.duration_seconds = time.perf_counter() - start
+    logger.info(f"Ingested {len(report.added)} new and {len(report.updated)} changed documents, "
+                f"removed {len(report.removed)}, {report.unchanged} unchanged")
+    return report
+
+
+if __name__ == "__main__":
+    import shutil
+    import tempfile
+
+    from bedrock_agent.utils.local_knowledge_base import HashingEmbedder, np
+
+    samples_dir = os.path.join(os.path.dirname(__file__), "..", "..", "..", "samples")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        documents_dir = os.path.join(temp_dir, "documents")
+        shutil.copytree(samples_dir, documents_dir)
+        index_dir = os.path.join(temp_dir, "index")
+        embedder = HashingEmbedder() if np is not None else None
+
+        def _run(label):
+            knowledge_base = LocalKnowledgeBase.load(index_dir, embedder=embedder)
+            manifest = IngestionManifest(os.path.join(index_dir, "manifest.jsonl"))
+            report = ingest_documents(documents_dir, LocalIndexTarget(knowledge_base, index_dir), manifest)
+            print(f"{label}: added {len(report.added)}, updated {len(report.updated)}, "
+                  f"removed {len(report.removed)}, unchanged {report.unchanged}, "
+                  f"{report.chunks_written} chunks in {report.duration_seconds * 1000:,.1f} ms, "
+                  f"index holds {len(knowledge_base)} chunks")
+
+        _run("first run")
+        _run("rerun")
+        with open(os.path.join(documents_dir, "product1.md"), "a", encoding="utf8") as file:
+            file.write("\n# Warranty\nTwo years of warranty.\n")
+        os.remove(os.path.join(documents_dir, "product5.md"))
+        _run("one edited, one deleted")
@@ -1,10 +1,26 @@
+import asyncio
+import codecs
+import copy
+import functools
+import inspect
 import json
 import os
-from datetime import datetime
+import time
 
-from rich.console import Console
-from rich.markdown import Markdown
-from termcolor import colored
+from bedrock_agent.utils.invocation_guard import InvocationGuard
+from bedrock_agent.utils.invocation_metrics import CollaboratorTiming, InvocationResult, StepTiming, ToolCallTiming
+from bedrock_agent.utils.local_tools import get_local_tool_registry
+from bedrock_agent.utils.response_cache import ResponseCache
+from bedrock_agent.utils.trace_events import ChunkEvent, ConsoleTraceSink, FilesEvent, ModelUsage, NullTraceSink, \
+    OrchestrationEvent, PostProcessingEvent, PreProcessingEvent, ReturnControlEvent, parse_event
+
+DEFAULT_MAX_CONCURRENCY = 100
+# Maximum number of times one invocation hands control back to run local tools
+MAX_RETURN_CONTROL_ROUNDS = 10
+# Upper bound of the attempts of one round, the guard decides how many it actually allows
+MAX_ATTEMPTS_PER_ROUND = 10
+
+_STREAM_END = object()
 
 
 def load_json_file(file_path) -> str:
@@ -14,303 +30,468 @@ def load_json_file(file_path) -> str:
     return json.dumps(data, indent=2)
 
 
-def invoke_inline_agent_helper(client, request_params, trace_level="core"):
-    _time_before_call = datetime.now()
-
-    _agent_resp = client.invoke_inline_agent(
-        **request_params
-    )
-
-    if request_params["enableTrace"]:
-        if trace_level == "all":
-            print(f"invokeAgent API response object: {_agent_resp}")
-        else:
-            print(
-                f"invokeAgent API request ID: {_agent_resp['ResponseMetadata']['RequestId']}"
-            )
-            session_id = request_params["sessionId"]
-            print(f"invokeAgent API session ID: {session_id}")
-
-    # Return error message if invoke was unsuccessful
-    if _agent_resp["ResponseMetadata"]["HTTPStatusCode"] != 200:
-        _error_message = f"API Response was not 200: {_agent_resp}"
-        if request_params["enableTrace"] and trace_level == "all":
-            print(_error_message)
-        return _error_message
-
-    _total_in_tokens = 0
-    _total_out_tokens = 0
-    _total_llm_calls = 0
-    _orch_step = 0
-    _sub_step = 0
-    _trace_truncation_lenght = 300
-    _time_before_orchestration = datetime.now()
-
-    _agent_answer = ""
-    _event_stream = _agent_resp["completion"]
-    print(_agent_resp)
-
-    try:
-        for _event in _event_stream:
-            _sub_agent_alias_id = None
-
-            if "chunk" in _event:
-                _data = _event["chunk"]["bytes"]
-                _agent_answer = _data.decode("utf8")
-
-            if "trace" in _event and request_params["enableTrace"]:
-                if "failureTrace" in _event["trace"]["trace"]:
-                    print(
-                        colored(
-                            f"Agent error: {_event['trace']['trace']['failureTrace']['failureReason']}",
-                            "red",
-                        )
-                    )
-
-                if "orchestrationTrace" in _event["trace"]["trace"]:
-                    _orch = _event["trace"]["trace"]["orchestrationTrace"]
-
-                    if trace_level in ["core", "outline"]:
-                        if "rationale" in _orch:
-                            _rationale = _orch["rationale"]
-                            print(colored(f"{_rationale['text']}", "blue"))
-
-                        if "invocationInput" in _orch:
-                            # NOTE: when agent determines invocations should happen in parallel
-                            # the trace objects for invocation input still come back one at a time.
-                            _input = _orch["invocationInput"]
-                            print(_input)
-
-                            if "actionGroupInvocationInput" in _input:
-                                if 'function' in _input['actionGroupInvocationInput']:
-                                    tool = _input['actionGroupInvocationInput']['function']
-                                elif 'apiPath' in _input['actionGroupInvocationInput']:
-                                    tool = _input['actionGroupInvocationInput']['apiPath']
-                                else:
-                                    tool = 'undefined'
-                                if trace_level == "outline":
-                                    print(
-                                        colored(
-                                            f"Using tool: {tool}",
-                                            "magenta",
-                                        )
-                                    )
-                                else:
-                                    print(
-                                        colored(
-                                            f"Using tool: {tool} with these inputs:",
-                                            "magenta",
-                                        )
-                                    )
-                                    # TODO made a change here to print the inputs
-                                    if "parameters" not in _input["actionGroupInvocationInput"]:
-                                        print(
-                                            colored(
-                                                f"  No parameters provided.\n",
-                                                "magenta",
-                                            )
-                                        )
-                                    else:
-                                        if (
-                                            len(
-                                                _input["actionGroupInvocationInput"][
-                                                    "parameters"
-                                                ]
-                                            )
-                                            == 1
-                                        ) and (
-                                            _input["actionGroupInvocationInput"][
-                                                "parameters"
-                                            ][0]["name"]
-                                            == "input_text"
-                                        ):
-                                            print(
-                                                colored(
-                                                    f"{_input['actionGroupInvocationInput']['parameters'][0]['value']}",
-                                                    "magenta",
-                                                )
-                                            )
-                                        else:
-                                            print(
-                                                colored(
-                                                    f"{_input['actionGroupInvocationInput']['parameters']}\n",
-                                                    "magenta",
-                                                )
-                                            )
-
-                            elif "codeInterpreterInvocationInput" in _input:
-                                if trace_level == "outline":
-                                    print(
-                                        colored(
-                                            f"Using code interpreter", "magenta"
-                                        )
-                                    )
-                                else:
-                                    console = Console()
-                                    _gen_code = _input[
-                                        "codeInterpreterInvocationInput"
-                                    ]["code"]
-                                    _code = f"```python\n{_gen_code}\n```"
-
-                                    console.print(
-                                        Markdown(f"**Generated code**\n{_code}")
-                                    )
-
-                        if "observation" in _orch:
-                            if trace_level == "core":
-                                _output = _orch["observation"]
-                                if "actionGroupInvocationOutput" in _output:
-                                    print(
-                                        colored(
-                                            f"--tool outputs:\n{_output['actionGroupInvocationOutput']['text'][0:_trace_truncation_lenght]}...\n",
-                                            "magenta",
-                                        )
-                                    )
-
-                                if "agentCollaboratorInvocationOutput" in _output:
-                                    _collab_name = _output[
-                                        "agentCollaboratorInvocationOutput"
-                                    ]["agentCollaboratorName"]
-                                    _collab_output_text = _output[
-                                        "agentCollaboratorInvocationOutput"
-                                    ]["output"]["text"][0:_trace_truncation_lenght]
-                                    print(
-                                        colored(
-                                            f"\n----sub-agent {_collab_name} output text:\n{_collab_output_text}...\n",
-                                            "magenta",
-                                        )
-                                    )
-
-                                if "finalResponse" in _output:
-                                    print(
-                                        colored(
-                                            f"Final response:\n{_output['finalResponse']['text'][0:_trace_truncation_lenght]}...",
-                                            "cyan",
-                                        )
-                                    )
-
-
-                    if "modelInvocationOutput" in _orch:
-                        _orch_step += 1
-                        _sub_step = 0
-                        print(colored(f"---- Step {_orch_step} ----", "green"))
-
-                        _llm_usage = _orch["modelInvocationOutput"]["metadata"][
-                            "usage"
-                        ]
-                        _in_tokens = _llm_usage["inputTokens"]
-                        _total_in_tokens += _in_tokens
-
-                        _out_tokens = _llm_usage["outputTokens"]
-                        _total_out_tokens += _out_tokens
-
-                        _total_llm_calls += 1
-                        _orch_duration = (
-                            datetime.now() - _time_before_orchestration
-                        )
-
-                        print(
-                            colored(
-                                f"Took {_orch_duration.total_seconds():,.1f}s, using {_in_tokens+_out_tokens} tokens (in: {_in_tokens}, out: {_out_tokens}) to complete prior action, observe, orchestrate.",
-                                "yellow",
-                            )
-                        )
-
-                        # restart the clock for next step/sub-step
-                        _time_before_orchestration = datetime.now()
-
-                elif "preProcessingTrace" in _event["trace"]["trace"]:
-                    _pre = _event["trace"]["trace"]["preProcessingTrace"]
-                    if "modelInvocationOutput" in _pre:
-                        _llm_usage = _pre["modelInvocationOutput"]["metadata"][
-                            "usage"
-                        ]
-                        _in_tokens = _llm_usage["inputTokens"]
-                        _total_in_tokens += _in_tokens
-
-                        _out_tokens = _llm_usage["outputTokens"]
-                        _total_out_tokens += _out_tokens
-
-                        _total_llm_calls += 1
-
-                        print(
-                            colored(
-                                "Pre-processing trace, agent came up with an initial plan.",
-                                "yellow",
-                            )
-                        )
-                        print(
-                            colored(
-                                f"Used LLM tokens, in: {_in_tokens}, out: {_out_tokens}",
-                                "yellow",
-                            )
+class _InvocationState:
+    """Running totals for one invocation while its event stream is consumed."""
+
+    def __init__(self, request_params, trace_sink, time_before_call):
+        self.enable_trace = request_params["enableTrace"]
+        self.trace_sink = trace_sink
+        self.time_before_call = time_before_call
+        self.time_before_orchestration = time.perf_counter()
+        self.result = InvocationResult(session_id=request_params.get("sessionId"))
+        self._pending_tool_calls = []
+        self._pending_collaborator_calls = {}
+        self._decoder = codecs.getincrementaldecoder("utf8")()
+        self._answer_parts = []
+        self.return_control = None
+        # The attempt may have called a tool or collaborator or returned control, retrying it could repeat those
+        self.tools_may_have_run = False
+        self._handlers = {
+            OrchestrationEvent: self._on_orchestration,
+            PreProcessingEvent: self._on_processing,
+            PostProcessingEvent: self._on_processing,
+            FilesEvent: self._on_files,
+            ReturnControlEvent: self._on_return_control,
+        }
+
+    def process(self, raw_event) -> str:
+        """Handle a single event from the completion stream, returns the new text of the answer."""
+        _delta = ""
+        for event in parse_event(raw_event, with_traces=self.enable_trace):
+            if isinstance(event, ChunkEvent):
+                _delta += self._on_chunk(event)
+                continue
+            handler = self._handlers.get(type(event))
+            if handler is not None:
+                handler(event)
+            self.trace_sink.emit(event)
+            if isinstance(event, OrchestrationEvent) and event.usage is not None:
+                self._complete_step(event.usage)
+        return _delta
+
+    def flush(self) -> str:
+        """Decode bytes still waiting for the rest of a multi-byte character."""
+        _delta = self._decoder.decode(b"", final=True)
+        if _delta:
+            self._answer_parts.append(_delta)
+        return _delta
+
+    def checkpoint(self) -> tuple:
+        """Snapshot at the start of a round, a retried attempt of the round starts again from it."""
+        self.tools_may_have_run = False
+        return copy.deepcopy((self.result, self._pending_tool_calls, self._pending_collaborator_calls,
+                              self.time_before_orchestration)), len(self._answer_parts)
+
+    def restore(self, checkpoint: tuple):
+        """Forget everything the failed attempt added since the checkpoint."""
+        _snapshot, _answer_parts = checkpoint
+        (self.result, self._pending_tool_calls, self._pending_collaborator_calls,
+         self.time_before_orchestration) = copy.deepcopy(_snapshot)
+        del self._answer_parts[_answer_parts:]
+        # Bytes of a character cut off by the failure must not end up before the text of the retry
+        self._decoder.reset()
+        self.return_control = None
+        self.tools_may_have_run = False
+
+    def complete(self) -> InvocationResult:
+        self.result.answer = "".join(self._answer_parts)
+        self.result.duration_seconds = time.perf_counter() - self.time_before_call
+        self.trace_sink.invocation_completed(
+            self.result.llm_calls,
+            ModelUsage(self.result.input_tokens, self.result.output_tokens),
+            self.result.duration_seconds,
+            self.result.answer,
+        )
+        return self.result
+
+    def _add_usage(self, usage):
+        self.result.input_tokens += usage.input_tokens
+        self.result.output_tokens += usage.output_tokens
+        self.result.llm_calls += 1
+
+    def _on_chunk(self, event) -> str:
+        if self.result.time_to_first_chunk_seconds is None:
+            self.result.time_to_first_chunk_seconds = time.perf_counter() - self.time_before_call
+        # A chunk can end halfway a multi-byte character, the decoder keeps those bytes for the next chunk
+        _delta = self._decoder.decode(event.data)
+        if _delta:
+            self._answer_parts.append(_delta)
+        return _delta
+
+    def _on_orchestration(self, event):
+        _now = time.perf_counter()
+        if event.tool is not None or event.collaborator_input_name is not None:
+            self.tools_may_have_run = True
+        if event.tool is not None:
+            self._pending_tool_calls.append((event.trace_id, event.tool, _now))
+        if event.tool_output is not None and self._pending_tool_calls:
+            # Match the output with its input by trace id, parallel tool calls report one at a time
+            _index = next((i for i, (trace_id, _, _) in enumerate(self._pending_tool_calls)
+                           if trace_id == event.trace_id), 0)
+            _, _tool, _started = self._pending_tool_calls.pop(_index)
+            self.result.tool_calls.append(ToolCallTiming(_tool, _now - _started))
+        if event.collaborator_input_name is not None:
+            self._pending_collaborator_calls[event.collaborator_input_name] = _now
+        if event.collaborator_name is not None:
+            _started = self._pending_collaborator_calls.pop(event.collaborator_name, None)
+            if _started is not None:
+                self.result.collaborator_calls.append(CollaboratorTiming(event.collaborator_name, _now - _started))
+        if event.usage is not None:
+            self._add_usage(event.usage)
+
+    def _on_processing(self, event):
+        if event.usage is not None:
+            self._add_usage(event.usage)
+
+    def _complete_step(self, usage):
+        _step = len(self.result.steps) + 1
+        _orch_duration = time.perf_counter() - self.time_before_orchestration
+        self.result.steps.append(StepTiming(_step, _orch_duration, usage.input_tokens, usage.output_tokens))
+        self.trace_sink.step_completed(_step, _orch_duration, usage)
+
+        # restart the clock for next step/sub-step
+        self.time_before_orchestration = time.perf_counter()
+
+    def _on_return_control(self, event):
+        self.return_control = event
+        self.tools_may_have_run = True
+
+    def _on_files(self, event):
+        for this_file in event.files:
+            # save bytes to file, given the name of file and the bytes
+            file_name = os.path.join("output", this_file["name"])
+            with open(file_name, "wb") as f:
+                f.write(this_file["bytes"])
+
+
+def _trace_sink_for(request_params, trace_level, trace_sink):
+    if not request_params["enableTrace"]:
+        return NullTraceSink()
+    return trace_sink if trace_sink is not None else ConsoleTraceSink(trace_level)
+
+
+def _failed_result(agent_resp, request_params, trace_sink):
+    if agent_resp["ResponseMetadata"]["HTTPStatusCode"] != 200:
+        _error_message = f"API Response was not 200: {agent_resp}"
+        trace_sink.error(_error_message)
+        return InvocationResult(session_id=request_params.get("sessionId"),
+                                request_id=agent_resp["ResponseMetadata"].get("RequestId"),
+                                error=_error_message)
+    return None
+
+
+class InlineAgentStreamError(Exception):
+    """The event stream of an invocation failed, the original error is the cause."""
+
+
+def _raise_stream_error(e, agent_resp, request_params, trace_sink):
+    metadata = agent_resp["ResponseMetadata"]
+    trace_sink.error(f"Event stream of invokeInlineAgent failed for session ID {request_params.get('sessionId')}, "
+                     f"request ID: {metadata.get('RequestId')}, retries: {metadata.get('RetryAttempts')}: {e}")
+    raise InlineAgentStreamError(f"Unexpected exception: {str(e)}") from e
+
+
+class InlineAgentStream:
+    """Invokes the inline agent and yields the text of the answer as it arrives.
+
+    Iterate with for or async for. Once the stream is exhausted, result holds the InvocationResult
+    with the complete answer, token counts and timings. When the agent returns control, the functions
+    are run from the local tool registry and the agent is invoked again with their results. With a
+    response_cache, a cached answer is yielded at once without invoking the agent. With a guard,
+    every round is rate limited and retried after retryable errors, see InvocationGuard.
+    """
+
+    def __init__(self, client, request_params, trace_level="core", trace_sink=None, executor=None,
+                 response_cache: ResponseCache = None, guard: InvocationGuard = None):
+        self.client = client
+        self.request_params = request_params
+        self.trace_sink = _trace_sink_for(request_params, trace_level, trace_sink)
+        self.executor = executor
+        self.response_cache = response_cache
+        self.guard = guard
+        self.retries = 0
+        # An attempt the guard let through that has not reported its outcome yet
+        self._attempt_pending = False
+        self.tool_registry = get_local_tool_registry()
+        self.result = None
+
+    def _cached_result(self, cached, time_before_call):
+        _duration = time.perf_counter() - time_before_call
+        self.result = InvocationResult(answer=cached["answer"], session_id=self.request_params.get("sessionId"),
+                                       request_id=cached["request_id"], duration_seconds=_duration,
+                                       time_to_first_chunk_seconds=_duration, cached=True)
+        self.trace_sink.invocation_completed(0, ModelUsage(), _duration, self.result.answer)
+        return self.result
+
+    def _cache_result(self):
+        if self.response_cache is not None and self.result is not None and not self.result.error:
+            self.response_cache.put(self.request_params, self.result.answer, self.result.request_id)
+
+    def _start(self, agent_resp, state) -> bool:
+        self.trace_sink.response_received(agent_resp, self.request_params["sessionId"])
+
+        # Return error message if invoke was unsuccessful
+        self.result = _failed_result(agent_resp, self.request_params, self.trace_sink)
+        if self.result:
+            return False
+
+        if state.result.request_id is None:
+            state.result.request_id = agent_resp["ResponseMetadata"]["RequestId"]
+            state.time_before_orchestration = time.perf_counter()
+        if not state.enable_trace:
+            # Without traces the stream does not show the tool calls that ran before it failed
+            state.tools_may_have_run = True
+        return True
+
+    def _before_attempt(self) -> float:
+        """Seconds to wait for the rate limiter of the guard before the next attempt."""
+        _wait = self.guard.before_attempt(self.guard.key(self.client, self.request_params))
+        self._attempt_pending = True
+        return _wait
+
+    def _abandon_attempt(self):
+        """Release the attempt of a stream that stopped without an outcome, so a circuit trial is not kept."""
+        if self._attempt_pending:
+            self._attempt_pending = False
+            self.guard.on_abandoned(self.guard.key(self.client, self.request_params))
+
+    def _retry_delay(self, error, attempt, yielded, state, checkpoint):
+        """Seconds to wait before retrying the round, None when the error has to be raised."""
+        if self.guard is None:
+            return None
+        self._attempt_pending = False
+        _can_retry = (not yielded and attempt < MAX_ATTEMPTS_PER_ROUND
+                      and (not state.tools_may_have_run or self.guard.retry_after_tool_calls))
+        _delay = self.guard.on_failure(self.guard.key(self.client, self.request_params), error, attempt,
+                                       can_retry=_can_retry)
+        if _delay is not None:
+            self.retries += 1
+            state.restore(checkpoint)
+        return _delay
+
+    def _round_succeeded(self):
+        if self.guard is not None:
+            self._attempt_pending = False
+            self.guard.on_success(self.guard.key(self.client, self.request_params))
+
+    def _next_request_params(self, state):
+        """Run the tools the agent returned control for, returns the request that hands back their results."""
+        _event = state.return_control
+        if _event is None:
+            return None
+        state.return_control = None
+        _results = [self.tool_registry.run(_input) for _input in _event.invocation_inputs]
+        _params = dict(self.request_params)
+        _params["inlineSessionState"] = {
+            **self.request_params.get("inlineSessionState", {}),
+            "invocationId": _event.invocation_id,
+            "returnControlInvocationResults": _results,
+        }
+        return _params
+
+    def __iter__(self):
+        _time_before_call = time.perf_counter()
+        if self.response_cache is not None:
+            _cached = self.response_cache.get(self.request_params)
+            if _cached is not None:
+                _answer = self._cached_result(_cached, _time_before_call).answer
+                if _answer:
+                    yield _answer
+                return
+
+        _request_params = self.request_params
+        _state = _InvocationState(self.request_params, self.trace_sink, _time_before_call)
+
+        try:
+            for _ in range(MAX_RETURN_CONTROL_ROUNDS):
+                # A failed round is retried with the same request, earlier rounds and their tool results are kept
+                _checkpoint = _state.checkpoint()
+                for _attempt in range(1, MAX_ATTEMPTS_PER_ROUND + 1):
+                    if self.guard is not None:
+                        time.sleep(self._before_attempt())
+                    try:
+                        _agent_resp = self.client.invoke_inline_agent(
+                            **_request_params
                         )
-
-                elif "postProcessingTrace" in _event["trace"]["trace"]:
-                    _post = _event["trace"]["trace"]["postProcessingTrace"]
-                    if "modelInvocationOutput" in _post:
-                        _llm_usage = _post["modelInvocationOutput"]["metadata"][
-                            "usage"
-                        ]
-                        _in_tokens = _llm_usage["inputTokens"]
-                        _total_in_tokens += _in_tokens
-
-                        _out_tokens = _llm_usage["outputTokens"]
-                        _total_out_tokens += _out_tokens
-
-                        _total_llm_calls += 1
-                        print(colored("Agent post-processing complete.", "yellow"))
-                        print(
-                            colored(
-                                f"Used LLM tokens, in: {_in_tokens}, out: {_out_tokens}",
-                                "yellow",
+                    except Exception as e:
+                        _delay = self._retry_delay(e, _attempt, False, _state, _checkpoint)
+                        if _delay is None:
+                            raise
+                        time.sleep(_delay)
+                        continue
+
+                    if not self._start(_agent_resp, _state):
+                        return
+
+                    _yielded = False
+                    try:
+                        for _event in _agent_resp["completion"]:
+                            _delta = _state.process(_event)
+                            if _delta:
+                                _yielded = True
+                                yield _delta
+                    except Exception as e:
+                        _delay = self._retry_delay(e, _attempt, _yielded, _state, _checkpoint)
+                        if _delay is None:
+                            _raise_stream_error(e, _agent_resp, self.request_params, self.trace_sink)
+                        time.sleep(_delay)
+                        continue
+                    self._round_succeeded()
+                    break
+
+                _request_params = self._next_request_params(_state)
+                if _request_params is None:
+                    break
+        finally:
+            # A non-200 response or a caller that stops reading ends the stream without an outcome
+            self._abandon_attempt()
+
+        _delta = _state.flush()
+        if _delta:
+            yield _delta
+        self.result = _state.complete()
+        self.result.retries = self.retries
+        self._cache_result()
+
+    async def __aiter__(self):
+        _loop = asyncio.get_running_loop()
+        _time_before_call = time.perf_counter()
+        if self.response_cache is not None:
+            # Disk and Redis backends block, they are called on the executor
+            _cached = await _loop.run_in_executor(self.executor, self.response_cache.get, self.request_params)
+            if _cached is not None:
+                _answer = self._cached_result(_cached, _time_before_call).answer
+                if _answer:
+                    yield _answer
+                return
+
+        _request_params = self.request_params
+        _state = _InvocationState(self.request_params, self.trace_sink, _time_before_call)
+
+        try:
+            for _ in range(MAX_RETURN_CONTROL_ROUNDS):
+                _checkpoint = _state.checkpoint()
+                for _attempt in range(1, MAX_ATTEMPTS_PER_ROUND + 1):
+                    if self.guard is not None:
+                        await asyncio.sleep(self._before_attempt())
+                    try:
+                        if inspect.iscoroutinefunction(self.client.invoke_inline_agent):
+                            _agent_resp = await self.client.invoke_inline_agent(**_request_params)
+                        else:
+                            _agent_resp = await _loop.run_in_executor(
+                                self.executor, functools.partial(self.client.invoke_inline_agent, **_request_params)
                             )
-                        )
-
-                if trace_level == "all":
-                    print(json.dumps(_event["trace"], indent=2))
-
-            if "files" in _event.keys() and request_params["enableTrace"]:
-                console = Console()
-                files_event = _event["files"]
-                console.print(Markdown("**Files**"))
-
-                files_list = files_event["files"]
-                for this_file in files_list:
-                    print(f"{this_file['name']} ({this_file['type']})")
-                    file_bytes = this_file["bytes"]
-
-                    # save bytes to file, given the name of file and the bytes
-                    file_name = os.path.join("output", this_file["name"])
-                    with open(file_name, "wb") as f:
-                        f.write(file_bytes)
-
-        if request_params["enableTrace"]:
-            duration = datetime.now() - _time_before_call
-
-            if trace_level in ["core", "outline"]:
-                print(
-                    colored(
-                        f"Agent made a total of {_total_llm_calls} LLM calls, "
-                        + f"using {_total_in_tokens+_total_out_tokens} tokens "
-                        + f"(in: {_total_in_tokens}, out: {_total_out_tokens})"
-                        + f", and took {duration.total_seconds():,.1f} total seconds",
-                        "yellow",
-                    )
-                )
-
-            if trace_level == "all":
-                print(f"Returning agent answer as: {_agent_answer}")
-
-        return _agent_answer
-
-    except Exception as e:
-        print(f"Caught exception while processing input to invokeAgent:\n")
-        input_text = request_params["inputText"]
-        print(f"  for input text:\n{input_text}\n")
-        print(
-            f"  request ID: {_agent_resp['ResponseMetadata']['RequestId']}, retries: {_agent_resp['ResponseMetadata']['RetryAttempts']}\n"
-        )
-        print(f"Agent response object: {_agent_resp}")
-        print(f"Error: {e}")
-        raise Exception("Unexpected exception: ", e)
\ No newline at end of file
+                    except Exception as e:
+                        _delay = self._retry_delay(e, _attempt, False, _state, _checkpoint)
+                        if _delay is None:
+                            raise
+                        await asyncio.sleep(_delay)
+                        continue
+
+                    if not self._start(_agent_resp, _state):
+                        return
+
+                    _event_stream = _agent_resp["completion"]
+                    _yielded = False
+                    try:
+                        if hasattr(_event_stream, "__aiter__"):
+                            async for _event in _event_stream:
+                                _delta = _state.process(_event)
+                                if _delta:
+                                    _yielded = True
+                                    yield _delta
+                        else:
+                            # A blocking stream is read one event at a time on the executor
+                            _events = iter(_event_stream)
+                            while True:
+                                _event = await _loop.run_in_executor(self.executor, next, _events, _STREAM_END)
+                                if _event is _STREAM_END:
+                                    break
+                                _delta = _state.process(_event)
+                                if _delta:
+                                    _yielded = True
+                                    yield _delta
+                    except Exception as e:
+                        _delay = self._retry_delay(e, _attempt, _yielded, _state, _checkpoint)
+                        if _delay is None:
+                            _raise_stream_error(e, _agent_resp, self.request_params, self.trace_sink)
+                        await asyncio.sleep(_delay)
+                        continue
+                    self._round_succeeded()
+                    break
+
+                # Local tools can block, they run on the executor as well
+                _request_params = await _loop.run_in_executor(self.executor, self._next_request_params, _state)
+                if _request_params is None:
+                    break
+        finally:
+            # A non-200 response or a caller that stops reading ends the stream without an outcome
+            self._abandon_attempt()
+
+        _delta = _state.flush()
+        if _delta:
+            yield _delta
+        self.result = _state.complete()
+        self.result.retries = self.retries
+        if self.response_cache is not None:
+            await _loop.run_in_executor(self.executor, self._cache_result)
+
+
+def stream_inline_agent(client, request_params, trace_level="core", trace_sink=None,
+                        executor=None, response_cache: ResponseCache = None,
+                        guard: InvocationGuard = None) -> InlineAgentStream:
+    """Stream the answer of the inline agent, use for or async for to receive the text deltas."""
+    return InlineAgentStream(client, request_params, trace_level, trace_sink, executor, response_cache, guard)
+
+
+def invoke_inline_agent(client, request_params, trace_level="core", trace_sink=None,
+                        response_cache: ResponseCache = None, guard: InvocationGuard = None) -> InvocationResult:
+    """Invoke the inline agent and return the answer with token counts and timings.
+
+    Traces are rendered by the trace_sink, a ConsoleTraceSink for the trace_level by default.
+    Steps, tool calls and collaborator calls are only known when enableTrace is set.
+    """
+    _stream = InlineAgentStream(client, request_params, trace_level, trace_sink, response_cache=response_cache,
+                                guard=guard)
+    for _ in _stream:
+        pass
+    return _stream.result
+
+
+def invoke_inline_agent_helper(client, request_params, trace_level="core", trace_sink=None,
+                               response_cache: ResponseCache = None, guard: InvocationGuard = None):
+    """Invoke the inline agent and return only its answer, or the error message if the call failed."""
+    _result = invoke_inline_agent(client, request_params, trace_level, trace_sink, response_cache, guard)
+    return _result.error if _result.error else _result.answer
+
+
+async def ainvoke_inline_agent(client, request_params, trace_level="core", trace_sink=None,
+                               executor=None, response_cache: ResponseCache = None,
+                               guard: InvocationGuard = None) -> InvocationResult:
+    """Asyncio variant of invoke_inline_agent.
+
+    Works with both the regular boto3 client and clients with coroutine methods and async
+    event streams (e.g. aiobotocore). A blocking event stream is consumed one event at a
+    time on the executor, so the event loop is never blocked while waiting for Bedrock.
+    """
+    _stream = InlineAgentStream(client, request_params, trace_level, trace_sink, executor, response_cache, guard)
+    async for _ in _stream:
+        pass
+    return _stream.result
+
+
+async def ainvoke_inline_agent_many(client, request_params_list, trace_level="core", trace_sink=None,
+                                    max_concurrency=DEFAULT_MAX_CONCURRENCY, executor=None,
+                                    response_cache: ResponseCache = None, guard: InvocationGuard = None):
+    """Run many inline agent sessions concurrently, at most max_concurrency at a time.
+
+    Results are returned in the order of request_params_list.
+    """
+    _semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _bounded(request_params):
+        async with _semaphore:
+            return await ainvoke_inline_agent(client, request_params, trace_level, trace_sink=trace_sink,
+                                              executor=executor, response_cache=response_cache, guard=guard)
+
+    return await asyncio.gather(*(_bounded(params) for params in request_params_list))
@@ -0,0 +1,127 @@
+import math
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+
+from bedrock_agent.utils.local_knowledge_base import tokenize
+
+DEFAULT_MIN_SIMILARITY = 0.3
+DEFAULT_MIN_MARGIN = 0.1
+# Lower bar for candidates, a collaborator that might be needed is better included than left out
+DEFAULT_MIN_CANDIDATE_SIMILARITY = 0.15
+# Typical time of the supervisor LLM call that a local routing decision saves, used for the estimate
+DEFAULT_SUPERVISOR_HOP_SECONDS = 2.0
+
+
+@dataclass(slots=True)
+class RoutingDecision:
+    """The route for a message, route is None when the router is not confident and the supervisor decides."""
+    route: str = None
+    confidence: float = 0.0
+    reason: str = None
+
+
+@dataclass(slots=True)
+class RoutingReport:
+    messages: int = 0
+    routed: int = 0
+    correct: int = 0
+    misrouted: list = field(default_factory=list)
+    average_latency_ms: float = 0.0
+    estimated_seconds_saved: float = 0.0
+
+    @property
+    def accuracy(self) -> float:
+        """Share of the locally routed messages that went to the expected agent."""
+        return self.correct / self.routed if self.routed else 0.0
+
+    @property
+    def coverage(self) -> float:
+        """Share of the messages that did not need the supervisor."""
+        return self.routed / self.messages if self.messages else 0.0
+
+
+def _tf_idf(tokens: list[str], idf: dict) -> dict:
+    vector = {term: count * idf[term] for term, count in Counter(tokens).items() if term in idf}
+    norm = math.sqrt(sum(value * value for value in vector.values()))
+    return {term: value / norm for term, value in vector.items()} if norm else {}
+
+
+class IntentRouter:
+    """In-process intent classifier: regex rules first, then a TF-IDF nearest centroid over examples.
+
+    A rule match routes with confidence 1. Otherwise the message goes to the route with the most similar
+    centroid, but only when the similarity is at least min_similarity and beats the runner-up by min_margin.
+    """
+
+    def __init__(self, rules: dict[str, list[str]] = None, examples: dict[str, list[str]] = None,
+                 min_similarity: float = DEFAULT_MIN_SIMILARITY, min_margin: float = DEFAULT_MIN_MARGIN):
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self._rules = [(route, re.compile(pattern, re.IGNORECASE))
+                       for route, patterns in (rules or {}).items() for pattern in patterns]
+        self._idf = {}
+        self._centroids = {}
+        if examples:
+            self._train(examples)
+
+    def _train(self, examples: dict[str, list[str]]):
+        documents = [(route, tokenize(text)) for route, texts in examples.items() for text in texts]
+        document_frequency = Counter(term for _, tokens in documents for term in set(tokens))
+        self._idf = {term: math.log((1 + len(documents)) / (1 + frequency)) + 1
+                     for term, frequency in document_frequency.items()}
+        for route in examples:
+            centroid = Counter()
+            for example_route, tokens in documents:
+                if example_route == route:
+                    centroid.update(_tf_idf(tokens, self._idf))
+            norm = math.sqrt(sum(value * value for value in centroid.values()))
+            self._centroids[route] = {term: value / norm for term, value in centroid.items()} if norm else {}
+
+    def _similarities(self, text: str) -> list[tuple[float, str]]:
+        """Cosine similarity of the message to every route centroid, most similar first."""
+        vector = _tf_idf(tokenize(text), self._idf)
+        if not vector:
+            return []
+        return sorted(((sum(weight * centroid.get(term, 0.0) for term, weight in vector.items()), route)
+                       for route, centroid in self._centroids.items()), reverse=True)
+
+    def route(self, text: str) -> RoutingDecision:
+        for route, pattern in self._rules:
+            if pattern.search(text):
+                return RoutingDecision(route, 1.0, f"rule {pattern.pattern}")
+
+        similarities = self._similarities(text)
+        if not similarities:
+            return RoutingDecision(reason="no known words")
+        best, route = similarities[0]
+        runner_up = similarities[1][0] if len(similarities) > 1 else 0.0
+        if best >= self.min_similarity and best - runner_up >= self.min_margin:
+            return RoutingDecision(route, best, "similar to the examples")
+        return RoutingDecision(confidence=best, reason="not confident")
+
+    def candidates(self, text: str, min_similarity: float = DEFAULT_MIN_CANDIDATE_SIMILARITY) -> set[str]:
+        """Every route the message might need: the matching rules and the sufficiently similar centroids."""
+        routes = {route for route, pattern in self._rules if pattern.search(text)}
+        routes.update(route for similarity, route in self._similarities(text) if similarity >= min_similarity)
+        return routes
+
+    def evaluate(self, labelled: list[tuple[str, str]],
+                 supervisor_hop_seconds: float = DEFAULT_SUPERVISOR_HOP_SECONDS) -> RoutingReport:
+        """Route every (message, expected route) pair, the seconds saved count the correctly routed messages."""
+        report = RoutingReport(messages=len(labelled))
+        start = time.perf_counter()
+        for text, expected in labelled:
+            decision = self.route(text)
+            if decision.route is None:
+                continue
+            report.routed += 1
+            if decision.route == expected:
+                report.correct += 1
+            else:
+                report.misrouted.append((text, expected, decision.route))
+        duration = time.perf_counter() - start
+        report.average_latency_ms = duration / len(labelled) * 1000 if labelled else 0.0
+        report.estimated_seconds_saved = report.correct * supervisor_hop_seconds
+        return report
@@ -0,0 +1,342 @@
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import Callable
+
+from botocore.exceptions import ConnectionError as BotocoreConnectionError, HTTPClientError
+
+from bedrock_agent.utils.invocation_metrics import DEFAULT_LATENCY_BUCKETS, Histogram
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REQUESTS_PER_SECOND = 5.0
+DEFAULT_BURST = 10
+# Throttling halves the rate down to this share of the configured rate, every success adds a tenth back
+DEFAULT_MIN_RATE_FACTOR = 0.1
+DEFAULT_MAX_WAIT_SECONDS = 60.0
+DEFAULT_MAX_ATTEMPTS = 4
+DEFAULT_BASE_DELAY_SECONDS = 0.5
+DEFAULT_MAX_DELAY_SECONDS = 20.0
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT_SECONDS = 30.0
+
+THROTTLING_ERROR_CODES = frozenset({"ThrottlingException", "ServiceQuotaExceededException",
+                                    "TooManyRequestsException"})
+RETRYABLE_ERROR_CODES = THROTTLING_ERROR_CODES | frozenset({
+    "ModelNotReadyException", "ModelTimeoutException", "ServiceUnavailableException", "InternalServerException",
+    "InternalServerError", "DependencyFailedException", "BadGatewayException", "RequestTimeout",
+    "RequestTimeoutException",
+})
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+_CIRCUIT_STATE_VALUES = {CIRCUIT_CLOSED: 0, CIRCUIT_HALF_OPEN: 1, CIRCUIT_OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of invoking the agent while the circuit of its model and region is open."""
+
+
+class RateLimitTimeout(Exception):
+    """Raised when an invocation would have to wait longer than max_wait_seconds for the rate limiter."""
+
+
+def error_code(error: Exception) -> str:
+    """The AWS error code of a ClientError or EventStreamError, also when wrapped, otherwise None."""
+    while error is not None:
+        response = getattr(error, "response", None)
+        if isinstance(response, dict) and "Error" in response:
+            return response["Error"].get("Code")
+        error = error.__cause__
+    return None
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Throttling, capacity, server and connection errors are worth a retry, validation and access errors not."""
+    if error_code(error) in RETRYABLE_ERROR_CODES:
+        return True
+    while error is not None:
+        if isinstance(error, (BotocoreConnectionError, HTTPClientError)):
+            return True
+        error = error.__cause__
+    return False
+
+
+class TokenBucket:
+    """Rate limiter that queues callers instead of rejecting them.
+
+    reserve takes a token and returns how long the caller has to wait for it, so blocking and asyncio
+    callers sleep in their own way. Throttling lowers the rate, successes bring it back to the configured one.
+    """
+
+    def __init__(self, rate: float, capacity: float, min_rate_factor: float = DEFAULT_MIN_RATE_FACTOR,
+                 clock: Callable = time.monotonic):
+        self.configured_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.min_rate = rate * min_rate_factor
+        self.clock = clock
+        self.tokens = capacity
+        self._updated_at = clock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def reserve(self, max_wait_seconds: float = None) -> float:
+        now = self.clock()
+        self._refill(now)
+        wait = max(0.0, (1 - self.tokens) / self.rate)
+        if max_wait_seconds is not None and wait > max_wait_seconds:
+            raise RateLimitTimeout(f"Waiting {wait:,.1f}s for the rate limiter exceeds {max_wait_seconds:,.1f}s")
+        # The balance can go negative, callers that come later wait for the tokens of those before them
+        self.tokens -= 1
+        return wait
+
+    def cancel(self):
+        """Give back the token of a reservation that was not used."""
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def throttled(self):
+        self._refill(self.clock())
+        self.rate = max(self.min_rate, self.rate / 2)
+
+    def succeeded(self):
+        if self.rate < self.configured_rate:
+            self._refill(self.clock())
+            self.rate = min(self.configured_rate, self.rate + self.configured_rate / 10)
+
+
+class CircuitBreaker:
+    """Stops calls after failure_threshold failures in a row, for reset_timeout_seconds.
+
+    After the timeout a single trial call is let through, its success closes the circuit again. A trial
+    that is released without an outcome, or that does not report back within the timeout, makes way
+    for the next one.
+    """
+
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout_seconds: float = DEFAULT_RESET_TIMEOUT_SECONDS, clock: Callable = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_seconds = reset_timeout_seconds
+        self.clock = clock
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_started_at = None
+
+    def allow(self) -> bool:
+        if self.state == CIRCUIT_CLOSED:
+            return True
+        now = self.clock()
+        if self.state == CIRCUIT_OPEN and now - self._opened_at < self.reset_timeout_seconds:
+            return False
+        if self._trial_started_at is not None and now - self._trial_started_at < self.reset_timeout_seconds:
+            return False
+        self.state = CIRCUIT_HALF_OPEN
+        self._trial_started_at = now
+        return True
+
+    def release(self):
+        """The trial call ended without an outcome, the next call becomes the trial."""
+        self._trial_started_at = None
+
+    def succeeded(self):
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self._trial_started_at = None
+
+    def failed(self):
+        self.failures += 1
+        if self.state == CIRCUIT_HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = CIRCUIT_OPEN
+            self._opened_at = self.clock()
+            self._trial_started_at = None
+
+
+class InvocationGuard:
+    """Rate limiting, retries and a circuit breaker for inline agent invocations, per model and region.
+
+    Pass it as guard to invoke_inline_agent and the other invoke functions. Every attempt first takes a
+    token from the bucket of its model and region. Retryable errors are retried with jittered
+    exponential backoff, also when the event stream fails halfway, as long as no text of that attempt
+    reached the caller and the attempt did not call a tool or collaborator or return control. Those calls
+    can change data, set retry_after_tool_calls only when repeating them is safe. A retried attempt
+    starts from the state before the attempt, and an invocation that returned control resumes from its
+    last round, so local tools do not run twice. Failures of capacity and server errors count for the
+    circuit breaker.
+    """
+
+    def __init__(self, requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND, burst: int = DEFAULT_BURST,
+                 max_wait_seconds: float = DEFAULT_MAX_WAIT_SECONDS, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 base_delay_seconds: float = DEFAULT_BASE_DELAY_SECONDS,
+                 max_delay_seconds: float = DEFAULT_MAX_DELAY_SECONDS,
+                 failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout_seconds: float = DEFAULT_RESET_TIMEOUT_SECONDS, retry_after_tool_calls: bool = False,
+                 clock: Callable = time.monotonic):
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.max_wait_seconds = max_wait_seconds
+        self.max_attempts = max_attempts
+        self.base_delay_seconds = base_delay_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_seconds = reset_timeout_seconds
+        self.retry_after_tool_calls = retry_after_tool_calls
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._breakers = {}
+        self._counters = defaultdict(int)
+        self.wait_time = Histogram("bedrock_agent_rate_limiter_wait_seconds",
+                                   "Time an attempt waited for the rate limiter.", DEFAULT_LATENCY_BUCKETS,
+                                   ("model", "region"))
+
+    @staticmethod
+    def key(client, request_params) -> tuple:
+        region = getattr(getattr(client, "meta", None), "region_name", None)
+        return request_params.get("foundationModel"), region or "default"
+
+    def _bucket(self, key) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.requests_per_second, self.burst, clock=self.clock)
+        return bucket
+
+    def _breaker(self, key) -> CircuitBreaker:
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = self._breakers[key] = CircuitBreaker(self.failure_threshold, self.reset_timeout_seconds,
+                                                           clock=self.clock)
+        return breaker
+
+    def before_attempt(self, key) -> float:
+        """Take a token and check the circuit, returns the seconds to wait before the attempt.
+
+        Every attempt that got through has to end with on_success, on_failure or on_abandoned.
+        """
+        with self._lock:
+            # The token comes first, so a RateLimitTimeout never leaves the trial of a half open circuit claimed
+            bucket = self._bucket(key)
+            wait = bucket.reserve(self.max_wait_seconds)
+            if not self._breaker(key).allow():
+                bucket.cancel()
+                self._counters["rejected", key] += 1
+                raise CircuitOpenError(f"Circuit for model {key[0]} in region {key[1]} is open")
+            self._counters["attempts", key] += 1
+            self.wait_time.observe(wait, *key)
+        return wait
+
+    def on_success(self, key):
+        with self._lock:
+            self._bucket(key).succeeded()
+            self._breaker(key).succeeded()
+
+    def on_abandoned(self, key):
+        """The attempt ended without an outcome, for instance because the caller stopped reading the stream."""
+        with self._lock:
+            self._breaker(key).release()
+
+    def on_failure(self, key, error: Exception, attempt: int, can_retry: bool = True) -> float:
+        """Record a failed attempt, returns the backoff before the next attempt or None to give up."""
+        retryable = is_retryable_error(error)
+        with self._lock:
+            if error_code(error) in THROTTLING_ERROR_CODES:
+                self._counters["throttled", key] += 1
+                self._bucket(key).throttled()
+            if retryable:
+                self._breaker(key).failed()
+            else:
+                # Bedrock answered, so the model is available even though this request was wrong
+                self._breaker(key).succeeded()
+            self._counters["failures", key] += 1
+            if not (retryable and can_retry and attempt < self.max_attempts):
+                return None
+            self._counters["retries", key] += 1
+        delay = min(self.max_delay_seconds, self.base_delay_seconds * 2 ** (attempt - 1))
+        delay = random.uniform(delay / 2, delay)
+        logger.info("Attempt %d for model %s failed with %s, retrying in %.1fs", attempt, key[0], error, delay)
+        return delay
+
+    def to_openmetrics(self) -> str:
+        """The counters, limiter rates and circuit states in the OpenMetrics text format."""
+        with self._lock:
+            lines = []
+            for counter, description in (("attempts", "Invocation attempts, including retries."),
+                                         ("retries", "Attempts retried after a retryable error."),
+                                         ("throttled", "Attempts throttled by Bedrock."),
+                                         ("failures", "Failed attempts."),
+                                         ("rejected", "Invocations rejected while the circuit was open.")):
+                name = f"bedrock_agent_invocation_{counter}"
+                lines.extend([f"# TYPE {name} counter", f"# HELP {name} {description}"])
+                for (kind, (model, region)), value in sorted(self._counters.items()):
+                    if kind == counter:
+                        lines.append(f'{name}_total{{model="{model}",region="{region}"}} {value}')
+            lines.extend(["# TYPE bedrock_agent_rate_limiter_rate gauge",
+                          "# HELP bedrock_agent_rate_limiter_rate Current requests per second of the rate limiter."])
+            for (model, region), bucket in sorted(self._buckets.items()):
+                lines.append(f'bedrock_agent_rate_limiter_rate{{model="{model}",region="{region}"}} {bucket.rate}')
+            lines.extend(["# TYPE bedrock_agent_circuit_state gauge",
+                          "# HELP bedrock_agent_circuit_state State of the circuit, 0 closed, 1 half open, 2 open."])
+            for (model, region), breaker in sorted(self._breakers.items()):
+                lines.append(f'bedrock_agent_circuit_state{{model="{model}",region="{region}"}} '
+                             f'{_CIRCUIT_STATE_VALUES[breaker.state]}')
+            lines.extend(self.wait_time.to_openmetrics())
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+if __name__ == "__main__":
+    # A burst of conversations against a fake Bedrock that throttles above 4 calls per second
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+
+    from botocore.exceptions import ClientError
+
+    from bedrock_agent.utils.fake_runtime_client import FakeInlineAgentRuntimeClient, sample_request_params
+    from bedrock_agent.utils.inline_agent_utils import invoke_inline_agent
+    from bedrock_agent.utils.trace_events import NullTraceSink
+
+    class ThrottlingFakeClient(FakeInlineAgentRuntimeClient):
+        def __init__(self, calls_per_second: int):
+            super().__init__(event_delay=0.001)
+            self.calls_per_second = calls_per_second
+            self._recent_calls = deque()
+            self._calls_lock = threading.Lock()
+
+        def invoke_inline_agent(self, **request_params) -> dict:
+            with self._calls_lock:
+                now = time.monotonic()
+                while self._recent_calls and now - self._recent_calls[0] > 1.0:
+                    self._recent_calls.popleft()
+                if len(self._recent_calls) >= self.calls_per_second:
+                    raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}},
+                                      "InvokeInlineAgent")
+                self._recent_calls.append(now)
+            return super().invoke_inline_agent(**request_params)
+
+    def _burst(guard, conversations: int = 20):
+        client = ThrottlingFakeClient(calls_per_second=4)
+
+        def _conversation(i):
+            try:
+                invoke_inline_agent(client, sample_request_params(f"What is the status of order {i}?"),
+                                    trace_sink=NullTraceSink(), guard=guard)
+                return True
+            except ClientError:
+                return False
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=conversations) as executor:
+            succeeded = sum(executor.map(_conversation, range(conversations)))
+        return succeeded, time.perf_counter() - start
+
+    succeeded, duration = _burst(None)
+    print(f"Without guard: {succeeded} of 20 conversations succeeded in {duration:,.2f}s")
+    guard = InvocationGuard(requests_per_second=3.5, burst=1)
+    succeeded, duration = _burst(guard)
+    print(f"With guard: {succeeded} of 20 conversations succeeded in {duration:,.2f}s")
+    print(guard.to_openmetrics())
@@ -0,0 +1,137 @@
+import bisect
+import threading
+from dataclasses import dataclass, field
+
+DEFAULT_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+DEFAULT_TOKEN_BUCKETS = (100, 500, 1000, 2500, 5000, 10000, 25000, 50000)
+
+
+@dataclass(slots=True)
+class StepTiming:
+    step: int
+    duration_seconds: float
+    input_tokens: int
+    output_tokens: int
+
+
+@dataclass(slots=True)
+class ToolCallTiming:
+    tool: str
+    duration_seconds: float
+
+
+@dataclass(slots=True)
+class CollaboratorTiming:
+    name: str
+    duration_seconds: float
+
+
+@dataclass(slots=True)
+class InvocationResult:
+    """Answer of one inline agent invocation together with what it cost."""
+    answer: str = ""
+    session_id: str = None
+    request_id: str = None
+    error: str = None
+    llm_calls: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    duration_seconds: float = 0.0
+    time_to_first_chunk_seconds: float = None
+    steps: list[StepTiming] = field(default_factory=list)
+    tool_calls: list[ToolCallTiming] = field(default_factory=list)
+    collaborator_calls: list[CollaboratorTiming] = field(default_factory=list)
+    cached: bool = False
+    # Attempts that failed with a retryable error and were retried by an InvocationGuard
+    retries: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+
+class Histogram:
+    """Cumulative histogram with optional labels, rendered in the OpenMetrics text format."""
+
+    def __init__(self, name: str, description: str, buckets: tuple, label_names: tuple = ()):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self.label_names = label_names
+        self._series = {}
+
+    def observe(self, value: float, *label_values: str):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def _labels(self, label_values: tuple, extra: str = None) -> str:
+        labels = [f'{name}="{value}"' for name, value in zip(self.label_names, label_values)]
+        if extra:
+            labels.append(extra)
+        return "{" + ",".join(labels) + "}" if labels else ""
+
+    def to_openmetrics(self) -> list[str]:
+        lines = [f"# TYPE {self.name} histogram", f"# HELP {self.name} {self.description}"]
+        for label_values, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = self._labels(label_values, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            bucket_labels = self._labels(label_values, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+            lines.append(f"{self.name}_sum{self._labels(label_values)} {total}")
+            lines.append(f"{self.name}_count{self._labels(label_values)} {count}")
+        return lines
+
+
+class InvocationMetrics:
+    """Aggregates InvocationResults into histograms that can be scraped by Prometheus."""
+
+    def __init__(self, latency_buckets: tuple = DEFAULT_LATENCY_BUCKETS, token_buckets: tuple = DEFAULT_TOKEN_BUCKETS):
+        self._lock = threading.Lock()
+        self.invocation_duration = Histogram(
+            "bedrock_agent_invocation_duration_seconds", "Duration of a complete inline agent invocation.",
+            latency_buckets)
+        self.time_to_first_chunk = Histogram(
+            "bedrock_agent_time_to_first_chunk_seconds", "Time from the request until the first answer chunk.",
+            latency_buckets)
+        self.step_duration = Histogram(
+            "bedrock_agent_orchestration_step_duration_seconds", "Duration of a single orchestration step.",
+            latency_buckets)
+        self.tool_call_duration = Histogram(
+            "bedrock_agent_tool_call_duration_seconds", "Duration of an action group tool call.",
+            latency_buckets, ("tool",))
+        self.collaborator_duration = Histogram(
+            "bedrock_agent_collaborator_duration_seconds", "Duration of a call to a collaborating agent.",
+            latency_buckets, ("collaborator",))
+        self.tokens = Histogram(
+            "bedrock_agent_invocation_tokens", "LLM tokens used by a complete invocation.",
+            token_buckets, ("direction",))
+
+    def record(self, result: InvocationResult):
+        with self._lock:
+            self.invocation_duration.observe(result.duration_seconds)
+            if result.time_to_first_chunk_seconds is not None:
+                self.time_to_first_chunk.observe(result.time_to_first_chunk_seconds)
+            for step in result.steps:
+                self.step_duration.observe(step.duration_seconds)
+            for tool_call in result.tool_calls:
+                self.tool_call_duration.observe(tool_call.duration_seconds, tool_call.tool)
+            for collaborator_call in result.collaborator_calls:
+                self.collaborator_duration.observe(collaborator_call.duration_seconds, collaborator_call.name)
+            self.tokens.observe(result.input_tokens, "in")
+            self.tokens.observe(result.output_tokens, "out")
+
+    def to_openmetrics(self) -> str:
+        with self._lock:
+            lines = []
+            for histogram in (self.invocation_duration, self.time_to_first_chunk, self.step_duration,
+                              self.tool_call_duration, self.collaborator_duration, self.tokens):
+                lines.extend(histogram.to_openmetrics())
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
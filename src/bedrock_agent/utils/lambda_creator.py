@@ -5,9 +5,13 @@ import shutil
 import time
 import uuid
 import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from io import BytesIO
 
-import boto3
+from botocore.exceptions import ClientError
+
+from bedrock_agent.utils.aws_clients import get_client
+from bedrock_agent.utils.provisioning_engine import ProvisioningStep, retry_with_backoff, run_provisioning_steps
 
 # Initialize logging
 logging.basicConfig(format='[%(asctime)s] p%(process)s {%(filename)s:%(lineno)d} %(levelname)s - %(message)s',
@@ -51,7 +55,10 @@ def create_iam_role(iam_client, lambda_role_name):
             )
 
             # Wait for role to be created
-            time.sleep(10)
+            iam_client.get_waiter('role_exists').wait(
+                RoleName=lambda_role_name,
+                WaiterConfig={'Delay': 1, 'MaxAttempts': 30}
+            )
 
             # Attach basic execution role policy
             iam_client.attach_role_policy(
@@ -77,8 +84,14 @@ def prepare_lambda_code(lambda_code_path):
     return target_path
 
 
-def create_lambda_function(lambda_client, lambda_name, lambda_code_path, role_arn):
-    """Create Lambda function or return existing function if it exists"""
+def _is_role_not_yet_assumable(error):
+    return (isinstance(error, ClientError)
+            and error.response['Error']['Code'] == 'InvalidParameterValueException'
+            and 'cannot be assumed' in error.response['Error']['Message'])
+
+
+def create_lambda_function(lambda_client, lambda_name, lambda_code_path, role_arn, extra_files=None):
+    """Create Lambda function or return existing function if it exists, extra_files are packaged next to the code"""
     try:
         # Check if the Lambda function already exists
         lambda_function = lambda_client.get_function(FunctionName=lambda_name)
@@ -91,16 +104,21 @@ def create_lambda_function(lambda_client, lambda_name, lambda_code_path, role_ar
             with zipfile.ZipFile(s, 'w') as z:
                 # Use just the filename, not the full path
                 z.write(lambda_code_path, "lambda_function.py")
+                for extra_file in extra_files or []:
+                    z.write(extra_file, os.path.basename(extra_file))
             zip_content = s.getvalue()
 
-            # Create lambda function
-            lambda_function = lambda_client.create_function(
-                FunctionName=lambda_name,
-                Runtime='python3.12',
-                Timeout=180,
-                Role=role_arn,
-                Code={'ZipFile': zip_content},
-                Handler='lambda_function.lambda_handler'
+            # Create lambda function, a new role can take a few seconds before Lambda is allowed to assume it
+            lambda_function = retry_with_backoff(
+                lambda: lambda_client.create_function(
+                    FunctionName=lambda_name,
+                    Runtime='python3.12',
+                    Timeout=180,
+                    Role=role_arn,
+                    Code={'ZipFile': zip_content},
+                    Handler='lambda_function.lambda_handler'
+                ),
+                is_retryable=_is_role_not_yet_assumable,
             )
 
             return lambda_function
@@ -154,6 +172,10 @@ def create_s3_bucket(s3_client, bucket_name, region):
             Bucket=bucket_name,
             CreateBucketConfiguration={'LocationConstraint': region}
         )
+        s3_client.get_waiter('bucket_exists').wait(
+            Bucket=bucket_name,
+            WaiterConfig={'Delay': 1, 'MaxAttempts': 30}
+        )
         logger.info(f"S3 bucket {bucket_name} created.")
 
 
@@ -170,6 +192,13 @@ def attach_s3_policy_to_role(iam_client, role_name, bucket_name):
                     "s3:DeleteObject"
                 ],
                 "Resource": f"arn:aws:s3:::{bucket_name}/*"
+            },
+            {
+                # Listing feeds the order indexes, and lets S3 answer a read of a missing key with
+                # NoSuchKey instead of AccessDenied
+                "Effect": "Allow",
+                "Action": "s3:ListBucket",
+                "Resource": f"arn:aws:s3:::{bucket_name}"
             }
         ]
     }
@@ -191,107 +220,218 @@ def create_lambda_function_and_its_resources(
         account_id,
         custom_name,
         lambda_code_path,
-        bucket_name=None
+        bucket_name=None,
+        extra_files=None
 ):
     """Main function to create all Lambda resources"""
+    start = time.perf_counter()
     try:
         # Initialize AWS clients
-        iam_client = boto3.client('iam', region_name=region)
-        lambda_client = boto3.client('lambda', region_name=region)
-        s3_client = boto3.client('s3', region_name=region)
+        iam_client = get_client('iam', region_name=region)
+        lambda_client = get_client('lambda', region_name=region)
+        s3_client = get_client('s3', region_name=region)
 
         # Generate names with suffix
         suffix = f"{region}-{account_id}"
         lambda_role_name = f'{custom_name}-lambda-role-{suffix}'
         lambda_name = f'{custom_name}-{suffix}'
 
-        # Create IAM role
-        lambda_iam_role = create_iam_role(iam_client, lambda_role_name)
+        # The role and the bucket do not depend on each other, the plan runs them concurrently
+        steps = [
+            ProvisioningStep(
+                'iam_role',
+                lambda _: create_iam_role(iam_client, lambda_role_name)
+            ),
+            ProvisioningStep(
+                'lambda_function',
+                lambda deps: create_lambda_function(
+                    lambda_client,
+                    lambda_name,
+                    lambda_code_path,
+                    deps['iam_role']['Role']['Arn'],
+                    extra_files
+                ),
+                depends_on=('iam_role',)
+            ),
+            ProvisioningStep(
+                'bedrock_permission',
+                lambda _: add_bedrock_permission(lambda_client, lambda_name, region, account_id),
+                depends_on=('lambda_function',)
+            ),
+        ]
 
         # Create S3 bucket if needed
         if bucket_name:
-            create_s3_bucket(s3_client, bucket_name, region)
-            attach_s3_policy_to_role(iam_client, lambda_role_name, bucket_name)
-
-        # Create Lambda function
-        lambda_function = create_lambda_function(
-            lambda_client,
-            lambda_name,
-            lambda_code_path,
-            lambda_iam_role['Role']['Arn']
-        )
-
-        # Add Bedrock permission
-        add_bedrock_permission(lambda_client, lambda_name, region, account_id)
+            steps.append(ProvisioningStep(
+                's3_bucket',
+                lambda _: create_s3_bucket(s3_client, bucket_name, region)
+            ))
+            steps.append(ProvisioningStep(
+                's3_policy',
+                lambda _: attach_s3_policy_to_role(iam_client, lambda_role_name, bucket_name),
+                depends_on=('iam_role', 's3_bucket')
+            ))
+
+        results, durations = run_provisioning_steps(steps)
+        logger.info(f"Provisioned {lambda_name} in {time.perf_counter() - start:,.2f}s, steps: "
+                    + ", ".join(f"{name} {duration:,.2f}s" for name, duration in durations.items()))
 
         return {
-            'lambda_role': lambda_iam_role,
-            'lambda_function': lambda_function
+            'lambda_role': results['iam_role'],
+            'lambda_function': results['lambda_function'],
+            'step_durations': durations
         }
     except Exception as e:
         logger.error(f"Error creating Lambda resources: {str(e)}")
         raise
 
+S3_DELETE_BATCH_SIZE = 1000
+
+
+def _batches(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _bucket_object_versions(s3_client, bucket_name):
+    """Yield every object version and delete marker in the bucket, unversioned objects have version null"""
+    paginator = s3_client.get_paginator('list_object_versions')
+    for page in paginator.paginate(Bucket=bucket_name):
+        for version in page.get('Versions', []) + page.get('DeleteMarkers', []):
+            yield {'Key': version['Key'], 'VersionId': version['VersionId']}
+
+
+def empty_s3_bucket(s3_client, bucket_name, max_workers=8, progress_callback=None):
+    """Delete all objects and object versions in the bucket, in batches of 1000 keys from a thread pool.
+
+    The progress_callback, when given, is called with the number of deleted objects after every batch.
+    Returns the number of deleted objects.
+    """
+    deleted = 0
+    failed = []
+    pending = set()
+
+    def _delete_batch(batch):
+        result = s3_client.delete_objects(Bucket=bucket_name, Delete={'Objects': batch, 'Quiet': True})
+        return len(batch), result.get('Errors', [])
+
+    def _collect(futures):
+        nonlocal deleted
+        for future in futures:
+            batch_size, errors = future.result()
+            failed.extend(errors)
+            deleted += batch_size - len(errors)
+            logger.info(f"Deleted {deleted} objects from bucket {bucket_name}.")
+            if progress_callback:
+                progress_callback(deleted)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for batch in _batches(_bucket_object_versions(s3_client, bucket_name), S3_DELETE_BATCH_SIZE):
+            pending.add(executor.submit(_delete_batch, batch))
+            # Keep listing ahead of the deletes, but do not hold the whole bucket in memory
+            if len(pending) >= max_workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                _collect(done)
+        _collect(pending)
+
+    if failed:
+        raise RuntimeError(f"Could not delete {len(failed)} objects from bucket {bucket_name}, "
+                           f"first error: {failed[0]}")
+    return deleted
+
+
+def remove_iam_role(iam_client, lambda_role_name):
+    """Detach and delete the policies of the role, then delete the role itself"""
+    try:
+        attached_policy_arns = [
+            policy['PolicyArn']
+            for page in iam_client.get_paginator('list_attached_role_policies').paginate(RoleName=lambda_role_name)
+            for policy in page['AttachedPolicies']
+        ]
+        inline_policy_names = [
+            policy_name
+            for page in iam_client.get_paginator('list_role_policies').paginate(RoleName=lambda_role_name)
+            for policy_name in page['PolicyNames']
+        ]
+
+        def _detach(policy_arn):
+            iam_client.detach_role_policy(RoleName=lambda_role_name, PolicyArn=policy_arn)
+            logger.info(f"Detached policy {policy_arn} from role {lambda_role_name}.")
+
+        def _delete_inline(policy_name):
+            iam_client.delete_role_policy(RoleName=lambda_role_name, PolicyName=policy_name)
+            logger.info(f"Deleted inline policy {policy_name} from role {lambda_role_name}.")
+
+        # IAM has no batch API, so the policy calls run concurrently instead
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(_detach, attached_policy_arns))
+            list(executor.map(_delete_inline, inline_policy_names))
+
+        iam_client.delete_role(RoleName=lambda_role_name)
+        logger.info(f"IAM role {lambda_role_name} deleted.")
+    except iam_client.exceptions.NoSuchEntityException:
+        logger.info(f"IAM role {lambda_role_name} does not exist. Skipping deletion.")
+
+
+def remove_lambda_function(lambda_client, lambda_name):
+    try:
+        lambda_client.delete_function(FunctionName=lambda_name)
+        logger.info(f"Lambda function {lambda_name} deleted.")
+    except lambda_client.exceptions.ResourceNotFoundException:
+        logger.info(f"Lambda function {lambda_name} does not exist.")
+
+
+def remove_s3_bucket(s3_client, bucket_name, progress_callback=None):
+    """Empty the bucket and delete it"""
+    try:
+        deleted = empty_s3_bucket(s3_client, bucket_name, progress_callback=progress_callback)
+        logger.info(f"Deleted {deleted} objects from bucket {bucket_name}.")
+
+        # Delete the bucket
+        s3_client.delete_bucket(Bucket=bucket_name)
+        logger.info(f"S3 bucket {bucket_name} deleted.")
+    except s3_client.exceptions.NoSuchBucket:
+        logger.info(f"S3 bucket {bucket_name} does not exist. Skipping deletion.")
+
+
 def remove_lambda_function_and_its_resources(
         region,
         account_id,
         custom_name,
-        bucket_name=None
+        bucket_name=None,
+        progress_callback=None
 ):
     """Main function to remove all Lambda resources"""
     try:
         # Initialize AWS clients
-        iam_client = boto3.client('iam', region_name=region)
-        lambda_client = boto3.client('lambda', region_name=region)
-        s3_client = boto3.client('s3', region_name=region)
+        iam_client = get_client('iam', region_name=region)
+        lambda_client = get_client('lambda', region_name=region)
+        s3_client = get_client('s3', region_name=region)
 
         # Generate names with suffix
         suffix = f"{region}-{account_id}"
         lambda_role_name = f'{custom_name}-lambda-role-{suffix}'
         lambda_name = f'{custom_name}-{suffix}'
 
-        # Remove Lambda function
-        try:
-            lambda_client.delete_function(FunctionName=lambda_name)
-            logger.info(f"Lambda function {lambda_name} deleted.")
-        except lambda_client.exceptions.ResourceNotFoundException:
-            logger.info(f"Lambda function {lambda_name} does not exist.")
-
-        # Detach and delete IAM role
-        # List attached policies for the role
-        # List attached policies for the role
-        try:
-            attached_policies = iam_client.list_attached_role_policies(RoleName=lambda_role_name)
-            for policy in attached_policies['AttachedPolicies']:
-                iam_client.detach_role_policy(RoleName=lambda_role_name, PolicyArn=policy['PolicyArn'])
-                logger.info(f"Detached policy {policy['PolicyArn']} from role {lambda_role_name}.")
-
-            # List inline policies for the role
-            inline_policies = iam_client.list_role_policies(RoleName=lambda_role_name)
-            for policy_name in inline_policies['PolicyNames']:
-                iam_client.delete_role_policy(RoleName=lambda_role_name, PolicyName=policy_name)
-                logger.info(f"Deleted inline policy {policy_name} from role {lambda_role_name}.")
-
-            iam_client.delete_role(RoleName=lambda_role_name)
-            logger.info(f"IAM role {lambda_role_name} deleted.")
-        except iam_client.exceptions.NoSuchEntityException:
-            logger.info(f"IAM role {lambda_role_name} does not exist. Skipping deletion.")
-
-        # Remove S3 bucket if provided
-        try:
-            if bucket_name:
-                # Delete all objects in the bucket
-                bucket_objects = s3_client.list_objects_v2(Bucket=bucket_name)
-                if 'Contents' in bucket_objects:
-                    for obj in bucket_objects['Contents']:
-                        s3_client.delete_object(Bucket=bucket_name, Key=obj['Key'])
-                        logger.info(f"Deleted object {obj['Key']} from bucket {bucket_name}.")
-
-                # Delete the bucket
-                s3_client.delete_bucket(Bucket=bucket_name)
-                logger.info(f"S3 bucket {bucket_name} deleted.")
-        except s3_client.exceptions.NoSuchBucket:
-            logger.info(f"S3 bucket {bucket_name} does not exist. Skipping deletion.")
+        # The function, role and bucket are removed independently of each other
+        steps = [
+            ProvisioningStep('lambda_function', lambda _: remove_lambda_function(lambda_client, lambda_name)),
+            ProvisioningStep('iam_role', lambda _: remove_iam_role(iam_client, lambda_role_name)),
+        ]
+        if bucket_name:
+            steps.append(ProvisioningStep(
+                's3_bucket',
+                lambda _: remove_s3_bucket(s3_client, bucket_name, progress_callback)
+            ))
+
+        _, durations = run_provisioning_steps(steps)
+        return durations
 
     except Exception as e:
         logger.error(f"Error removing Lambda resources: {str(e)}")
@@ -0,0 +1,396 @@
+import glob
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable
+
+try:
+    import numpy as np
+except ImportError:  # Embeddings are optional, BM25 works without numpy
+    np = None
+
+DEFAULT_TOP_K = 3
+DEFAULT_MAX_CHUNK_CHARS = 1000
+DEFAULT_EMBEDDING_DIMENSIONS = 256
+# Weight of the embedding similarity in the hybrid score, the rest is the normalized BM25 score
+DEFAULT_EMBEDDING_WEIGHT = 0.5
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_HEADING = re.compile(r"^(#{1,6})\s*(.*?)\s*:?\s*$")
+_STOP_WORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it my of on or the to what which with you your".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    return [token for token in _TOKEN.findall(text.lower()) if token not in _STOP_WORDS]
+
+
+@dataclass(slots=True)
+class Chunk:
+    source: str
+    title: str
+    section: str
+    text: str
+
+
+@dataclass(slots=True)
+class SearchHit:
+    chunk: Chunk
+    score: float
+
+    def as_dict(self) -> dict:
+        return {"source": self.chunk.source, "title": self.chunk.title, "section": self.chunk.section,
+                "text": self.chunk.text, "score": round(self.score, 4)}
+
+
+def _split_long_text(text: str, max_chars: int) -> list[str]:
+    if len(text) <= max_chars:
+        return [text]
+    parts, current = [], ""
+    for paragraph in text.split("\n"):
+        if current and len(current) + len(paragraph) + 1 > max_chars:
+            parts.append(current)
+            current = ""
+        current = f"{current}\n{paragraph}" if current else paragraph
+    if current:
+        parts.append(current)
+    return parts
+
+
+def chunk_markdown(text: str, source: str, max_chars: int = DEFAULT_MAX_CHUNK_CHARS) -> list[Chunk]:
+    """One chunk per section of the document, the title comes from the # Name section when there is one."""
+    sections = []
+    heading, lines = "", []
+    for line in text.splitlines():
+        match = _HEADING.match(line)
+        if match:
+            sections.append((heading, "\n".join(lines).strip()))
+            heading, lines = match.group(2), []
+        else:
+            lines.append(line.strip())
+    sections.append((heading, "\n".join(lines).strip()))
+
+    title = next((body.splitlines()[0] for heading, body in sections if heading.lower() == "name" and body),
+                 os.path.splitext(os.path.basename(source))[0])
+    chunks = []
+    for heading, body in sections:
+        if not body or heading.lower() == "name":
+            continue
+        for part in _split_long_text(body, max_chars):
+            chunks.append(Chunk(source=source, title=title, section=heading, text=part))
+    return chunks
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _chunk_line(chunk: Chunk) -> str:
+    if chunk is None:
+        return "null\n"
+    return json.dumps({"source": chunk.source, "title": chunk.title, "section": chunk.section,
+                       "text": chunk.text}) + "\n"
+
+
+def _read_index(directory: str):
+    path = os.path.join(directory, "index.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+def _map_embeddings(directory: str, index: dict):
+    return np.memmap(os.path.join(directory, f"embeddings-{index['generation']}.f32"), dtype=np.float32, mode="r",
+                     shape=(index["chunk_count"], index["dimensions"]))
+
+
+class HashingEmbedder:
+    """Deterministic bag-of-words embedding with the hashing trick, good enough to develop and test with.
+
+    Use a real embedding model for production, any callable from a list of texts to a matrix works.
+    """
+
+    def __init__(self, dimensions: int = DEFAULT_EMBEDDING_DIMENSIONS):
+        if np is None:
+            raise ImportError("HashingEmbedder needs numpy, install it with pip install numpy")
+        self.dimensions = dimensions
+
+    def __call__(self, texts: list[str]):
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in tokenize(text):
+                digest = hashlib.blake2b(token.encode("utf8"), digest_size=8).digest()
+                matrix[row, int.from_bytes(digest, "little") % self.dimensions] += 1.0
+        return matrix
+
+
+class LocalKnowledgeBase:
+    """In-process retrieval over markdown documents with a BM25 inverted index.
+
+    With an embedder, the chunk embeddings are kept in float32 blocks and search combines BM25 with
+    cosine similarity. save appends what changed to the files of a directory, see save, and a loaded
+    knowledge base maps the saved embeddings read-only, so only save ever writes them. The version
+    changes whenever chunks are added or removed, caches of search results use it to notice new content.
+    """
+
+    def __init__(self, chunks: list[Chunk] = None, embedder: Callable = None, k1: float = 1.5, b: float = 0.75):
+        if embedder is not None and np is None:
+            raise ImportError("Embeddings need numpy, install it with pip install numpy")
+        self.k1 = k1
+        self.b = b
+        self.embedder = embedder
+        self.version = 0
+        self._reset()
+        self.add(chunks or [])
+
+    def _reset(self):
+        # Removed chunks leave a None behind, so the positions in the postings, embeddings and saved files stay valid
+        self.chunks = []
+        self._postings = {}
+        self._lengths = []
+        self._sources = {}
+        self._total_length = 0
+        self._live_chunks = 0
+        # One row per chunk, new rows go in a new block instead of copying all rows for every add
+        self._embedding_blocks = []
+        # Where the chunks were saved to, and the positions removed since then
+        self._saved = None
+        self._removed_since_save = []
+
+    @classmethod
+    def from_directory(cls, directory: str, pattern: str = "product*.md", **kwargs) -> "LocalKnowledgeBase":
+        chunks = []
+        for path in sorted(glob.glob(os.path.join(directory, pattern))):
+            with open(path, "r", encoding="utf8") as file:
+                chunks.extend(chunk_markdown(file.read(), source=os.path.basename(path)))
+        return cls(chunks, **kwargs)
+
+    def __len__(self) -> int:
+        return self._live_chunks
+
+    @property
+    def _average_length(self) -> float:
+        return self._total_length / self._live_chunks if self._live_chunks else 0.0
+
+    @property
+    def _dimensions(self) -> int:
+        return self._embedding_blocks[0].shape[1] if self._embedding_blocks else 0
+
+    def add(self, chunks: list[Chunk], _vectors=None):
+        first = len(self.chunks)
+        for index, chunk in enumerate(chunks, start=first):
+            if chunk is None:
+                # A chunk that was removed before it was saved, only loading passes these
+                self._lengths.append(0)
+                continue
+            tokens = tokenize(f"{chunk.title} {chunk.section} {chunk.text}")
+            self._lengths.append(len(tokens))
+            self._total_length += len(tokens)
+            for term, frequency in Counter(tokens).items():
+                self._postings.setdefault(term, {})[index] = frequency
+            self._sources.setdefault(chunk.source, []).append(index)
+            self._live_chunks += 1
+        self.chunks.extend(chunks)
+        self.version += 1
+        if self.embedder is not None and chunks:
+            if _vectors is None:
+                _vectors = _normalize(self.embedder([f"{chunk.title}\n{chunk.text}" if chunk else ""
+                                                     for chunk in chunks]))
+            self._add_embedding_block(_vectors)
+
+    def _add_embedding_block(self, vectors):
+        blocks = self._embedding_blocks
+        blocks.append(vectors)
+        # Merge blocks of similar size, so there are few blocks and every row is copied a logarithmic number of
+        # times. The mapped block of the saved rows stays as it is.
+        while len(blocks) > 1 and not isinstance(blocks[-2], np.memmap) and len(blocks[-1]) >= len(blocks[-2]):
+            last = blocks.pop()
+            blocks[-1] = np.concatenate([blocks[-1], last])
+
+    def _embedding_rows(self, start: int = 0):
+        """Yield the embeddings of the chunks from position start, block by block."""
+        offset = 0
+        for block in self._embedding_blocks:
+            if offset + len(block) > start:
+                yield block[max(start - offset, 0):]
+            offset += len(block)
+
+    def remove_source(self, source: str) -> int:
+        """Remove the chunks of one document, returns how many were removed."""
+        indices = self._sources.pop(source, [])
+        for index in indices:
+            chunk = self.chunks[index]
+            for term in set(tokenize(f"{chunk.title} {chunk.section} {chunk.text}")):
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(index, None)
+                    if not postings:
+                        del self._postings[term]
+            self._total_length -= self._lengths[index]
+            self._lengths[index] = 0
+            self.chunks[index] = None
+        saved_chunks = self._saved["chunk_count"] if self._saved else 0
+        self._removed_since_save.extend(index for index in indices if index < saved_chunks)
+        self._live_chunks -= len(indices)
+        if indices:
+            self.version += 1
+        return len(indices)
+
+    def sources(self) -> list[str]:
+        return list(self._sources)
+
+    def save(self, directory: str):
+        """Save the chunks and embeddings to directory, load them again with load.
+
+        The chunks file and the embeddings file only grow: a save appends the chunks added since the previous
+        save, and a line with the positions of the removed ones, so saving after every batch of an ingestion
+        costs as much as the batch. index.json records how much of both files belongs to the index and is
+        replaced atomically, an interrupted save leaves the previous state. The first save to a directory,
+        and a save when the removed chunks outnumber the live ones, writes a compacted copy instead.
+        """
+        os.makedirs(directory, exist_ok=True)
+        saved = self._saved
+        if (saved is None or saved["directory"] != os.path.abspath(directory) or saved["dimensions"] != self._dimensions
+                or len(self.chunks) - self._live_chunks > self._live_chunks):
+            self._compact(directory)
+            return
+        generation = saved["generation"]
+        lines = [json.dumps({"removed": sorted(self._removed_since_save)}) + "\n"] if self._removed_since_save else []
+        lines.extend(_chunk_line(chunk) for chunk in self.chunks[saved["chunk_count"]:])
+        # Cut off what an interrupted save wrote past the recorded end before appending
+        with open(os.path.join(directory, f"chunks-{generation}.jsonl"), "r+b") as file:
+            file.truncate(saved["chunks_bytes"])
+            file.seek(saved["chunks_bytes"])
+            file.write("".join(lines).encode("utf8"))
+            chunks_bytes = file.tell()
+        if self._dimensions:
+            with open(os.path.join(directory, f"embeddings-{generation}.f32"), "r+b") as file:
+                end = saved["chunk_count"] * self._dimensions * 4
+                file.truncate(end)
+                file.seek(end)
+                for rows in self._embedding_rows(saved["chunk_count"]):
+                    np.ascontiguousarray(rows, dtype=np.float32).tofile(file)
+        self._publish(directory, generation, chunks_bytes, self._dimensions)
+
+    def _compact(self, directory: str):
+        generation = (_read_index(directory) or {}).get("generation", 0) + 1
+        dimensions = self._dimensions
+        live = [index for index, chunk in enumerate(self.chunks) if chunk is not None]
+        with open(os.path.join(directory, f"chunks-{generation}.jsonl"), "wb") as file:
+            file.write("".join(_chunk_line(self.chunks[index]) for index in live).encode("utf8"))
+            chunks_bytes = file.tell()
+        if dimensions:
+            np.concatenate(list(self._embedding_rows()))[live].tofile(
+                os.path.join(directory, f"embeddings-{generation}.f32"))
+        if len(live) < len(self.chunks):
+            # The saved positions changed, index the live chunks again in the same order
+            version, chunks, embedder = self.version, [self.chunks[index] for index in live], self.embedder
+            self._reset()
+            self.embedder = None
+            self.add(chunks)
+            self.embedder, self.version = embedder, version
+        self._publish(directory, generation, chunks_bytes, dimensions)
+        current = {f"chunks-{generation}.jsonl", f"embeddings-{generation}.f32"}
+        for path in glob.glob(os.path.join(directory, "chunks-*.jsonl")) + \
+                glob.glob(os.path.join(directory, "embeddings-*.f32")):
+            if os.path.basename(path) not in current:
+                os.remove(path)
+
+    def _publish(self, directory: str, generation: int, chunks_bytes: int, dimensions: int):
+        index = {"generation": generation, "chunks_bytes": chunks_bytes, "chunk_count": len(self.chunks),
+                 "dimensions": dimensions}
+        temp_file = os.path.join(directory, f"index.json.{os.getpid()}.tmp")
+        with open(temp_file, "w") as file:
+            json.dump(index, file)
+        os.replace(temp_file, os.path.join(directory, "index.json"))
+        self._saved = {"directory": os.path.abspath(directory), **index}
+        self._removed_since_save = []
+        if index["dimensions"] and index["chunk_count"]:
+            self._embedding_blocks = [_map_embeddings(directory, index)]
+
+    @classmethod
+    def load(cls, directory: str, embedder: Callable = None, **kwargs) -> "LocalKnowledgeBase":
+        """Load a saved knowledge base, the embeddings stay memory mapped. An empty one when nothing was saved."""
+        knowledge_base = cls(embedder=embedder, **kwargs)
+        index = _read_index(directory)
+        if index is None:
+            return knowledge_base
+        with open(os.path.join(directory, f"chunks-{index['generation']}.jsonl"), "rb") as file:
+            lines = file.read(index["chunks_bytes"]).decode("utf8").splitlines()
+        chunks, removed = [], []
+        for line in lines:
+            record = json.loads(line)
+            if record and "removed" in record:
+                removed.extend(record["removed"])
+            else:
+                chunks.append(Chunk(**record) if record else None)
+        for position in removed:
+            chunks[position] = None
+        vectors = None
+        if embedder is not None and index["dimensions"] and chunks:
+            vectors = _map_embeddings(directory, index)
+        knowledge_base.add(chunks, _vectors=vectors)
+        if embedder is None or vectors is not None:
+            # Without the saved embeddings at hand, the next save writes a compacted copy
+            knowledge_base._saved = {"directory": os.path.abspath(directory), **index}
+        return knowledge_base
+
+    def _bm25_scores(self, query_tokens: list[str]) -> dict:
+        scores = {}
+        document_count = self._live_chunks
+        average_length = self._average_length
+        for term in set(query_tokens):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for index, frequency in postings.items():
+                length_norm = self.k1 * (1 - self.b + self.b * self._lengths[index] / average_length)
+                scores[index] = scores.get(index, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + length_norm)
+        return scores
+
+    def search(self, query: str, top_k: int = DEFAULT_TOP_K,
+               embedding_weight: float = DEFAULT_EMBEDDING_WEIGHT) -> list[SearchHit]:
+        """Return the top_k chunks for the query, best first."""
+        scores = self._bm25_scores(tokenize(query))
+        if self._embedding_blocks and embedding_weight > 0:
+            query_vector = np.asarray(self.embedder([query]), dtype=np.float32)[0]
+            norm = np.linalg.norm(query_vector)
+            if norm > 0:
+                query_vector = query_vector / norm
+                similarities = np.concatenate([block @ query_vector for block in self._embedding_blocks])
+                best_bm25 = max(scores.values(), default=0.0) or 1.0
+                scores = {index: (1 - embedding_weight) * scores.get(index, 0.0) / best_bm25
+                          + embedding_weight * float(similarity)
+                          for index, similarity in enumerate(similarities)
+                          if self.chunks[index] is not None and (similarity > 0 or index in scores)}
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        return [SearchHit(self.chunks[index], score) for index, score in best]
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    samples_dir = os.path.join(os.path.dirname(__file__), "..", "..", "..", "samples")
+    query = " ".join(sys.argv[1:]) or "which device monitors heart rate"
+    for embedder in (None, HashingEmbedder() if np is not None else None):
+        knowledge_base = LocalKnowledgeBase.from_directory(samples_dir, embedder=embedder)
+        runs = 1000
+        start = time.perf_counter()
+        for _ in range(runs):
+            hits = knowledge_base.search(query)
+        duration = time.perf_counter() - start
+        print(f"{'hybrid' if embedder else 'bm25'}: {len(knowledge_base)} chunks, "
+              f"{duration / runs * 1000:,.3f} ms per search")
+        for hit in hits:
+            print(f"  {hit.score:.3f} {hit.chunk.title} / {hit.chunk.section}")
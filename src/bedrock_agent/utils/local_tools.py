@@ -0,0 +1,95 @@
+import json
+import logging
+import threading
+import weakref
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+# Executor of an action group whose functions run in this process, the agent returns control to call them
+RETURN_CONTROL = "RETURN_CONTROL"
+
+
+class LocalToolRegistry:
+    """Functions of action groups that return control, called in this process instead of by a lambda.
+
+    The handler receives the parameters of the function as keyword arguments, a string result is passed
+    to the agent as is, anything else as JSON. A bound method can be registered weakly, so the registry
+    does not keep its object alive, the tool disappears together with the object.
+    """
+
+    def __init__(self):
+        # Reentrant, garbage collection can unregister a weak tool while this thread holds the lock
+        self._lock = threading.RLock()
+        self._tools = {}
+
+    def register(self, action_group: str, function: str, handler: Callable[..., object], weak: bool = False):
+        if weak:
+            handler = weakref.WeakMethod(handler, lambda _: self.unregister(action_group))
+        else:
+            handler = _StrongReference(handler)
+        with self._lock:
+            self._tools[(action_group, function)] = handler
+
+    def unregister(self, action_group: str):
+        with self._lock:
+            for key in [key for key in self._tools if key[0] == action_group]:
+                del self._tools[key]
+
+    def run(self, invocation_input: dict) -> dict:
+        """Run the function of one invocation input of a returnControl event, returns its invocation result."""
+        function_input = invocation_input.get("functionInvocationInput")
+        if function_input is None:
+            api_input = invocation_input.get("apiInvocationInput", {})
+            return {"apiResult": {
+                "actionGroup": api_input.get("actionGroup"),
+                "apiPath": api_input.get("apiPath"),
+                "httpMethod": api_input.get("httpMethod"),
+                "httpStatusCode": 501,
+                "responseState": "FAILURE",
+                "responseBody": {"TEXT": {"body": "Only function tools run locally"}},
+            }}
+
+        action_group = function_input.get("actionGroup")
+        function = function_input.get("function")
+        result = {"actionGroup": action_group, "function": function}
+        with self._lock:
+            reference = self._tools.get((action_group, function))
+        handler = reference() if reference is not None else None
+        if handler is None:
+            result["responseState"] = "FAILURE"
+            body = f"No local tool {function} in action group {action_group}"
+        else:
+            parameters = {parameter["name"]: parameter["value"] for parameter in function_input.get("parameters", [])}
+            try:
+                body = handler(**parameters)
+            except Exception as e:
+                logger.warning(f"Local tool {function} failed: {str(e)}")
+                result["responseState"] = "FAILURE"
+                body = f"The tool failed: {str(e)}"
+        result["responseBody"] = {"TEXT": {"body": body if isinstance(body, str) else json.dumps(body)}}
+        return {"functionResult": result}
+
+
+class _StrongReference:
+    """Same interface as a weak reference, for handlers the registry keeps alive."""
+    __slots__ = ("handler",)
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    def __call__(self):
+        return self.handler
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_local_tool_registry() -> LocalToolRegistry:
+    """Return the registry shared by all agents and invocations in this process."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = LocalToolRegistry()
+        return _registry
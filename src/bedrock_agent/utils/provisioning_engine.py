@@ -0,0 +1,93 @@
+import logging
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ProvisioningStep:
+    """One step of a provisioning plan. The action receives the results of the steps it depends on."""
+    name: str
+    action: Callable[[dict], Any]
+    depends_on: tuple = field(default_factory=tuple)
+
+
+def _validate_steps(steps: list[ProvisioningStep]):
+    names = {step.name for step in steps}
+    if len(names) != len(steps):
+        raise ValueError("Provisioning step names must be unique")
+    for step in steps:
+        unknown = set(step.depends_on) - names
+        if unknown:
+            raise ValueError(f"Step {step.name} depends on unknown steps: {sorted(unknown)}")
+
+    # Detect cycles by repeatedly removing steps without open dependencies
+    open_steps = {step.name: set(step.depends_on) for step in steps}
+    while open_steps:
+        ready = [name for name, deps in open_steps.items() if not deps]
+        if not ready:
+            raise ValueError(f"Provisioning steps contain a cycle: {sorted(open_steps)}")
+        for name in ready:
+            del open_steps[name]
+        for deps in open_steps.values():
+            deps.difference_update(ready)
+
+
+def run_provisioning_steps(steps: list[ProvisioningStep], max_workers: int = 4) -> tuple[dict, dict]:
+    """Run the steps as a DAG, each step starts as soon as its dependencies are done.
+
+    Returns the results and the wall-clock duration in seconds per step name. When a step fails, steps
+    that did not start yet are skipped and the error is raised after the running steps are finished.
+    """
+    _validate_steps(steps)
+    results = {}
+    durations = {}
+    waiting = {step.name: step for step in steps}
+    running = {}
+
+    def _timed(step, dependency_results):
+        start = time.perf_counter()
+        try:
+            return step.action(dependency_results)
+        finally:
+            durations[step.name] = time.perf_counter() - start
+            logger.info(f"Provisioning step {step.name} took {durations[step.name]:,.2f}s")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while waiting or running:
+            for name, step in list(waiting.items()):
+                if all(dependency in results for dependency in step.depends_on):
+                    dependency_results = {dependency: results[dependency] for dependency in step.depends_on}
+                    running[executor.submit(_timed, step, dependency_results)] = name
+                    del waiting[name]
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                error = future.exception()
+                if error is not None:
+                    waiting.clear()
+                    wait(running)
+                    raise error
+                results[name] = future.result()
+
+    return results, durations
+
+
+def retry_with_backoff(func: Callable[[], Any], is_retryable: Callable[[Exception], bool], max_attempts: int = 8,
+                       base_delay: float = 0.5, max_delay: float = 10.0):
+    """Call func until it succeeds, sleeping with exponential backoff and jitter after retryable errors."""
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return func()
+        except Exception as e:
+            if attempt == max_attempts or not is_retryable(e):
+                raise
+            delay = min(max_delay, base_delay * 2 ** (attempt - 1))
+            delay = random.uniform(delay / 2, delay)
+            logger.info(f"Attempt {attempt} failed with {str(e)}, retrying in {delay:,.1f}s")
+            time.sleep(delay)
@@ -0,0 +1,108 @@
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "bedrock_agent", "provisioning.json")
+
+
+class ProvisioningRegistry:
+    """Process-wide cache for values that are expensive to provision, like the account id or a lambda ARN.
+
+    Values are kept in memory and in a JSON file, so a new process does not need the control plane calls
+    either, unless they are put with persist=False. Entries expire after ttl_seconds. Concurrent requests
+    for the same key provision it only once. Whoever removes a provisioned resource must invalidate its key.
+    """
+
+    def __init__(self, cache_file: str = DEFAULT_CACHE_FILE, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.cache_file = cache_file
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._entries = None
+
+    def _load(self) -> dict:
+        if self._entries is None:
+            self._entries = {}
+            if self.cache_file and os.path.exists(self.cache_file):
+                try:
+                    with open(self.cache_file, "r") as file:
+                        self._entries = json.load(file)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Ignoring unreadable provisioning cache {self.cache_file}: {str(e)}")
+        return self._entries
+
+    def _save(self):
+        if not self.cache_file:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            temp_file = f"{self.cache_file}.{os.getpid()}.tmp"
+            with open(temp_file, "w") as file:
+                json.dump({key: entry for key, entry in self._entries.items() if entry.get("persist", True)}, file)
+            os.replace(temp_file, self.cache_file)
+        except OSError as e:
+            logger.warning(f"Could not write provisioning cache {self.cache_file}: {str(e)}")
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._load().get(key)
+        if entry and entry["expires_at"] > time.time():
+            return entry["value"]
+        return None
+
+    def put(self, key: str, value, persist: bool = True):
+        entry = {"value": value, "expires_at": time.time() + self.ttl_seconds}
+        with self._lock:
+            if persist:
+                self._load()[key] = entry
+                self._save()
+            else:
+                self._load()[key] = {**entry, "persist": False}
+
+    def get_or_create(self, key: str, factory, persist: bool = True):
+        """Return the cached value for the key, or call the factory to provision it and cache the result.
+
+        With persist=False the value is only kept in memory, for values that depend on the credentials.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            # Another thread may have provisioned the value while we were waiting
+            value = self.get(key)
+            if value is None:
+                value = factory()
+                self.put(key, value, persist)
+        return value
+
+    def invalidate(self, key: str = None):
+        """Forget one key, or everything when no key is given."""
+        with self._lock:
+            entries = self._load()
+            if key is None:
+                entries.clear()
+            else:
+                entries.pop(key, None)
+            self._save()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_provisioning_registry() -> ProvisioningRegistry:
+    """Return the registry shared by all agents in this process."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ProvisioningRegistry(cache_file=os.environ.get("BEDROCK_AGENT_PROVISIONING_CACHE",
+                                                                      DEFAULT_CACHE_FILE))
+        return _registry
@@ -0,0 +1,129 @@
+import copy
+import functools
+import json
+from dataclasses import dataclass
+
+# Rough size of a token for English text and JSON, only used to estimate the saved input tokens
+CHARS_PER_TOKEN = 4
+
+# Keys the model does not need to call an operation, removed everywhere except as property names
+_DOCUMENTATION_KEYS = frozenset({"example", "examples", "externalDocs", "tags"})
+_HTTP_METHODS = frozenset({"get", "put", "post", "delete", "options", "head", "patch", "trace"})
+
+
+def estimate_tokens(size: int) -> int:
+    return round(size / CHARS_PER_TOKEN)
+
+
+def request_size(request_params) -> int:
+    """Size in bytes of the request parameters as they are sent, serialized without whitespace."""
+    return len(json.dumps(dict(request_params), separators=(",", ":")).encode("utf8"))
+
+
+@dataclass(slots=True)
+class PayloadSizeReport:
+    full_bytes: int
+    sent_bytes: int
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.full_bytes - self.sent_bytes
+
+    @property
+    def tokens_saved(self) -> int:
+        return estimate_tokens(self.bytes_saved)
+
+
+def _strip_documentation(value, in_properties: bool = False):
+    if isinstance(value, dict):
+        return {key: _strip_documentation(item, key == "properties" and not in_properties)
+                for key, item in value.items() if in_properties or key not in _DOCUMENTATION_KEYS}
+    if isinstance(value, list):
+        return [_strip_documentation(item) for item in value]
+    return value
+
+
+def _referenced_schemas(value, found: set):
+    if isinstance(value, dict):
+        reference = value.get("$ref")
+        if isinstance(reference, str) and reference.startswith("#/components/schemas/"):
+            found.add(reference.rsplit("/", 1)[-1])
+        for item in value.values():
+            _referenced_schemas(item, found)
+    elif isinstance(value, list):
+        for item in value:
+            _referenced_schemas(item, found)
+
+
+def strip_openapi_spec(spec: dict) -> dict:
+    """Copy of an OpenAPI spec with only what the model needs to pick and call an operation.
+
+    Operations keep their description, parameters and request body. Only the first success response
+    remains, without its content, examples are removed and so are the component schemas that nothing
+    references anymore. The model sees the actual response of a call, so it does not need its schema.
+    """
+    spec = copy.deepcopy(spec)
+    info = spec.get("info", {})
+    spec["info"] = {key: info[key] for key in ("title", "version") if key in info}
+    for path_item in spec.get("paths", {}).values():
+        for method, operation in path_item.items():
+            if method not in _HTTP_METHODS:
+                continue
+            if "description" in operation:
+                operation.pop("summary", None)
+            responses = operation.get("responses", {})
+            success = next((code for code in responses if str(code).startswith("2")), None)
+            if success is not None:
+                operation["responses"] = {success: {"description": responses[success].get("description", "")}}
+    spec = _strip_documentation(spec)
+
+    schemas = spec.get("components", {}).get("schemas")
+    if schemas:
+        used = set()
+        _referenced_schemas(spec["paths"], used)
+        # Follow the references between the component schemas themselves
+        pending = list(used)
+        while pending:
+            nested = set()
+            _referenced_schemas(schemas.get(pending.pop()), nested)
+            pending.extend(nested - used)
+            used |= nested
+        spec["components"]["schemas"] = {name: schema for name, schema in schemas.items() if name in used}
+    return spec
+
+
+@functools.lru_cache(maxsize=32)
+def compact_api_payload(payload: str, strip: bool = True) -> str:
+    """Minified OpenAPI payload, stripped of the documentation the model does not need when strip is set."""
+    spec = json.loads(payload)
+    if strip:
+        spec = strip_openapi_spec(spec)
+    return json.dumps(spec, separators=(",", ":"))
+
+
+def compact_request_params(request_params, strip: bool = True) -> dict:
+    """Copy of agent request parameters with compact action group schemas, the other values are shared."""
+    params = dict(request_params)
+    if "actionGroups" in params:
+        action_groups = []
+        for action_group in params["actionGroups"]:
+            payload = action_group.get("apiSchema", {}).get("payload")
+            if payload is not None:
+                action_group = {**action_group, "apiSchema": {**action_group["apiSchema"],
+                                                              "payload": compact_api_payload(payload, strip)}}
+            action_groups.append(action_group)
+        params["actionGroups"] = action_groups
+    return params
+
+
+if __name__ == "__main__":
+    import os
+
+    payload_file = os.path.join(os.path.dirname(__file__), "..", "crm", "lambdas", "payload-orders.json")
+    with open(payload_file, "r") as file:
+        pretty = json.dumps(json.load(file), indent=2)
+    for label, payload in (("minified", compact_api_payload(pretty, strip=False)),
+                           ("minified and stripped", compact_api_payload(pretty))):
+        report = PayloadSizeReport(len(pretty), len(payload))
+        print(f"{label}: {report.sent_bytes:,} of {report.full_bytes:,} bytes, "
+              f"{report.bytes_saved:,} bytes and about {report.tokens_saved:,} input tokens saved")
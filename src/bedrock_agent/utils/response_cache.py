@@ -0,0 +1,171 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 60 * 60
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_KEY_PREFIX = "bedrock-agent:response:"
+
+# Request parameters that do not change the answer of a single turn
+SESSION_DEPENDENT_PARAMS = frozenset({"sessionId", "enableTrace", "endSession", "streamingConfigurations"})
+
+
+def request_cache_key(request_params: dict) -> str:
+    """Stable hash of the model, instruction, tools, input text and other session independent parameters."""
+    stable_params = {name: value for name, value in request_params.items() if name not in SESSION_DEPENDENT_PARAMS}
+    serialized = json.dumps(stable_params, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(serialized.encode("utf8")).hexdigest()
+
+
+class ResponseCacheBackend:
+    """Stores cached answers as strings. The base class stores nothing."""
+
+    def get(self, key: str):
+        return None
+
+    def set(self, key: str, value: str, ttl_seconds: float):
+        pass
+
+    def clear(self):
+        pass
+
+
+class InMemoryBackend(ResponseCacheBackend):
+    """LRU dictionary for one process."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: str, ttl_seconds: float):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DiskBackend(ResponseCacheBackend):
+    """One JSON file per answer, shared by the processes on a machine and kept across restarts."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str):
+        try:
+            with open(self._path(key), "r", encoding="utf8") as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if entry["expires_at"] <= time.time():
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            return None
+        return entry["value"]
+
+    def set(self, key: str, value: str, ttl_seconds: float):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            temp_file = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_file, "w", encoding="utf8") as file:
+                json.dump({"expires_at": time.time() + ttl_seconds, "value": value}, file)
+            os.replace(temp_file, self._path(key))
+        except OSError as e:
+            logger.warning(f"Could not write response cache entry {key}: {str(e)}")
+
+    def clear(self):
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                os.remove(os.path.join(self.directory, name))
+
+
+class RedisBackend(ResponseCacheBackend):
+    """Stores answers in Redis, or anything that speaks its protocol, to share them between hosts.
+
+    Pass a client such as redis.Redis, the keys expire in Redis itself.
+    """
+
+    def __init__(self, client, key_prefix: str = DEFAULT_KEY_PREFIX):
+        self.client = client
+        self.key_prefix = key_prefix
+
+    def get(self, key: str):
+        value = self.client.get(f"{self.key_prefix}{key}")
+        return value.decode("utf8") if isinstance(value, bytes) else value
+
+    def set(self, key: str, value: str, ttl_seconds: float):
+        self.client.set(f"{self.key_prefix}{key}", value, ex=max(1, int(ttl_seconds)))
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=f"{self.key_prefix}*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+class ResponseCache:
+    """Opt-in cache of agent answers, keyed on the session independent request parameters.
+
+    Only use it for agents whose answer does not depend on earlier turns of the conversation, like
+    the marketing agent. Agents given a cache apply it in their invoke method. Requests that continue
+    a turn, for instance with the results of local tools, are never cached.
+    """
+
+    def __init__(self, backend: ResponseCacheBackend = None, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.backend = backend if backend is not None else InMemoryBackend()
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def cacheable(request_params: dict) -> bool:
+        return "inlineSessionState" not in request_params
+
+    def get(self, request_params: dict):
+        """Return the cached answer and the request id of the invocation that produced it, or None."""
+        if not self.cacheable(request_params):
+            return None
+        value = self.backend.get(request_cache_key(request_params))
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return json.loads(value) if value is not None else None
+
+    def put(self, request_params: dict, answer: str, request_id: str = None):
+        if self.cacheable(request_params):
+            self.backend.set(request_cache_key(request_params),
+                             json.dumps({"answer": answer, "request_id": request_id}), self.ttl_seconds)
+
+    def clear(self):
+        self.backend.clear()
@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+from bedrock_agent.utils.local_knowledge_base import np, tokenize
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL_SECONDS = 60 * 60
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+
+
+def normalize_query(query: str) -> str:
+    """Case, punctuation and stop words do not change the results of a retrieval."""
+    return " ".join(tokenize(query))
+
+
+class RetrievalCache:
+    """LRU cache with a TTL for knowledge base retrieval results, keyed on the normalized query.
+
+    With an embedder, a query that misses the exact key can still hit a cached query whose embedding
+    has a cosine similarity of at least similarity_threshold. Call invalidate after the knowledge base
+    is re-ingested, or pass the version of the source to get_or_retrieve to do that automatically.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 embedder: Callable = None, similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD):
+        if embedder is not None and np is None:
+            raise ImportError("Near duplicate matching needs numpy, install it with pip install numpy")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.embedder = embedder
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._source_version = None
+        # Embeddings of the cached keys live in a fixed matrix, one row per slot
+        self._vectors = None
+        self._slot_keys = [None] * max_entries
+        self._slots = {}
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    def _embed(self, key: str):
+        vector = np.asarray(self.embedder([key]), dtype=np.float32)[0]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    def _remove(self, key: str):
+        del self._entries[key]
+        slot = self._slots.pop(key, None)
+        if slot is not None:
+            self._vectors[slot] = 0.0
+            self._slot_keys[slot] = None
+            self._free_slots.append(slot)
+
+    def _similar_key(self, vector):
+        if vector is None or self._vectors is None or not self._slots:
+            return None
+        similarities = self._vectors @ vector
+        slot = int(np.argmax(similarities))
+        if similarities[slot] >= self.similarity_threshold:
+            return self._slot_keys[slot]
+        return None
+
+    def get(self, query: str, _vector=None):
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self.embedder is not None:
+                similar_key = self._similar_key(_vector if _vector is not None else self._embed(key))
+                entry = self._entries.get(similar_key) if similar_key is not None else None
+                if entry is not None:
+                    key = similar_key
+                    self.similar_hits += 1
+            if entry is not None and entry[0] <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, query: str, results, _vector=None, _source_version=None):
+        key = normalize_query(query)
+        vector = None
+        if self.embedder is not None:
+            vector = _vector if _vector is not None else self._embed(key)
+        with self._lock:
+            if _source_version is not None and _source_version != self._source_version:
+                # Retrieved from an older version of the knowledge base than the one cached now
+                return
+            if key in self._entries:
+                self._remove(key)
+            while len(self._entries) >= self.max_entries:
+                self._remove(next(iter(self._entries)))
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, results)
+            if vector is not None:
+                if self._vectors is None:
+                    self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+                slot = self._free_slots.pop()
+                self._vectors[slot] = vector
+                self._slot_keys[slot] = key
+                self._slots[key] = slot
+
+    def get_or_retrieve(self, query: str, retrieve: Callable[[str], object], source_version=None):
+        """Return the cached results for the query, or call retrieve and cache what it returns."""
+        with self._lock:
+            if source_version != self._source_version:
+                self._clear()
+                self._source_version = source_version
+        vector = self._embed(normalize_query(query)) if self.embedder is not None else None
+        results = self.get(query, _vector=vector)
+        if results is None:
+            results = retrieve(query)
+            self.put(query, results, _vector=vector, _source_version=source_version)
+        return results
+
+    def invalidate(self):
+        """Forget all results, call this after the knowledge base is re-ingested."""
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        for key in list(self._entries):
+            self._remove(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "similarHits": self.similar_hits, "misses": self.misses,
+                    "size": len(self._entries)}
@@ -0,0 +1,231 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from typing import Callable
+
+from bedrock_agent.utils.inline_agent_utils import invoke_inline_agent
+from bedrock_agent.utils.invocation_metrics import InvocationResult
+from bedrock_agent.utils.trace_events import NullTraceSink
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SESSIONS = 1000
+DEFAULT_IDLE_TTL_SECONDS = 30 * 60
+DEFAULT_MAX_POOL_SIZE = 32
+
+
+@dataclass(slots=True)
+class AgentSession:
+    user_id: str
+    agent: object
+    created_at: float
+    last_used_at: float
+    turns: int = 0
+    # Calls running with the agent, a session with calls in flight is never evicted or reset
+    in_flight: int = 0
+    # Ended while a call was in flight, the agent is closed once the last call finishes
+    ended: bool = False
+
+    @property
+    def session_id(self) -> str:
+        return self.agent.session_id
+
+
+@dataclass(slots=True)
+class SessionManagerStats:
+    active_sessions: int = 0
+    pooled_agents: int = 0
+    agents_created: int = 0
+    agents_reused: int = 0
+    sessions_ended: int = 0
+    sessions_evicted: int = 0
+
+
+class SessionManager:
+    """Maps user ids to an agent with its own session and closes the sessions nobody uses anymore.
+
+    Sessions idle for longer than idle_ttl_seconds are evicted, and when more than max_sessions are
+    active the least recently used one is evicted, which caps the memory of a worker. Evicting a session
+    that was used sends endSession to Bedrock through the client, when one is given. The agent object
+    then returns to a pool of at most max_pool_size warm agents, whose cached request templates are
+    reused with a new session id for the next user. Agents need invoke, reset_session and end_session_requests.
+
+    Sessions in use, through invoke or use, are pinned: eviction skips them, and ending one is
+    postponed until its last call finishes.
+    """
+
+    def __init__(self, agent_factory: Callable, client=None, max_sessions: int = DEFAULT_MAX_SESSIONS,
+                 idle_ttl_seconds: float = DEFAULT_IDLE_TTL_SECONDS, max_pool_size: int = DEFAULT_MAX_POOL_SIZE,
+                 clock: Callable = time.monotonic):
+        self.agent_factory = agent_factory
+        self.client = client
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_pool_size = max_pool_size
+        self.clock = clock
+        self._lock = threading.Lock()
+        # Least recently used first
+        self._sessions = OrderedDict()
+        self._pool = deque()
+        self._stats = SessionManagerStats()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def stats(self) -> SessionManagerStats:
+        with self._lock:
+            self._stats.active_sessions = len(self._sessions)
+            self._stats.pooled_agents = len(self._pool)
+            return replace(self._stats)
+
+    def _new_agent(self):
+        if self._pool:
+            agent = self._pool.pop()
+            agent.reset_session()
+            self._stats.agents_reused += 1
+            return agent
+        self._stats.agents_created += 1
+        return self.agent_factory()
+
+    def _expired(self, now: float) -> list[AgentSession]:
+        expired = []
+        excess = len(self._sessions) - self.max_sessions
+        for user_id, session in list(self._sessions.items()):
+            if now - session.last_used_at < self.idle_ttl_seconds and excess <= 0:
+                # Least recently used first, the sessions after this one are not idle either
+                break
+            if session.in_flight:
+                continue
+            del self._sessions[user_id]
+            expired.append(session)
+            excess -= 1
+        return expired
+
+    def session(self, user_id: str) -> AgentSession:
+        """The session of the user, a new one with a pooled or new agent when the user has none."""
+        return self._session(user_id, pin=False)
+
+    def _session(self, user_id: str, pin: bool, turn: bool = False) -> AgentSession:
+        now = self.clock()
+        expired = []
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session is not None and not session.in_flight and now - session.last_used_at >= self.idle_ttl_seconds:
+                # Too old to continue, the user starts a new conversation
+                expired.append(self._sessions.pop(user_id))
+                session = None
+            if session is None:
+                session = AgentSession(user_id, None, now, now)
+                session.agent = self._new_agent()
+                self._sessions[user_id] = session
+            session.last_used_at = now
+            if turn:
+                session.turns += 1
+            if pin:
+                session.in_flight += 1
+            self._sessions.move_to_end(user_id)
+            expired.extend(self._expired(now))
+        self._close(expired, evicted=True)
+        return session
+
+    @contextmanager
+    def use(self, user_id: str):
+        """Pin the session of the user for one turn, yields the session whose agent handles the turn."""
+        session = self._session(user_id, pin=True, turn=True)
+        try:
+            yield session
+        finally:
+            with self._lock:
+                session.in_flight -= 1
+                finished = session.ended and not session.in_flight
+            if finished:
+                self._close([session], evicted=False)
+
+    def prepare_input(self, user_id: str, input_text: str) -> dict:
+        """Request parameters for the next turn of the conversation of the user.
+
+        The session is not pinned while the caller invokes the agent, prefer invoke or use.
+        """
+        return self._session(user_id, pin=False, turn=True).agent.prepare_input(input_text)
+
+    def invoke(self, user_id: str, input_text: str, **kwargs) -> InvocationResult:
+        """Invoke the agent of the user with the client, the keyword arguments go to invoke_inline_agent."""
+        with self.use(user_id) as session:
+            return session.agent.invoke(self.client, input_text, **kwargs)
+
+    def _end(self, sessions: list[AgentSession]) -> list[AgentSession]:
+        """Mark the removed sessions as ended, returns those without calls in flight to close now."""
+        for session in sessions:
+            session.ended = True
+        return [session for session in sessions if not session.in_flight]
+
+    def end_session(self, user_id: str) -> bool:
+        """End the session of the user, for instance when the user logs out. False when there was none."""
+        with self._lock:
+            session = self._sessions.pop(user_id, None)
+            if session is None:
+                return False
+            closable = self._end([session])
+        self._close(closable, evicted=False)
+        return True
+
+    def evict_idle(self) -> int:
+        """End the sessions idle for longer than the ttl, call it regularly from a background task."""
+        with self._lock:
+            expired = self._expired(self.clock())
+        self._close(expired, evicted=True)
+        return len(expired)
+
+    def close(self):
+        """End all sessions, for instance when the worker shuts down."""
+        with self._lock:
+            sessions = self._end(list(self._sessions.values()))
+            self._sessions.clear()
+        self._close(sessions, evicted=False)
+
+    def _close(self, sessions: list[AgentSession], evicted: bool):
+        # Talking to Bedrock happens outside the lock, so other users are not blocked
+        for session in sessions:
+            if session.turns and self.client is not None:
+                self._end_remote_session(session)
+            with self._lock:
+                self._stats.sessions_ended += 1
+                if evicted:
+                    self._stats.sessions_evicted += 1
+                if len(self._pool) < self.max_pool_size:
+                    self._pool.append(session.agent)
+
+    def _end_remote_session(self, session: AgentSession):
+        for request_params in session.agent.end_session_requests():
+            try:
+                result = invoke_inline_agent(self.client, request_params, trace_sink=NullTraceSink())
+                if result.error:
+                    logger.warning(f"Could not end session {request_params['sessionId']}: {result.error}")
+            except Exception as e:
+                logger.warning(f"Could not end session {request_params['sessionId']}: {str(e)}")
+
+
+if __name__ == "__main__":
+    import random
+
+    from bedrock_agent.crm.marketing_agent import MarketingAgent
+    from bedrock_agent.utils.fake_runtime_client import FakeInlineAgentRuntimeClient
+
+    # Many users with a few turns each, the worker keeps at most 100 sessions
+    client = FakeInlineAgentRuntimeClient()
+    manager = SessionManager(MarketingAgent, client=client, max_sessions=100, max_pool_size=16)
+    random.seed(42)
+    start = time.perf_counter()
+    turns = 5000
+    for _ in range(turns):
+        manager.invoke(f"user-{random.randrange(500)}", "What is the mission of your company?",
+                       trace_sink=NullTraceSink())
+    manager.close()
+    duration = time.perf_counter() - start
+    stats = manager.stats()
+    print(f"{turns} turns in {duration:,.2f}s: {stats.agents_created} agents created, {stats.agents_reused} reused, "
+          f"{stats.sessions_ended} sessions ended ({stats.sessions_evicted} evicted), "
+          f"{client.calls - turns} endSession calls")
@@ -0,0 +1,208 @@
+import asyncio
+import base64
+import datetime
+import gzip
+import json
+import threading
+import time
+from collections import defaultdict, deque
+
+from bedrock_agent.utils.response_cache import request_cache_key
+
+RECORDING_FORMAT_VERSION = 1
+
+
+def _encode(value):
+    """Make an event JSON serializable, bytes and datetimes are tagged so they can be restored."""
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    if isinstance(value, (bytes, bytearray)):
+        return {"$b64": base64.b64encode(value).decode("ascii")}
+    if isinstance(value, datetime.datetime):
+        return {"$datetime": value.isoformat()}
+    return value
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        if len(value) == 1:
+            if "$b64" in value:
+                return base64.b64decode(value["$b64"])
+            if "$datetime" in value:
+                return datetime.datetime.fromisoformat(value["$datetime"])
+        return {key: _decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+def _open(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf8")
+    return open(path, mode, encoding="utf8")
+
+
+def load_recordings(path: str) -> list[dict]:
+    """Read the invocations written by a RecordingRuntimeClient, with bytes and datetimes restored."""
+    with _open(path, "r") as file:
+        return [_decode(json.loads(line)) for line in file if line.strip()]
+
+
+class RecordingRuntimeClient:
+    """Wraps a bedrock-agent-runtime client and appends every inline agent invocation to a file.
+
+    A recording holds the request, the response metadata, the time until the response and every
+    event of the completion stream with the seconds since the previous event. The file holds one JSON
+    document per invocation, gzipped when the path ends with .gz. An invocation is written once its
+    stream is consumed.
+    """
+
+    def __init__(self, client, path: str):
+        self.client = client
+        self.path = path
+        self._lock = threading.Lock()
+
+    def invoke_inline_agent(self, **request_params) -> dict:
+        start = time.perf_counter()
+        response = self.client.invoke_inline_agent(**request_params)
+        recording = {
+            "version": RECORDING_FORMAT_VERSION,
+            "request": request_params,
+            "callSeconds": time.perf_counter() - start,
+            "response": {key: value for key, value in response.items() if key != "completion"},
+            "events": [],
+        }
+        response = dict(response)
+        response["completion"] = self._record(response["completion"], recording)
+        return response
+
+    def _record(self, event_stream, recording):
+        last = time.perf_counter()
+        try:
+            for event in event_stream:
+                now = time.perf_counter()
+                recording["events"].append([now - last, event])
+                last = now
+                yield event
+        finally:
+            self._write(recording)
+
+    def _write(self, recording):
+        line = json.dumps(_encode(recording), separators=(",", ":"))
+        with self._lock:
+            with _open(self.path, "a") as file:
+                file.write(line + "\n")
+
+
+class ReplayRuntimeClient:
+    """Plays recorded invocations back, with the same interface as the bedrock-agent-runtime client.
+
+    Delays are the recorded ones multiplied by time_scale: 1.0 replays at the original pace, 0 as
+    fast as possible. With match_by "order" the recordings are returned in turn, with "request"
+    the recording of a request with the same session independent parameters is returned.
+    """
+
+    def __init__(self, recordings, time_scale: float = 1.0, match_by: str = "order"):
+        if isinstance(recordings, str):
+            recordings = load_recordings(recordings)
+        if not recordings:
+            raise ValueError("There are no recordings to replay")
+        if match_by not in ("order", "request"):
+            raise ValueError(f"Unknown match_by {match_by}, use order or request")
+        self.recordings = recordings
+        self.time_scale = time_scale
+        self.match_by = match_by
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._position = 0
+        self._by_request = defaultdict(deque)
+        for recording in recordings:
+            self._by_request[request_cache_key(recording["request"])].append(recording)
+
+    def _next_recording(self, request_params) -> dict:
+        with self._lock:
+            self.calls += 1
+            if self.match_by == "order":
+                recording = self.recordings[self._position % len(self.recordings)]
+                self._position += 1
+                return recording
+            candidates = self._by_request.get(request_cache_key(request_params))
+            if not candidates:
+                raise KeyError(f"No recording for the request with input text {request_params.get('inputText')!r}")
+            # Rotate, so repeated requests replay repeated recordings in the recorded order
+            candidates.rotate(-1)
+            return candidates[-1]
+
+    def _response(self, recording, request_params, completion) -> dict:
+        response = dict(recording["response"])
+        response["sessionId"] = request_params.get("sessionId", response.get("sessionId"))
+        response["completion"] = completion
+        return response
+
+    def invoke_inline_agent(self, **request_params) -> dict:
+        recording = self._next_recording(request_params)
+        if self.time_scale:
+            time.sleep(recording["callSeconds"] * self.time_scale)
+        return self._response(recording, request_params, self._event_stream(recording))
+
+    def _event_stream(self, recording):
+        for delay, event in recording["events"]:
+            if self.time_scale:
+                time.sleep(delay * self.time_scale)
+            yield event
+
+
+class AsyncReplayRuntimeClient(ReplayRuntimeClient):
+    """Like ReplayRuntimeClient, but with a coroutine method and an async event stream."""
+
+    async def invoke_inline_agent(self, **request_params) -> dict:
+        recording = self._next_recording(request_params)
+        if self.time_scale:
+            await asyncio.sleep(recording["callSeconds"] * self.time_scale)
+        return self._response(recording, request_params, self._async_event_stream(recording))
+
+    async def _async_event_stream(self, recording):
+        for delay, event in recording["events"]:
+            if self.time_scale:
+                await asyncio.sleep(delay * self.time_scale)
+            yield event
+
+
+if __name__ == "__main__":
+    # Record a few sessions of the fake client, then benchmark the parsing code against the replay
+    import os
+    import tempfile
+
+    from bedrock_agent.utils.fake_runtime_client import FakeInlineAgentRuntimeClient, sample_request_params
+    from bedrock_agent.utils.inline_agent_utils import ainvoke_inline_agent_many, invoke_inline_agent
+    from bedrock_agent.utils.trace_events import NullTraceSink
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "sessions.jsonl.gz")
+        recorder = RecordingRuntimeClient(FakeInlineAgentRuntimeClient(event_delay=0.002), path)
+        questions = [f"What is the status of order {i}?" for i in range(5)]
+        for question in questions:
+            params = sample_request_params(question)
+            params["enableTrace"] = True
+            invoke_inline_agent(recorder, params, trace_sink=NullTraceSink())
+        print(f"Recorded {len(questions)} sessions in {os.path.getsize(path):,} bytes")
+
+        recordings = load_recordings(path)
+        for time_scale in (1.0, 0.0):
+            client = ReplayRuntimeClient(recordings, time_scale=time_scale)
+            runs = 5 if time_scale else 2000
+            start = time.perf_counter()
+            for i in range(runs):
+                params = sample_request_params(questions[i % len(questions)])
+                params["enableTrace"] = True
+                invoke_inline_agent(client, params, trace_sink=NullTraceSink())
+            duration = time.perf_counter() - start
+            print(f"Replay at time scale {time_scale}: {duration / runs * 1000:,.3f} ms per session")
+
+        client = AsyncReplayRuntimeClient(recordings, time_scale=1.0)
+        start = time.perf_counter()
+        asyncio.run(ainvoke_inline_agent_many(client, [sample_request_params(q) for q in questions] * 40,
+                                              trace_sink=NullTraceSink()))
+        print(f"Async replay of 200 sessions at the original pace: {time.perf_counter() - start:,.2f}s")
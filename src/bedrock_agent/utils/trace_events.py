@@ -0,0 +1,375 @@
+import json
+import sys
+from dataclasses import dataclass, fields
+
+from rich.console import Console
+from rich.markdown import Markdown
+from termcolor import colored
+
+TRACE_TRUNCATION_LENGTH = 300
+
+
+@dataclass(slots=True)
+class ModelUsage:
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+
+@dataclass(slots=True)
+class ChunkEvent:
+    data: bytes
+
+
+@dataclass(slots=True)
+class OrchestrationEvent:
+    raw: dict
+    trace_id: str = None
+    rationale: str = None
+    tool: str = None
+    tool_parameters: list = None
+    code: str = None
+    collaborator_input_name: str = None
+    tool_output: str = None
+    collaborator_name: str = None
+    collaborator_output: str = None
+    final_response: str = None
+    usage: ModelUsage = None
+
+
+@dataclass(slots=True)
+class PreProcessingEvent:
+    raw: dict
+    usage: ModelUsage = None
+
+
+@dataclass(slots=True)
+class PostProcessingEvent:
+    raw: dict
+    usage: ModelUsage = None
+
+
+@dataclass(slots=True)
+class FailureEvent:
+    raw: dict
+    reason: str = None
+
+
+@dataclass(slots=True)
+class FilesEvent:
+    files: list
+
+
+@dataclass(slots=True)
+class ReturnControlEvent:
+    raw: dict
+    invocation_id: str = None
+    invocation_inputs: list = None
+
+
+def _parse_usage(trace: dict) -> ModelUsage:
+    model_output = trace.get("modelInvocationOutput")
+    if model_output is None:
+        return None
+    usage = model_output["metadata"]["usage"]
+    return ModelUsage(usage["inputTokens"], usage["outputTokens"])
+
+
+def _parse_orchestration(trace: dict, raw: dict) -> OrchestrationEvent:
+    event = OrchestrationEvent(raw=raw)
+
+    rationale = trace.get("rationale")
+    if rationale is not None:
+        event.rationale = rationale["text"]
+        event.trace_id = rationale.get("traceId")
+
+    invocation_input = trace.get("invocationInput")
+    if invocation_input is not None:
+        event.trace_id = invocation_input.get("traceId", event.trace_id)
+        action_group_input = invocation_input.get("actionGroupInvocationInput")
+        if action_group_input is not None:
+            event.tool = action_group_input.get("function") or action_group_input.get("apiPath") or "undefined"
+            event.tool_parameters = action_group_input.get("parameters")
+        elif "codeInterpreterInvocationInput" in invocation_input:
+            event.code = invocation_input["codeInterpreterInvocationInput"]["code"]
+        elif "agentCollaboratorInvocationInput" in invocation_input:
+            event.collaborator_input_name = invocation_input["agentCollaboratorInvocationInput"].get(
+                "agentCollaboratorName")
+
+    observation = trace.get("observation")
+    if observation is not None:
+        event.trace_id = observation.get("traceId", event.trace_id)
+        if "actionGroupInvocationOutput" in observation:
+            event.tool_output = observation["actionGroupInvocationOutput"]["text"]
+        if "agentCollaboratorInvocationOutput" in observation:
+            collaborator_output = observation["agentCollaboratorInvocationOutput"]
+            event.collaborator_name = collaborator_output["agentCollaboratorName"]
+            event.collaborator_output = collaborator_output["output"]["text"]
+        if "finalResponse" in observation:
+            event.final_response = observation["finalResponse"]["text"]
+
+    event.usage = _parse_usage(trace)
+    return event
+
+
+def _parse_pre_processing(trace: dict, raw: dict) -> PreProcessingEvent:
+    return PreProcessingEvent(raw=raw, usage=_parse_usage(trace))
+
+
+def _parse_post_processing(trace: dict, raw: dict) -> PostProcessingEvent:
+    return PostProcessingEvent(raw=raw, usage=_parse_usage(trace))
+
+
+def _parse_failure(trace: dict, raw: dict) -> FailureEvent:
+    return FailureEvent(raw=raw, reason=trace.get("failureReason"))
+
+
+_TRACE_PARSERS = {
+    "orchestrationTrace": _parse_orchestration,
+    "preProcessingTrace": _parse_pre_processing,
+    "postProcessingTrace": _parse_post_processing,
+    "failureTrace": _parse_failure,
+}
+
+
+def parse_event(event: dict, with_traces: bool = True) -> list:
+    """Turn one raw event of the completion stream into typed events.
+
+    Trace and files events are only parsed when with_traces is set, just like the agent only
+    reports them when enableTrace is set.
+    """
+    parsed = []
+    chunk = event.get("chunk")
+    if chunk is not None:
+        parsed.append(ChunkEvent(chunk["bytes"]))
+
+    # The agent waits for the results of the tools that return control, with or without traces
+    return_control = event.get("returnControl")
+    if return_control is not None:
+        parsed.append(ReturnControlEvent(raw=return_control, invocation_id=return_control.get("invocationId"),
+                                         invocation_inputs=return_control.get("invocationInputs", [])))
+
+    if not with_traces:
+        return parsed
+
+    trace_part = event.get("trace")
+    if trace_part is not None:
+        for trace_type, trace in trace_part["trace"].items():
+            parser = _TRACE_PARSERS.get(trace_type)
+            if parser is not None:
+                parsed.append(parser(trace, trace_part))
+
+    files = event.get("files")
+    if files is not None:
+        parsed.append(FilesEvent(files["files"]))
+
+    return parsed
+
+
+class TraceSink:
+    """Receives the parsed trace events of an invocation. The base class ignores everything."""
+
+    def response_received(self, agent_resp: dict, session_id: str):
+        pass
+
+    def error(self, message: str):
+        pass
+
+    def emit(self, event):
+        pass
+
+    def step_completed(self, step: int, duration_seconds: float, usage: ModelUsage):
+        pass
+
+    def invocation_completed(self, llm_calls: int, usage: ModelUsage, duration_seconds: float, answer: str):
+        pass
+
+
+class NullTraceSink(TraceSink):
+    """Drops all trace output, use it in production when nobody reads the traces."""
+
+
+class ConsoleTraceSink(TraceSink):
+    """Prints traces to the terminal, trace_level is one of outline, core or all."""
+
+    def __init__(self, trace_level: str = "core"):
+        self.trace_level = trace_level
+        self._console = None
+        self._emitters = {
+            OrchestrationEvent: self._emit_orchestration,
+            PreProcessingEvent: self._emit_pre_processing,
+            PostProcessingEvent: self._emit_post_processing,
+            FailureEvent: self._emit_failure,
+            FilesEvent: self._emit_files,
+            ReturnControlEvent: self._emit_return_control,
+        }
+
+    @property
+    def console(self) -> Console:
+        if self._console is None:
+            self._console = Console()
+        return self._console
+
+    def response_received(self, agent_resp: dict, session_id: str):
+        if self.trace_level == "all":
+            print(f"invokeAgent API response object: {agent_resp}")
+        else:
+            print(f"invokeAgent API request ID: {agent_resp['ResponseMetadata']['RequestId']}")
+            print(f"invokeAgent API session ID: {session_id}")
+
+    def error(self, message: str):
+        if self.trace_level == "all":
+            print(message)
+
+    def emit(self, event):
+        emitter = self._emitters.get(type(event))
+        if emitter is not None:
+            emitter(event)
+        if self.trace_level == "all" and not isinstance(event, FilesEvent):
+            print(json.dumps(event.raw, indent=2))
+
+    def step_completed(self, step: int, duration_seconds: float, usage: ModelUsage):
+        print(colored(f"---- Step {step} ----", "green"))
+        print(
+            colored(
+                f"Took {duration_seconds:,.1f}s, using {usage.input_tokens + usage.output_tokens} tokens "
+                f"(in: {usage.input_tokens}, out: {usage.output_tokens}) to complete prior action, observe, orchestrate.",
+                "yellow",
+            )
+        )
+
+    def invocation_completed(self, llm_calls: int, usage: ModelUsage, duration_seconds: float, answer: str):
+        if self.trace_level in ["core", "outline"]:
+            print(
+                colored(
+                    f"Agent made a total of {llm_calls} LLM calls, "
+                    f"using {usage.input_tokens + usage.output_tokens} tokens "
+                    f"(in: {usage.input_tokens}, out: {usage.output_tokens})"
+                    f", and took {duration_seconds:,.1f} total seconds",
+                    "yellow",
+                )
+            )
+
+        if self.trace_level == "all":
+            print(f"Returning agent answer as: {answer}")
+
+    def _emit_failure(self, event: FailureEvent):
+        print(colored(f"Agent error: {event.reason}", "red"))
+
+    def _emit_orchestration(self, event: OrchestrationEvent):
+        if self.trace_level not in ["core", "outline"]:
+            return
+
+        if event.rationale is not None:
+            print(colored(event.rationale, "blue"))
+
+        if event.tool is not None:
+            if self.trace_level == "outline":
+                print(colored(f"Using tool: {event.tool}", "magenta"))
+            else:
+                print(colored(f"Using tool: {event.tool} with these inputs:", "magenta"))
+                parameters = event.tool_parameters
+                if parameters is None:
+                    print(colored("  No parameters provided.\n", "magenta"))
+                elif len(parameters) == 1 and parameters[0]["name"] == "input_text":
+                    print(colored(f"{parameters[0]['value']}", "magenta"))
+                else:
+                    print(colored(f"{parameters}\n", "magenta"))
+        elif event.code is not None:
+            if self.trace_level == "outline":
+                print(colored("Using code interpreter", "magenta"))
+            else:
+                _code = f"```python\n{event.code}\n```"
+                self.console.print(Markdown(f"**Generated code**\n{_code}"))
+
+        if self.trace_level == "core":
+            if event.tool_output is not None:
+                print(colored(f"--tool outputs:\n{event.tool_output[0:TRACE_TRUNCATION_LENGTH]}...\n", "magenta"))
+
+            if event.collaborator_name is not None:
+                print(
+                    colored(
+                        f"\n----sub-agent {event.collaborator_name} output text:\n"
+                        f"{event.collaborator_output[0:TRACE_TRUNCATION_LENGTH]}...\n",
+                        "magenta",
+                    )
+                )
+
+            if event.final_response is not None:
+                print(colored(f"Final response:\n{event.final_response[0:TRACE_TRUNCATION_LENGTH]}...", "cyan"))
+
+    def _emit_pre_processing(self, event: PreProcessingEvent):
+        if event.usage is not None:
+            print(colored("Pre-processing trace, agent came up with an initial plan.", "yellow"))
+            print(colored(f"Used LLM tokens, in: {event.usage.input_tokens}, out: {event.usage.output_tokens}", "yellow"))
+
+    def _emit_post_processing(self, event: PostProcessingEvent):
+        if event.usage is not None:
+            print(colored("Agent post-processing complete.", "yellow"))
+            print(colored(f"Used LLM tokens, in: {event.usage.input_tokens}, out: {event.usage.output_tokens}", "yellow"))
+
+    def _emit_return_control(self, event: ReturnControlEvent):
+        if self.trace_level not in ["core", "outline"]:
+            return
+        for invocation_input in event.invocation_inputs:
+            function_input = invocation_input.get("functionInvocationInput", {})
+            print(colored(f"Running local tool: {function_input.get('function', 'undefined')}", "magenta"))
+
+    def _emit_files(self, event: FilesEvent):
+        self.console.print(Markdown("**Files**"))
+        for this_file in event.files:
+            print(f"{this_file['name']} ({this_file['type']})")
+
+
+_EVENT_TYPES = {
+    OrchestrationEvent: "orchestration",
+    PreProcessingEvent: "preProcessing",
+    PostProcessingEvent: "postProcessing",
+    FailureEvent: "failure",
+    FilesEvent: "files",
+    ReturnControlEvent: "returnControl",
+}
+
+
+def _event_as_dict(event) -> dict:
+    if isinstance(event, FilesEvent):
+        return {"type": "files", "files": [{"name": f["name"], "type": f["type"]} for f in event.files]}
+
+    record = {"type": _EVENT_TYPES[type(event)]}
+    for field in fields(event):
+        if field.name == "raw":
+            continue
+        value = getattr(event, field.name)
+        if value is None:
+            continue
+        if isinstance(value, ModelUsage):
+            value = {"inputTokens": value.input_tokens, "outputTokens": value.output_tokens}
+        record[field.name] = value
+    return record
+
+
+class JsonLinesTraceSink(TraceSink):
+    """Writes every trace event as one compact JSON document per line, e.g. to ship to a log pipeline."""
+
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.stdout
+
+    def _write(self, record: dict):
+        self.stream.write(json.dumps(record, default=str) + "\n")
+
+    def response_received(self, agent_resp: dict, session_id: str):
+        self._write({"type": "response", "requestId": agent_resp["ResponseMetadata"]["RequestId"],
+                     "sessionId": session_id})
+
+    def error(self, message: str):
+        self._write({"type": "error", "message": message})
+
+    def emit(self, event):
+        self._write(_event_as_dict(event))
+
+    def step_completed(self, step: int, duration_seconds: float, usage: ModelUsage):
+        self._write({"type": "step", "step": step, "durationSeconds": duration_seconds,
+                     "inputTokens": usage.input_tokens, "outputTokens": usage.output_tokens})
+
+    def invocation_completed(self, llm_calls: int, usage: ModelUsage, duration_seconds: float, answer: str):
+        self._write({"type": "summary", "llmCalls": llm_calls, "inputTokens": usage.input_tokens,
+                     "outputTokens": usage.output_tokens, "durationSeconds": duration_seconds})
@@ -0,0 +1,25 @@
+from bedrock_agent.utils.aws_clients import ClientRegistry
+
+
+def test_clients_are_shared_per_service_region_and_options():
+    registry = ClientRegistry()
+
+    client = registry.client("s3", region_name="eu-west-1")
+
+    assert registry.client("s3", region_name="eu-west-1") is client
+    assert registry.client("s3", region_name="eu-central-1") is not client
+    assert registry.client("s3", region_name="eu-west-1", read_timeout=5) is not client
+
+
+def test_only_the_invocation_guard_retries_agent_invocations():
+    registry = ClientRegistry()
+
+    runtime_client = registry.client("bedrock-agent-runtime", region_name="eu-west-1")
+    s3_client = registry.client("s3", region_name="eu-west-1")
+    custom_client = registry.client("bedrock-agent-runtime", region_name="eu-west-1",
+                                    retries={"mode": "standard", "total_max_attempts": 3})
+
+    assert runtime_client.meta.config.retries == {"mode": "standard", "total_max_attempts": 1}
+    assert s3_client.meta.config.retries == {"mode": "adaptive", "total_max_attempts": 6}
+    assert custom_client.meta.config.retries == {"mode": "standard", "total_max_attempts": 3}
+    assert runtime_client.meta.config.max_pool_connections == s3_client.meta.config.max_pool_connections
@@ -0,0 +1,66 @@
+import json
+from pathlib import Path
+
+from bedrock_agent.crm.frontdesk_agent import FrontDeskAgent, default_front_desk_router
+from bedrock_agent.crm.marketing_agent import MarketingAgent
+from bedrock_agent.utils.local_tools import RETURN_CONTROL
+
+
+def _marketing_agent():
+    agent = MarketingAgent(session_id="marketing")
+    agent.action_group = {"name": "company", "executor": RETURN_CONTROL, "description": "Company facts",
+                          "functions": [{"name": "get_mission", "parameters": {}}]}
+    return agent
+
+
+def test_changing_the_request_params_leaves_the_cached_template_alone():
+    agent = _marketing_agent()
+    params = agent.agent_request_params()
+    params["actionGroups"][0]["functionSchema"]["functions"].clear()
+    params["actionGroups"].append({"actionGroupName": "other"})
+
+    assert agent.agent_request_params()["actionGroups"] == [{
+        "actionGroupName": "company",
+        "actionGroupExecutor": {"customControl": RETURN_CONTROL},
+        "functionSchema": {"functions": [{"name": "get_mission", "parameters": {}}]},
+        "description": "Company facts",
+    }]
+
+    front_desk = FrontDeskAgent(session_id="front-desk", marketing_agent=agent)
+    params = front_desk.agent_request_params()
+    params["collaborators"][0]["actionGroups"].clear()
+    params["collaboratorConfigurations"].clear()
+
+    params = front_desk.agent_request_params()
+    assert len(params["collaborators"][0]["actionGroups"]) == 1
+    assert [configuration["collaboratorName"] for configuration in params["collaboratorConfigurations"]] == [
+        "marketing_agent"]
+
+
+def test_missing_collaborators_are_left_out_of_the_request():
+    front_desk = FrontDeskAgent(session_id="front-desk", marketing_agent=_marketing_agent())
+
+    params = front_desk.agent_request_params()
+    assert [collaborator["agentName"] for collaborator in params["collaborators"]] == ["marketing_agent"]
+    assert front_desk.agent_request_params(frozenset({"order_support_agent"}))["collaborators"] == []
+    assert front_desk.payload_size_report().sent_bytes == front_desk.payload_size_report().full_bytes
+
+
+def test_a_changed_collaborator_rebuilds_the_template():
+    agent = _marketing_agent()
+    front_desk = FrontDeskAgent(session_id="front-desk", marketing_agent=agent)
+    template = front_desk.request_template()
+
+    assert front_desk.request_template() is template
+    agent.instructions = "Only talk about the weather."
+    assert front_desk.request_template()["collaborators"][0]["instruction"] == "Only talk about the weather."
+
+
+def test_the_default_router_routes_most_of_the_test_set_without_misroutes():
+    test_set_file = Path(__file__).parent.parent / "samples" / "routing_test_set.json"
+    labelled = [(item["message"], item["route"]) for item in json.loads(test_set_file.read_text())]
+
+    report = default_front_desk_router().evaluate(labelled)
+
+    assert report.misrouted == []
+    assert report.coverage > 0.8
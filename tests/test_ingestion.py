@@ -0,0 +1,164 @@
+import json
+import os
+
+import pytest
+
+from bedrock_agent.utils.ingestion import DEFAULT_BATCH_SIZE, IngestionManifest, IngestionTarget, LocalIndexTarget, \
+    S3DataSourceTarget, ingest_documents
+from bedrock_agent.utils.local_knowledge_base import LocalKnowledgeBase, chunk_markdown
+
+
+def _write(directory, name, body):
+    path = directory / name
+    path.write_text(f"# Name\n{name}\n# Details\n{body}\n", encoding="utf8")
+    return path
+
+
+@pytest.fixture
+def documents(tmp_path):
+    directory = tmp_path / "documents"
+    directory.mkdir()
+    for i in range(1, 4):
+        _write(directory, f"product{i}.md", f"Details of product {i}.")
+    return directory
+
+
+def _ingest(documents, index_dir, chunker=chunk_markdown, batch_size=DEFAULT_BATCH_SIZE):
+    knowledge_base = LocalKnowledgeBase.load(str(index_dir))
+    manifest = IngestionManifest(str(index_dir / "manifest.jsonl"))
+    target = LocalIndexTarget(knowledge_base, str(index_dir), chunker=chunker)
+    return ingest_documents(str(documents), target, manifest, batch_size=batch_size), knowledge_base
+
+
+def test_a_rerun_only_handles_what_changed(documents, tmp_path):
+    index_dir = tmp_path / "index"
+
+    first, _ = _ingest(documents, index_dir)
+    rerun, _ = _ingest(documents, index_dir)
+    _write(documents, "product1.md", "New details of product 1.")
+    (documents / "product3.md").unlink()
+    _write(documents, "product4.md", "Details of product 4.")
+    changed, knowledge_base = _ingest(documents, index_dir)
+
+    assert (sorted(first.added), first.chunks_written) == (["product1.md", "product2.md", "product3.md"], 3)
+    assert (rerun.added, rerun.updated, rerun.removed, rerun.unchanged) == ([], [], [], 3)
+    assert (changed.added, changed.updated, changed.removed, changed.unchanged) == \
+           (["product4.md"], ["product1.md"], ["product3.md"], 1)
+    assert sorted(knowledge_base.sources()) == ["product1.md", "product2.md", "product4.md"]
+    assert LocalKnowledgeBase.load(str(index_dir)).search("new details")[0].chunk.source == "product1.md"
+
+
+def test_a_touched_file_with_the_same_content_is_unchanged(documents, tmp_path):
+    index_dir = tmp_path / "index"
+    _ingest(documents, index_dir)
+    path = documents / "product1.md"
+    os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 10 ** 9))
+
+    report, _ = _ingest(documents, index_dir)
+
+    assert (report.updated, report.unchanged) == ([], 3)
+    manifest = IngestionManifest(str(index_dir / "manifest.jsonl"))
+    assert manifest.entries["product1.md"]["mtime_ns"] == path.stat().st_mtime_ns
+
+
+def test_an_interrupted_run_keeps_the_index_in_step_with_the_manifest(documents, tmp_path):
+    index_dir = tmp_path / "index"
+
+    def _failing_chunker(text, source):
+        if source == "product3.md":
+            raise OSError("Disk full")
+        return chunk_markdown(text, source)
+
+    with pytest.raises(OSError):
+        _ingest(documents, index_dir, chunker=_failing_chunker, batch_size=1)
+
+    recorded = set(IngestionManifest(str(index_dir / "manifest.jsonl")).entries)
+    assert recorded and "product3.md" not in recorded
+    assert set(LocalKnowledgeBase.load(str(index_dir)).sources()) == recorded
+
+    report, knowledge_base = _ingest(documents, index_dir)
+    assert set(report.added) == {"product1.md", "product2.md", "product3.md"} - recorded
+    assert len(knowledge_base.sources()) == 3
+
+
+def test_a_crash_between_upsert_and_checkpoint_leaves_the_saved_index_loadable(documents, tmp_path):
+    pytest.importorskip("numpy")
+    from bedrock_agent.utils.local_knowledge_base import HashingEmbedder
+
+    class CrashingTarget(LocalIndexTarget):
+        def checkpoint(self):
+            raise KeyboardInterrupt
+
+    index_dir, embedder = tmp_path / "index", HashingEmbedder()
+
+    def _run(target_class=LocalIndexTarget):
+        knowledge_base = LocalKnowledgeBase.load(str(index_dir), embedder=embedder)
+        target = target_class(knowledge_base, str(index_dir))
+        return ingest_documents(str(documents), target, IngestionManifest(str(index_dir / "manifest.jsonl")))
+
+    _run()
+    _write(documents, "product1.md", "New details of product 1, with many more words than before.")
+    with pytest.raises(KeyboardInterrupt):
+        _run(CrashingTarget)
+
+    assert len(LocalKnowledgeBase.load(str(index_dir), embedder=embedder)) == 3
+    assert _run().updated == ["product1.md"]
+    loaded = LocalKnowledgeBase.load(str(index_dir), embedder=embedder)
+    assert (len(loaded), loaded.search("many more words")[0].chunk.source) == (3, "product1.md")
+
+
+def test_an_unreadable_manifest_starts_over(tmp_path):
+    path = tmp_path / "manifest.jsonl"
+    path.write_text("{not json\n")
+
+    assert IngestionManifest(str(path)).entries == {}
+
+
+def test_the_manifest_appends_changes_and_compacts(documents, tmp_path):
+    path = tmp_path / "manifest.jsonl"
+    ingest_documents(str(documents), IngestionTarget(), IngestionManifest(str(path)))
+    # A line cut off by a crash is dropped and overwritten by the next save
+    with open(path, "a") as file:
+        file.write('{"source": "product2.md", "sha')
+    manifest = IngestionManifest(str(path))
+    _write(documents, "product1.md", "New details of product 1.")
+    ingest_documents(str(documents), IngestionTarget(), manifest)
+
+    sources = [json.loads(line)["source"] for line in path.read_text().splitlines()]
+    assert (sorted(sources[:3]), sources[3:]) == (["product1.md", "product2.md", "product3.md"], ["product1.md"])
+    assert IngestionManifest(str(path)).entries == manifest.entries
+
+    (documents / "product2.md").unlink()
+    (documents / "product3.md").unlink()
+    ingest_documents(str(documents), IngestionTarget(), manifest)
+
+    assert [json.loads(line)["source"] for line in path.read_text().splitlines()] == ["product1.md"]
+    assert IngestionManifest(str(path)).entries == manifest.entries
+
+
+class RecordingClient:
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args, kwargs)) or \
+            {"ingestionJob": {"ingestionJobId": "job-1"}}
+
+
+def test_s3_target_uploads_changes_and_starts_an_ingestion_job(documents, tmp_path):
+    s3_client, bedrock_agent_client = RecordingClient(), RecordingClient()
+    manifest = IngestionManifest(str(tmp_path / "manifest.jsonl"))
+
+    def _target():
+        return S3DataSourceTarget(s3_client, "bucket", "docs/", bedrock_agent_client, "kb-1", "ds-1")
+
+    ingest_documents(str(documents), _target(), manifest)
+    (documents / "product2.md").unlink()
+    ingest_documents(str(documents), _target(), manifest)
+    ingest_documents(str(documents), _target(), manifest)
+
+    assert sorted(args[2] for name, args, _ in s3_client.calls if name == "upload_file") == \
+           ["docs/product1.md", "docs/product2.md", "docs/product3.md"]
+    deletes = [kwargs["Delete"]["Objects"] for name, _, kwargs in s3_client.calls if name == "delete_objects"]
+    assert deletes == [[{"Key": "docs/product2.md"}]]
+    assert [name for name, _, _ in bedrock_agent_client.calls] == ["start_ingestion_job"] * 2
@@ -0,0 +1,159 @@
+import asyncio
+
+import pytest
+
+from bedrock_agent.utils.fake_runtime_client import AsyncFakeInlineAgentRuntimeClient, DEFAULT_ANSWER, \
+    FakeInlineAgentRuntimeClient, canned_events, sample_request_params
+from bedrock_agent.utils.inline_agent_utils import InlineAgentStreamError, ainvoke_inline_agent, \
+    ainvoke_inline_agent_many, invoke_inline_agent, stream_inline_agent
+from bedrock_agent.utils.local_tools import get_local_tool_registry
+from bedrock_agent.utils.trace_events import NullTraceSink
+
+
+def _traced_params(input_text="What is your mission?"):
+    return {**sample_request_params(input_text), "enableTrace": True}
+
+
+class ReturnControlClient(FakeInlineAgentRuntimeClient):
+    """Returns control for one local tool call first, then answers with the canned events."""
+
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+
+    def invoke_inline_agent(self, **request_params) -> dict:
+        self.requests.append(request_params)
+        if len(self.requests) == 1:
+            self.events = [{"returnControl": {"invocationId": "invocation-1", "invocationInputs": [
+                {"functionInvocationInput": {"actionGroup": "test-tools", "function": "shout",
+                                             "parameters": [{"name": "text", "value": "hello"}]}}
+            ]}}]
+        else:
+            self.events = canned_events(with_traces=False)
+        return super().invoke_inline_agent(**request_params)
+
+
+def test_invoke_collects_answer_tokens_and_timings():
+    result = invoke_inline_agent(FakeInlineAgentRuntimeClient(), _traced_params(), trace_sink=NullTraceSink())
+
+    assert result.answer == DEFAULT_ANSWER
+    assert result.error is None
+    assert (result.input_tokens, result.output_tokens, result.llm_calls) == (512 + 1024 + 256, 48 + 96 + 32, 3)
+    assert len(result.steps) == 1
+    assert [call.tool for call in result.tool_calls] == ["/orders/{id}"]
+    assert result.time_to_first_chunk_seconds is not None
+
+
+def test_stream_yields_the_answer_in_pieces():
+    stream = stream_inline_agent(FakeInlineAgentRuntimeClient(), sample_request_params("Hi"),
+                                 trace_sink=NullTraceSink())
+
+    pieces = list(stream)
+
+    assert len(pieces) > 1
+    assert "".join(pieces) == DEFAULT_ANSWER == stream.result.answer
+
+
+def test_multi_byte_characters_split_over_chunks_are_decoded():
+    answer = "Café über naïve 🚀 coöperatie"
+    client = FakeInlineAgentRuntimeClient(events=canned_events(answer, chunk_size=1, with_traces=False))
+
+    result = invoke_inline_agent(client, sample_request_params("Hi"), trace_sink=NullTraceSink())
+
+    assert result.answer == answer
+
+
+def test_failed_response_returns_the_error():
+    class FailingClient(FakeInlineAgentRuntimeClient):
+        def invoke_inline_agent(self, **request_params) -> dict:
+            response = super().invoke_inline_agent(**request_params)
+            response["ResponseMetadata"]["HTTPStatusCode"] = 500
+            return response
+
+    result = invoke_inline_agent(FailingClient(), sample_request_params("Hi"), trace_sink=NullTraceSink())
+
+    assert result.answer == ""
+    assert result.error.startswith("API Response was not 200")
+
+
+def test_a_failed_event_stream_is_reported_to_the_trace_sink(capsys):
+    class ErrorRecordingSink(NullTraceSink):
+        def __init__(self):
+            self.errors = []
+
+        def error(self, message: str):
+            self.errors.append(message)
+
+    def _broken_stream():
+        raise ConnectionError("stream closed")
+        yield
+
+    class BrokenStreamClient(FakeInlineAgentRuntimeClient):
+        def invoke_inline_agent(self, **request_params) -> dict:
+            response = super().invoke_inline_agent(**request_params)
+            response["completion"] = _broken_stream()
+            return response
+
+    sink = ErrorRecordingSink()
+
+    with pytest.raises(InlineAgentStreamError):
+        invoke_inline_agent(BrokenStreamClient(), _traced_params(), trace_sink=sink)
+
+    assert len(sink.errors) == 1 and sink.errors[0].endswith("stream closed")
+    assert capsys.readouterr().out == ""
+
+
+def test_return_control_runs_the_local_tool_and_hands_back_its_result():
+    registry = get_local_tool_registry()
+    registry.register("test-tools", "shout", lambda text: text.upper())
+    client = ReturnControlClient()
+    try:
+        result = invoke_inline_agent(client, sample_request_params("Shout hello"), trace_sink=NullTraceSink())
+    finally:
+        registry.unregister("test-tools")
+
+    assert result.answer == DEFAULT_ANSWER
+    assert len(client.requests) == 2
+    session_state = client.requests[1]["inlineSessionState"]
+    assert session_state["invocationId"] == "invocation-1"
+    function_result = session_state["returnControlInvocationResults"][0]["functionResult"]
+    assert function_result["responseBody"]["TEXT"]["body"] == "HELLO"
+    assert "responseState" not in function_result
+
+
+def test_async_invoke_with_a_blocking_client():
+    result = asyncio.run(ainvoke_inline_agent(FakeInlineAgentRuntimeClient(), _traced_params(),
+                                              trace_sink=NullTraceSink()))
+
+    assert result.answer == DEFAULT_ANSWER
+    assert result.llm_calls == 3
+
+
+def test_async_invoke_with_an_async_client():
+    result = asyncio.run(ainvoke_inline_agent(AsyncFakeInlineAgentRuntimeClient(), _traced_params(),
+                                              trace_sink=NullTraceSink()))
+
+    assert result.answer == DEFAULT_ANSWER
+    assert result.llm_calls == 3
+
+
+def test_async_stream_yields_the_answer_in_pieces():
+    async def _consume():
+        stream = stream_inline_agent(AsyncFakeInlineAgentRuntimeClient(), sample_request_params("Hi"),
+                                     trace_sink=NullTraceSink())
+        return [piece async for piece in stream], stream.result
+
+    pieces, result = asyncio.run(_consume())
+
+    assert len(pieces) > 1
+    assert "".join(pieces) == DEFAULT_ANSWER == result.answer
+
+
+def test_invoke_many_keeps_the_order_of_the_requests():
+    params_list = [sample_request_params(f"Question {i}") for i in range(20)]
+
+    results = asyncio.run(ainvoke_inline_agent_many(AsyncFakeInlineAgentRuntimeClient(event_delay=0.001),
+                                                    params_list, trace_sink=NullTraceSink(), max_concurrency=5))
+
+    assert [result.session_id for result in results] == [params["sessionId"] for params in params_list]
+    assert all(result.answer == DEFAULT_ANSWER for result in results)
@@ -0,0 +1,277 @@
+import pytest
+from botocore.exceptions import ClientError, EndpointConnectionError, EventStreamError
+
+from bedrock_agent.utils.fake_runtime_client import DEFAULT_ANSWER, FakeInlineAgentRuntimeClient, canned_events, \
+    sample_request_params
+from bedrock_agent.utils.inline_agent_utils import InlineAgentStreamError, invoke_inline_agent, stream_inline_agent
+from bedrock_agent.utils.invocation_guard import CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, CIRCUIT_OPEN, CircuitBreaker, \
+    CircuitOpenError, InvocationGuard, RateLimitTimeout, TokenBucket, error_code, is_retryable_error
+from bedrock_agent.utils.trace_events import NullTraceSink
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _error(code, error_class=ClientError):
+    return error_class({"Error": {"Code": code, "Message": code}}, "InvokeInlineAgent")
+
+
+def _guard(clock=None, **kwargs):
+    kwargs.setdefault("base_delay_seconds", 0.001)
+    kwargs.setdefault("max_delay_seconds", 0.002)
+    return InvocationGuard(clock=clock or Clock(), **kwargs)
+
+
+def _traced_params():
+    return {**sample_request_params("What is the status of order 123?"), "enableTrace": True}
+
+
+class FlakyClient(FakeInlineAgentRuntimeClient):
+    """Fails the first calls, then breaks the event stream of the next ones before event fail_at_event."""
+
+    def __init__(self, failed_calls=0, failed_streams=0, fail_at_event=1, code="ThrottlingException"):
+        super().__init__()
+        self.failed_calls = failed_calls
+        self.failed_streams = failed_streams
+        self.fail_at_event = fail_at_event
+        self.code = code
+
+    def invoke_inline_agent(self, **request_params) -> dict:
+        if self.failed_calls:
+            self.failed_calls -= 1
+            super().invoke_inline_agent(**request_params)
+            raise _error(self.code)
+        response = super().invoke_inline_agent(**request_params)
+        if self.failed_streams:
+            self.failed_streams -= 1
+            response["completion"] = self._broken_stream(response["completion"])
+        return response
+
+    def _broken_stream(self, events):
+        for index, event in enumerate(events):
+            if index == self.fail_at_event:
+                raise _error("ModelNotReadyException", EventStreamError)
+            yield event
+
+
+def test_error_codes_decide_what_is_retried():
+    wrapped = InlineAgentStreamError("stream failed")
+    wrapped.__cause__ = _error("ThrottlingException", EventStreamError)
+
+    assert error_code(wrapped) == "ThrottlingException"
+    assert is_retryable_error(wrapped)
+    assert is_retryable_error(EndpointConnectionError(endpoint_url="https://bedrock"))
+    assert not is_retryable_error(_error("ValidationException"))
+    assert not is_retryable_error(ValueError("bug"))
+
+
+def test_token_bucket_queues_callers_after_the_burst():
+    clock = Clock()
+    bucket = TokenBucket(rate=2.0, capacity=2, clock=clock)
+
+    waits = [bucket.reserve() for _ in range(4)]
+
+    assert waits == [0.0, 0.0, 0.5, 1.0]
+    with pytest.raises(RateLimitTimeout):
+        bucket.reserve(max_wait_seconds=1.0)
+    clock.now = 10.0
+    assert bucket.reserve() == 0.0
+
+
+def test_token_bucket_slows_down_when_throttled_and_recovers():
+    bucket = TokenBucket(rate=10.0, capacity=1, min_rate_factor=0.1, clock=Clock())
+
+    for _ in range(10):
+        bucket.throttled()
+    assert bucket.rate == 1.0
+
+    for _ in range(20):
+        bucket.succeeded()
+    assert bucket.rate == 10.0
+
+
+def test_circuit_opens_after_failures_and_lets_one_trial_through():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout_seconds=30, clock=clock)
+
+    breaker.failed()
+    assert breaker.allow()
+    breaker.failed()
+    assert (breaker.state, breaker.allow()) == (CIRCUIT_OPEN, False)
+
+    clock.now = 30
+    assert breaker.allow()
+    assert (breaker.state, breaker.allow()) == (CIRCUIT_HALF_OPEN, False)
+    breaker.failed()
+    assert (breaker.state, breaker.allow()) == (CIRCUIT_OPEN, False)
+
+    clock.now = 60
+    assert breaker.allow()
+    breaker.succeeded()
+    assert (breaker.state, breaker.allow()) == (CIRCUIT_CLOSED, True)
+
+
+def test_a_released_or_expired_trial_makes_way_for_the_next_one():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout_seconds=30, clock=clock)
+    breaker.failed()
+    clock.now = 30
+
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+    assert not breaker.allow()
+    clock.now = 60
+    assert breaker.allow()
+
+
+def test_a_rate_limit_timeout_does_not_claim_the_trial():
+    clock = Clock()
+    guard = _guard(clock, requests_per_second=1.0, burst=1, max_wait_seconds=0.5, failure_threshold=1,
+                   reset_timeout_seconds=30)
+    key = ("model", "region")
+    guard.on_failure(key, _error("ThrottlingException"), attempt=1, can_retry=False)
+    clock.now = 30
+    guard.before_attempt(key)
+    guard.on_abandoned(key)
+
+    with pytest.raises(RateLimitTimeout):
+        guard.before_attempt(key)
+
+    clock.now = 32
+    assert guard.before_attempt(key) == 0.0
+
+
+def test_a_rejected_attempt_gives_its_token_back():
+    guard = _guard(requests_per_second=1.0, burst=1, failure_threshold=1)
+    key = ("model", "region")
+    guard.on_failure(key, _error("ServiceUnavailableException"), attempt=1, can_retry=False)
+
+    with pytest.raises(CircuitOpenError):
+        guard.before_attempt(key)
+
+    assert guard._bucket(key).tokens == 1
+
+
+def test_failed_calls_are_retried_until_max_attempts():
+    guard = _guard(max_attempts=3)
+
+    result = invoke_inline_agent(FlakyClient(failed_calls=2), sample_request_params("Hi"),
+                                 trace_sink=NullTraceSink(), guard=guard)
+    assert (result.answer, result.retries) == (DEFAULT_ANSWER, 2)
+
+    with pytest.raises(ClientError):
+        invoke_inline_agent(FlakyClient(failed_calls=3), sample_request_params("Hi"), trace_sink=NullTraceSink(),
+                            guard=guard)
+
+
+def test_errors_that_are_not_retryable_are_raised_at_once():
+    client = FlakyClient(failed_calls=1, code="ValidationException")
+
+    with pytest.raises(ClientError):
+        invoke_inline_agent(client, sample_request_params("Hi"), trace_sink=NullTraceSink(), guard=_guard())
+
+    assert client.calls == 1
+
+
+def test_a_retried_stream_starts_from_a_clean_state():
+    expected = invoke_inline_agent(FakeInlineAgentRuntimeClient(), _traced_params(), trace_sink=NullTraceSink())
+    # The stream breaks after the pre-processing usage and the rationale, before the tool call in event 2
+    client = FlakyClient(failed_streams=1, fail_at_event=2)
+
+    result = invoke_inline_agent(client, _traced_params(), trace_sink=NullTraceSink(), guard=_guard())
+
+    assert result.retries == 1
+    assert result.answer == expected.answer
+    assert (result.input_tokens, result.output_tokens, result.llm_calls) == \
+           (expected.input_tokens, expected.output_tokens, expected.llm_calls)
+    assert len(result.steps) == len(expected.steps)
+    assert len(result.tool_calls) == len(expected.tool_calls) == 1
+
+
+def test_a_stream_that_called_a_tool_is_not_retried_unless_opted_in():
+    # Event 2 is the tool call, the stream breaks right after it
+    with pytest.raises(InlineAgentStreamError):
+        invoke_inline_agent(FlakyClient(failed_streams=1, fail_at_event=3), _traced_params(),
+                            trace_sink=NullTraceSink(), guard=_guard())
+
+    result = invoke_inline_agent(FlakyClient(failed_streams=1, fail_at_event=3), _traced_params(),
+                                 trace_sink=NullTraceSink(), guard=_guard(retry_after_tool_calls=True))
+    assert (result.retries, len(result.tool_calls)) == (1, 1)
+
+
+def test_a_stream_without_traces_is_not_retried_halfway():
+    with pytest.raises(InlineAgentStreamError):
+        invoke_inline_agent(FlakyClient(failed_streams=1, fail_at_event=1), sample_request_params("Hi"),
+                            trace_sink=NullTraceSink(), guard=_guard())
+
+
+def test_text_that_reached_the_caller_is_never_retried():
+    client = FlakyClient(failed_streams=1)
+    client.events = canned_events(with_traces=False)
+    client.fail_at_event = len(client.events) - 1
+
+    with pytest.raises(InlineAgentStreamError):
+        invoke_inline_agent(client, sample_request_params("Hi"), trace_sink=NullTraceSink(),
+                            guard=_guard(retry_after_tool_calls=True))
+
+
+def _open_circuit(guard, clock, params):
+    key = guard.key(FakeInlineAgentRuntimeClient(), params)
+    guard.on_failure(key, _error("ServiceUnavailableException"), attempt=1, can_retry=False)
+    clock.now = guard.reset_timeout_seconds
+    return guard._breaker(key)
+
+
+def test_an_abandoned_stream_releases_the_trial():
+    clock = Clock()
+    guard = _guard(clock, failure_threshold=1)
+    params = sample_request_params("Hi")
+    breaker = _open_circuit(guard, clock, params)
+
+    stream = iter(stream_inline_agent(FakeInlineAgentRuntimeClient(), params, trace_sink=NullTraceSink(),
+                                      guard=guard))
+    next(stream)
+    stream.close()
+
+    assert breaker.state == CIRCUIT_HALF_OPEN
+    assert invoke_inline_agent(FakeInlineAgentRuntimeClient(), params, trace_sink=NullTraceSink(),
+                               guard=guard).answer == DEFAULT_ANSWER
+    assert breaker.state == CIRCUIT_CLOSED
+
+
+def test_a_response_that_is_not_200_releases_the_trial():
+    class FailingClient(FakeInlineAgentRuntimeClient):
+        def invoke_inline_agent(self, **request_params) -> dict:
+            response = super().invoke_inline_agent(**request_params)
+            response["ResponseMetadata"]["HTTPStatusCode"] = 503
+            return response
+
+    clock = Clock()
+    guard = _guard(clock, failure_threshold=1)
+    params = sample_request_params("Hi")
+    breaker = _open_circuit(guard, clock, params)
+
+    assert invoke_inline_agent(FailingClient(), params, trace_sink=NullTraceSink(), guard=guard).error
+
+    assert breaker.allow()
+
+
+def test_openmetrics_exposes_the_counters_and_states():
+    guard = _guard(max_attempts=2)
+    invoke_inline_agent(FlakyClient(failed_calls=1), sample_request_params("Hi"), trace_sink=NullTraceSink(),
+                        guard=guard)
+
+    metrics = guard.to_openmetrics()
+
+    labels = '{model="eu.amazon.nova-lite-v1:0",region="default"}'
+    assert f"bedrock_agent_invocation_attempts_total{labels} 2" in metrics
+    assert f"bedrock_agent_invocation_retries_total{labels} 1" in metrics
+    assert f"bedrock_agent_invocation_throttled_total{labels} 1" in metrics
+    assert f"bedrock_agent_circuit_state{labels} 0" in metrics
+    assert metrics.endswith("# EOF\n")
@@ -0,0 +1,293 @@
+import io
+import threading
+import zipfile
+
+import pytest
+from botocore.exceptions import ClientError
+
+from bedrock_agent.utils import lambda_creator, provisioning_engine
+
+
+def _client_error(code, message="", operation="Operation"):
+    return ClientError({"Error": {"Code": code, "Message": message}}, operation)
+
+
+class CallLog:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = []
+
+    def record(self, name):
+        with self.lock:
+            self.calls.append(name)
+
+    def index(self, name):
+        return self.calls.index(name)
+
+
+class FakeWaiter:
+    def wait(self, **kwargs):
+        pass
+
+
+class FakeIamClient:
+    class exceptions:
+        class NoSuchEntityException(Exception):
+            pass
+
+    def __init__(self, log):
+        self.log = log
+        self.roles = {}
+
+    def get_role(self, RoleName):
+        if RoleName not in self.roles:
+            raise self.exceptions.NoSuchEntityException(RoleName)
+        return self.roles[RoleName]
+
+    def create_role(self, RoleName, AssumeRolePolicyDocument):
+        self.log.record("create_role")
+        self.roles[RoleName] = {"Role": {"RoleName": RoleName, "Arn": f"arn:aws:iam::role/{RoleName}"}}
+        return self.roles[RoleName]
+
+    def get_waiter(self, name):
+        return FakeWaiter()
+
+    def attach_role_policy(self, RoleName, PolicyArn):
+        self.log.record("attach_role_policy")
+
+    def put_role_policy(self, RoleName, PolicyName, PolicyDocument):
+        self.log.record("put_role_policy")
+
+
+class FakeS3Client:
+    class exceptions:
+        ClientError = ClientError
+
+    def __init__(self, log, fail_create=False):
+        self.log = log
+        self.fail_create = fail_create
+
+    def head_bucket(self, Bucket):
+        raise _client_error("404", "Not Found", "HeadBucket")
+
+    def create_bucket(self, Bucket, CreateBucketConfiguration):
+        if self.fail_create:
+            raise _client_error("BucketAlreadyExists", "Bucket name taken", "CreateBucket")
+        self.log.record("create_bucket")
+
+    def get_waiter(self, name):
+        return FakeWaiter()
+
+
+class FakeLambdaClient:
+    class exceptions:
+        class ResourceNotFoundException(Exception):
+            pass
+
+        ClientError = ClientError
+
+    def __init__(self, role_ready_after=0, log=None):
+        self.role_ready_after = role_ready_after
+        self.log = log or CallLog()
+        self.functions = {}
+        self.create_calls = 0
+
+    def get_function(self, FunctionName):
+        if FunctionName not in self.functions:
+            raise self.exceptions.ResourceNotFoundException(FunctionName)
+        return {"Configuration": self.functions[FunctionName]}
+
+    def create_function(self, FunctionName, Role, Code, **kwargs):
+        self.create_calls += 1
+        if self.create_calls <= self.role_ready_after:
+            raise _client_error("InvalidParameterValueException",
+                                "The role defined for the function cannot be assumed by Lambda.", "CreateFunction")
+        self.log.record("create_function")
+        self.functions[FunctionName] = {"FunctionArn": f"arn:aws:lambda:function:{FunctionName}", "Role": Role,
+                                        "Files": zipfile.ZipFile(io.BytesIO(Code["ZipFile"])).namelist()}
+        return self.functions[FunctionName]
+
+    def get_policy(self, FunctionName):
+        raise _client_error("ResourceNotFoundException", "No policy", "GetPolicy")
+
+    def add_permission(self, FunctionName, **kwargs):
+        self.log.record("add_permission")
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(provisioning_engine.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def test_create_lambda_function_waits_until_the_new_role_can_be_assumed(tmp_path, sleeps):
+    code, payload = tmp_path / "handler.py", tmp_path / "payload.json"
+    code.write_text("def lambda_handler(event, context):\n    pass\n")
+    payload.write_text("{}")
+    client = FakeLambdaClient(role_ready_after=2)
+
+    function = lambda_creator.create_lambda_function(client, "orders", str(code), "arn:role", [str(payload)])
+
+    assert (function["Role"], function["Files"]) == ("arn:role", ["lambda_function.py", "payload.json"])
+    assert (client.create_calls, len(sleeps)) == (3, 2)
+    assert lambda_creator.create_lambda_function(client, "orders", str(code), "arn:role") == function
+    assert client.create_calls == 3
+
+
+def test_create_lambda_function_raises_other_errors_at_once(tmp_path, sleeps):
+    class RejectingClient(FakeLambdaClient):
+        def create_function(self, **kwargs):
+            self.create_calls += 1
+            raise _client_error("InvalidParameterValueException", "Unsupported runtime", "CreateFunction")
+
+    code = tmp_path / "handler.py"
+    code.write_text("")
+    client = RejectingClient()
+
+    with pytest.raises(ClientError, match="Unsupported runtime"):
+        lambda_creator.create_lambda_function(client, "orders", str(code), "arn:role")
+    assert (client.create_calls, sleeps) == (1, [])
+
+
+def _use_clients(monkeypatch, **clients):
+    monkeypatch.setattr(lambda_creator, "get_client", lambda service_name, region_name=None: clients[service_name])
+
+
+def test_resources_are_created_in_dependency_order(tmp_path, monkeypatch, sleeps):
+    code = tmp_path / "handler.py"
+    code.write_text("")
+    log = CallLog()
+    _use_clients(monkeypatch, iam=FakeIamClient(log), s3=FakeS3Client(log), **{"lambda": FakeLambdaClient(1, log)})
+
+    resources = lambda_creator.create_lambda_function_and_its_resources(
+        "eu-west-1", "123456789012", "orders", str(code), bucket_name="orders-bucket")
+
+    assert resources["lambda_function"]["Role"] == "arn:aws:iam::role/orders-lambda-role-eu-west-1-123456789012"
+    assert set(resources["step_durations"]) == {"iam_role", "lambda_function", "bedrock_permission", "s3_bucket",
+                                                "s3_policy"}
+    assert log.index("create_role") < log.index("create_function") < log.index("add_permission")
+    assert max(log.index("create_role"), log.index("create_bucket")) < log.index("put_role_policy")
+
+
+def test_a_failed_resource_stops_the_resources_that_depend_on_it(tmp_path, monkeypatch, sleeps):
+    code = tmp_path / "handler.py"
+    code.write_text("")
+    log = CallLog()
+    _use_clients(monkeypatch, iam=FakeIamClient(log), s3=FakeS3Client(log, fail_create=True),
+                 **{"lambda": FakeLambdaClient(log=log)})
+
+    with pytest.raises(ClientError, match="Bucket name taken"):
+        lambda_creator.create_lambda_function_and_its_resources(
+            "eu-west-1", "123456789012", "orders", str(code), bucket_name="orders-bucket")
+
+    assert "put_role_policy" not in log.calls
+
+
+class FakePaginator:
+    def __init__(self, pages):
+        self.pages = pages
+
+    def paginate(self, **kwargs):
+        return iter(self.pages)
+
+
+class VersionedBucketClient:
+    """Lists versions and delete markers in pages of 1000 and deletes them, failing for the keys in failing."""
+
+    def __init__(self, versions, delete_markers, failing=()):
+        entries = [("Versions", f"object-{i}") for i in range(versions)] + \
+                  [("DeleteMarkers", f"marker-{i}") for i in range(delete_markers)]
+        self.pages = []
+        for start in range(0, len(entries), 1000):
+            page = {"Versions": [], "DeleteMarkers": []}
+            for kind, key in entries[start:start + 1000]:
+                page[kind].append({"Key": key, "VersionId": f"v-{key}"})
+            self.pages.append(page)
+        self.failing = set(failing)
+        self.lock = threading.Lock()
+        self.batches = []
+
+    def get_paginator(self, name):
+        assert name == "list_object_versions"
+        return FakePaginator(self.pages)
+
+    def delete_objects(self, Bucket, Delete):
+        with self.lock:
+            self.batches.append(Delete["Objects"])
+        return {"Errors": [{"Key": item["Key"], "VersionId": item["VersionId"], "Code": "AccessDenied"}
+                           for item in Delete["Objects"] if item["Key"] in self.failing]}
+
+
+def test_empty_s3_bucket_deletes_all_versions_and_delete_markers_in_batches():
+    client = VersionedBucketClient(versions=2500, delete_markers=1200)
+    progress = []
+
+    deleted = lambda_creator.empty_s3_bucket(client, "orders", max_workers=2, progress_callback=progress.append)
+
+    deleted_keys = [item["Key"] for batch in client.batches for item in batch]
+    assert deleted == len(deleted_keys) == len(set(deleted_keys)) == 3700
+    assert {item["VersionId"] for batch in client.batches for item in batch} == \
+           {f"v-{key}" for key in deleted_keys}
+    assert all(len(batch) <= lambda_creator.S3_DELETE_BATCH_SIZE for batch in client.batches)
+    assert len(client.batches) == 4
+    assert progress == sorted(progress) and progress[-1] == 3700 and len(progress) == len(client.batches)
+
+
+def test_empty_s3_bucket_reports_the_objects_it_could_not_delete():
+    client = VersionedBucketClient(versions=1500, delete_markers=0, failing={"object-3", "object-1203"})
+    progress = []
+
+    with pytest.raises(RuntimeError, match="Could not delete 2 objects from bucket orders"):
+        lambda_creator.empty_s3_bucket(client, "orders", progress_callback=progress.append)
+
+    assert sum(len(batch) for batch in client.batches) == 1500
+    assert progress[-1] == 1498
+
+
+class FakeRoleClient:
+    class exceptions:
+        class NoSuchEntityException(Exception):
+            pass
+
+    def __init__(self, exists=True):
+        self.exists = exists
+        self.lock = threading.Lock()
+        self.calls = []
+
+    def get_paginator(self, name):
+        if not self.exists:
+            raise self.exceptions.NoSuchEntityException(name)
+        if name == "list_attached_role_policies":
+            return FakePaginator([{"AttachedPolicies": [{"PolicyArn": f"arn:policy/{i}"} for i in (start, start + 1)]}
+                                  for start in (0, 2)])
+        return FakePaginator([{"PolicyNames": ["s3-access"]}, {"PolicyNames": ["logs"]}])
+
+    def detach_role_policy(self, RoleName, PolicyArn):
+        with self.lock:
+            self.calls.append(("detach", PolicyArn))
+
+    def delete_role_policy(self, RoleName, PolicyName):
+        with self.lock:
+            self.calls.append(("delete_policy", PolicyName))
+
+    def delete_role(self, RoleName):
+        self.calls.append(("delete_role", RoleName))
+
+
+def test_remove_iam_role_removes_the_policies_of_all_pages_before_the_role():
+    client = FakeRoleClient()
+
+    lambda_creator.remove_iam_role(client, "orders-role")
+
+    assert sorted(client.calls[:-1]) == [("delete_policy", "logs"), ("delete_policy", "s3-access")] + \
+           [("detach", f"arn:policy/{i}") for i in range(4)]
+    assert client.calls[-1] == ("delete_role", "orders-role")
+
+
+def test_remove_iam_role_skips_a_missing_role():
+    client = FakeRoleClient(exists=False)
+
+    lambda_creator.remove_iam_role(client, "orders-role")
+
+    assert client.calls == []
@@ -0,0 +1,169 @@
+import json
+import os
+
+import pytest
+
+from bedrock_agent.utils.local_knowledge_base import Chunk, LocalKnowledgeBase, chunk_markdown, tokenize
+
+SAMPLES_DIR = os.path.join(os.path.dirname(__file__), "..", "samples")
+
+HEADPHONES = """# Name
+Quiet Headphones
+# Battery
+The battery lasts 30 hours on a single charge.
+# Pairing
+Hold the power button to pair over Bluetooth.
+"""
+
+THERMOSTAT = """# Name
+Smart Thermostat
+# Installation
+Turn off the power at the breaker before you install the thermostat.
+# Voice
+Works with Google Home and Alexa.
+"""
+
+
+def _knowledge_base(**kwargs):
+    chunks = chunk_markdown(HEADPHONES, "headphones.md") + chunk_markdown(THERMOSTAT, "thermostat.md")
+    return LocalKnowledgeBase(chunks, **kwargs)
+
+
+def test_tokenize_drops_stop_words_and_punctuation():
+    assert tokenize("How long does the Battery last?") == ["long", "battery", "last"]
+
+
+def test_chunk_markdown_makes_a_chunk_per_section_titled_after_the_name():
+    chunks = chunk_markdown(HEADPHONES, "headphones.md")
+
+    assert [(chunk.title, chunk.section) for chunk in chunks] == [("Quiet Headphones", "Battery"),
+                                                                 ("Quiet Headphones", "Pairing")]
+
+
+def test_chunk_markdown_splits_long_sections():
+    text = "# Name\nLong\n# Manual\n" + "\n".join(f"Paragraph {i} " + "x" * 80 for i in range(10))
+
+    chunks = chunk_markdown(text, "long.md", max_chars=200)
+
+    assert len(chunks) > 1
+    assert all(len(chunk.text) <= 200 for chunk in chunks)
+
+
+def test_search_ranks_the_matching_section_first():
+    hits = _knowledge_base().search("How long does a battery charge give power?")
+
+    assert [(hit.chunk.title, hit.chunk.section) for hit in hits] == [
+        ("Quiet Headphones", "Battery"), ("Quiet Headphones", "Pairing"), ("Smart Thermostat", "Installation")]
+    assert hits[0].score > hits[1].score
+
+
+def test_search_without_matching_terms_finds_nothing():
+    assert _knowledge_base().search("zebra") == []
+
+
+def test_remove_source_drops_its_chunks_and_changes_the_version():
+    knowledge_base = _knowledge_base()
+    version = knowledge_base.version
+
+    assert knowledge_base.remove_source("headphones.md") == 2
+
+    assert len(knowledge_base) == 2
+    assert knowledge_base.sources() == ["thermostat.md"]
+    assert knowledge_base.version > version
+    assert all(hit.chunk.source == "thermostat.md" for hit in knowledge_base.search("battery power"))
+    assert knowledge_base.remove_source("headphones.md") == 0
+
+
+def test_save_and_load_keep_the_live_chunks(tmp_path):
+    knowledge_base = _knowledge_base()
+    knowledge_base.remove_source("thermostat.md")
+    knowledge_base.save(str(tmp_path))
+
+    loaded = LocalKnowledgeBase.load(str(tmp_path))
+
+    assert loaded.chunks == [chunk for chunk in knowledge_base.chunks if chunk is not None]
+    assert len(LocalKnowledgeBase.load(str(tmp_path / "missing"))) == 0
+
+
+def test_hybrid_search_with_embeddings_survives_a_reload(tmp_path):
+    pytest.importorskip("numpy")
+    from bedrock_agent.utils.local_knowledge_base import HashingEmbedder
+
+    embedder = HashingEmbedder()
+    knowledge_base = _knowledge_base(embedder=embedder)
+    knowledge_base.save(str(tmp_path))
+    loaded = LocalKnowledgeBase.load(str(tmp_path), embedder=embedder)
+
+    expected = [(hit.chunk, round(hit.score, 4)) for hit in knowledge_base.search("pair bluetooth headphones")]
+    assert [(hit.chunk, round(hit.score, 4)) for hit in loaded.search("pair bluetooth headphones")] == expected
+    assert expected[0][0].section == "Pairing"
+
+
+def _index(directory):
+    return json.loads((directory / "index.json").read_text())
+
+
+def test_saving_again_appends_what_changed(tmp_path):
+    pytest.importorskip("numpy")
+    from bedrock_agent.utils.local_knowledge_base import HashingEmbedder
+
+    embedder = HashingEmbedder()
+    knowledge_base = _knowledge_base(embedder=embedder)
+    knowledge_base.save(str(tmp_path))
+    first = _index(tmp_path)
+    # What an interrupted save wrote past the recorded end is ignored and cut off
+    with open(tmp_path / f"chunks-{first['generation']}.jsonl", "a") as file:
+        file.write('{"source": "half')
+
+    knowledge_base.add([Chunk("router.md", "Mesh Router", "Range", "Covers 500 square meters.")])
+    knowledge_base.remove_source("headphones.md")
+    knowledge_base.save(str(tmp_path))
+    loaded = LocalKnowledgeBase.load(str(tmp_path), embedder=embedder)
+
+    second = _index(tmp_path)
+    assert (second["generation"], second["chunk_count"]) == (first["generation"], 5)
+    assert second["chunks_bytes"] > first["chunks_bytes"]
+    assert (tmp_path / f"embeddings-{first['generation']}.f32").stat().st_size == 5 * embedder.dimensions * 4
+    assert sorted(loaded.sources()) == ["router.md", "thermostat.md"]
+    expected = [(hit.chunk, round(hit.score, 4)) for hit in knowledge_base.search("router range power")]
+    assert [(hit.chunk, round(hit.score, 4)) for hit in loaded.search("router range power")] == expected
+
+
+def test_saving_compacts_when_most_chunks_were_removed(tmp_path):
+    knowledge_base = _knowledge_base()
+    knowledge_base.save(str(tmp_path))
+    generation = _index(tmp_path)["generation"]
+    knowledge_base.remove_source("headphones.md")
+    knowledge_base.save(str(tmp_path))
+    knowledge_base.remove_source("thermostat.md")
+    knowledge_base.add([Chunk("router.md", "Mesh Router", "Range", "Covers 500 square meters.")])
+
+    knowledge_base.save(str(tmp_path))
+
+    assert _index(tmp_path) == {"generation": generation + 1, "chunks_bytes": os.path.getsize(
+        tmp_path / f"chunks-{generation + 1}.jsonl"), "chunk_count": 1, "dimensions": 0}
+    assert sorted(path.name for path in tmp_path.iterdir()) == [f"chunks-{generation + 1}.jsonl", "index.json"]
+    assert knowledge_base.search("router")[0].chunk.source == "router.md"
+    assert LocalKnowledgeBase.load(str(tmp_path)).chunks == knowledge_base.chunks
+
+
+def test_sample_products_are_found_by_their_features():
+    knowledge_base = LocalKnowledgeBase.from_directory(SAMPLES_DIR)
+
+    assert knowledge_base.search("noise cancellation headphones")[0].chunk.title.startswith("Sony WH-1000XM5")
+    assert knowledge_base.search("install thermostat breaker")[0].chunk.title.startswith("Google Nest")
+
+
+def test_search_hits_serialize_for_the_agent():
+    hit = _knowledge_base().search("Alexa")[0]
+
+    assert hit.as_dict() == {"source": "thermostat.md", "title": "Smart Thermostat", "section": "Voice",
+                             "text": "Works with Google Home and Alexa.", "score": round(hit.score, 4)}
+
+
+def test_chunks_added_later_are_searchable():
+    knowledge_base = _knowledge_base()
+
+    knowledge_base.add([Chunk("router.md", "Mesh Router", "Range", "Covers 500 square meters.")])
+
+    assert knowledge_base.search("router range")[0].chunk.source == "router.md"
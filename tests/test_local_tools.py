@@ -0,0 +1,61 @@
+import gc
+
+from bedrock_agent.utils.local_tools import LocalToolRegistry
+
+
+def _input(action_group, function, **parameters):
+    return {"functionInvocationInput": {"actionGroup": action_group, "function": function, "parameters": [
+        {"name": name, "value": value} for name, value in parameters.items()]}}
+
+
+def _body(result):
+    return result["functionResult"]["responseBody"]["TEXT"]["body"]
+
+
+class Searcher:
+    def search(self, query):
+        return {"query": query}
+
+
+def test_run_passes_the_parameters_and_serializes_the_result():
+    registry = LocalToolRegistry()
+    registry.register("tools", "search", Searcher().search)
+
+    result = registry.run(_input("tools", "search", query="battery"))
+
+    assert _body(result) == '{"query": "battery"}'
+    assert "responseState" not in result["functionResult"]
+
+
+def test_unknown_and_failing_tools_report_a_failure():
+    registry = LocalToolRegistry()
+    registry.register("tools", "fail", lambda: 1 / 0)
+
+    unknown = registry.run(_input("tools", "missing"))
+    failed = registry.run(_input("tools", "fail"))
+
+    assert unknown["functionResult"]["responseState"] == "FAILURE"
+    assert failed["functionResult"]["responseState"] == "FAILURE"
+    assert "division by zero" in _body(failed)
+
+
+def test_weak_tools_disappear_with_their_object():
+    registry = LocalToolRegistry()
+    searcher = Searcher()
+    registry.register("tools-1", "search", searcher.search, weak=True)
+    registry.register("tools-2", "search", Searcher().search)
+
+    del searcher
+    gc.collect()
+
+    assert registry.run(_input("tools-1", "search", query="x"))["functionResult"]["responseState"] == "FAILURE"
+    assert _body(registry.run(_input("tools-2", "search", query="x"))) == '{"query": "x"}'
+
+
+def test_unregister_removes_the_functions_of_the_action_group():
+    registry = LocalToolRegistry()
+    registry.register("tools", "search", Searcher().search)
+
+    registry.unregister("tools")
+
+    assert registry.run(_input("tools", "search", query="x"))["functionResult"]["responseState"] == "FAILURE"
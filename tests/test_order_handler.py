@@ -0,0 +1,597 @@
+import io
+import json
+import logging
+import random
+import re
+
+import pytest
+
+from bedrock_agent.crm.lambdas import lambda_function_order_handler as handler
+
+
+@pytest.fixture(params=["local", "sqlite", "s3"])
+def storage(request, tmp_path):
+    if request.param == "s3":
+        storage = handler.S3OrderStorage("orders", client=FakeS3Client())
+    else:
+        path = ":memory:" if request.param == "sqlite" else str(tmp_path / "orders")
+        storage = handler.create_order_storage(request.param, path)
+    handler.set_order_storage(storage)
+    yield storage
+    handler.set_order_storage(None)
+
+
+def _order(order_id, customer="Jettro", status="created", day=1):
+    return {"orderId": order_id, "customer": customer, "status": status,
+            "createdAt": f"2025-04-{day:02d}T10:00:00+00:00", "orderLines": [{"product": "Fries", "qty": 1}]}
+
+
+def _event(method, api_path, parameters=None, body=None):
+    event = {"actionGroup": "HandleOrders", "apiPath": api_path, "httpMethod": method,
+             "parameters": [{"name": name, "type": "string", "value": value}
+                            for name, value in (parameters or {}).items()]}
+    if body is not None:
+        event["body"] = json.dumps(body)
+    return event
+
+
+def _handle(event):
+    result = handler.lambda_handler(event, None)["response"]
+    body = result["responseBody"]["application/json"]["body"]
+    return result["httpStatusCode"], json.loads(body) if body else None
+
+
+def _all_pages(storage, limit, **filters):
+    orders, token, pages = [], None, 0
+    while True:
+        page, token = storage.query(limit=limit, next_token=token, **filters)
+        orders.extend(page)
+        pages += 1
+        if token is None:
+            return orders, pages
+
+
+def test_put_get_and_delete(storage):
+    storage.put("1", _order("1"))
+
+    assert storage.get("1")["customer"] == "Jettro"
+
+    storage.delete("1")
+    storage.delete("1")
+    assert storage.get("1") is None
+
+
+def test_query_pages_through_the_orders_of_a_customer_newest_first(storage):
+    for day in range(1, 8):
+        storage.put(str(day), _order(str(day), day=day))
+    storage.put("other", _order("other", customer="Jeroen"))
+
+    orders, pages = _all_pages(storage, limit=3, customer="Jettro")
+
+    assert [order["orderId"] for order in orders] == ["7", "6", "5", "4", "3", "2", "1"]
+    assert pages == 3
+
+
+def test_query_by_status_and_by_customer_and_status(storage):
+    storage.put("1", _order("1", status="shipped", day=1))
+    storage.put("2", _order("2", status="created", day=2))
+    storage.put("3", _order("3", customer="Jeroen", status="shipped", day=3))
+
+    shipped, _ = storage.query(status="shipped")
+    shipped_to_jettro, _ = storage.query(customer="Jettro", status="shipped")
+
+    assert [order["orderId"] for order in shipped] == ["3", "1"]
+    assert [order["orderId"] for order in shipped_to_jettro] == ["1"]
+
+
+def test_updates_and_deletes_move_the_order_between_the_indexes(storage):
+    storage.put("1", _order("1", status="created"))
+    storage.put("1", _order("1", status="shipped"))
+
+    assert storage.query(status="created")[0] == []
+    assert [order["orderId"] for order in storage.query(status="shipped")[0]] == ["1"]
+
+    storage.delete("1")
+    assert storage.query(status="shipped")[0] == []
+    assert storage.query(customer="Jettro")[0] == []
+
+
+def test_query_without_filters_or_with_an_invalid_token_fails(storage):
+    with pytest.raises(ValueError):
+        storage.query()
+    with pytest.raises(ValueError):
+        storage.query(customer="Jettro", next_token="not a token!")
+
+
+def test_local_storage_keeps_order_ids_inside_its_directory(tmp_path):
+    storage = handler.LocalDirectoryOrderStorage(str(tmp_path / "orders"))
+
+    storage.put("../../escape", _order("../../escape"))
+
+    assert not (tmp_path / "escape.json").exists()
+    assert storage.get("../../escape")["orderId"] == "../../escape"
+
+
+def test_list_orders_endpoint_returns_pages_with_a_next_token(storage):
+    for day in range(1, 4):
+        storage.put(str(day), _order(str(day), day=day))
+
+    status_code, first_page = _handle(_event("GET", "/orders", {"customer": "Jettro", "limit": "2"}))
+    _, second_page = _handle(_event("GET", "/orders", {"customer": "Jettro", "limit": "2",
+                                                        "nextToken": first_page["nextToken"]}))
+
+    assert status_code == 200
+    assert [order["orderId"] for order in first_page["orders"]] == ["3", "2"]
+    assert [order["orderId"] for order in second_page["orders"]] == ["1"]
+    assert second_page["nextToken"] is None
+
+
+def test_list_orders_endpoint_needs_a_filter(storage):
+    status_code, body = _handle(_event("GET", "/orders"))
+
+    assert status_code == 400
+    assert "customer" in body["error"]
+
+
+def _new_order(order_id, total=10.0):
+    return {"orderId": order_id, "customer": "Jettro", "total": total, "orderLines": [{"product": "Fries", "qty": 1}]}
+
+
+def test_batch_create_reports_the_outcome_per_order(storage):
+    orders = [_new_order("1"), _new_order("2", total="ten"), {"customer": "Jettro", "total": 1.0, "orderLines": []}]
+
+    status_code, body = _handle(_event("POST", "/orders/batch", body={"orders": orders}))
+
+    assert status_code == 200
+    assert [(result["orderId"], result["statusCode"]) for result in body["results"]] == \
+           [("1", 200), ("2", 400), (None, 400)]
+    assert (body["succeeded"], body["failed"]) == (1, 2)
+    assert "orders[1].total" in body["results"][1]["error"]
+    assert storage.get("1")["status"] == "created"
+    assert storage.get("2") is None
+
+
+def test_batch_create_parses_the_bedrock_syntax(storage):
+    event = {"actionGroup": "HandleOrders", "apiPath": "/orders/batch", "httpMethod": "POST",
+             "requestBody": {"content": {"application/json": {"properties": [
+                 {"name": "orders", "type": "array",
+                  "value": "[{orderId=7, customer=Jettro, total=5, orderLines=[{item=Cola, quantity=2}]}]"}
+             ]}}}}
+
+    status_code, body = _handle(event)
+
+    assert (status_code, body["succeeded"]) == (200, 1)
+    assert storage.get("7")["orderLines"] == [{"product": "Cola", "qty": 2}]
+    assert storage.get("7")["total"] == 5.0
+
+
+def test_batch_get_returns_found_and_missing_orders(storage):
+    storage.put("1", _order("1"))
+
+    status_code, body = _handle(_event("GET", "/orders/batch", {"ids": "1, 2"}))
+
+    assert status_code == 200
+    assert body["results"][0]["result"]["orderId"] == "1"
+    assert (body["results"][1]["statusCode"], body["results"][1]["error"]) == (404, "Order not found")
+
+
+def test_batch_update_keeps_the_status_and_creation_time(storage):
+    storage.put("1", _order("1", status="shipped"))
+
+    status_code, body = _handle(_event("PUT", "/orders/batch", body={"orders": [_new_order("1", total=12.0)]}))
+
+    assert (status_code, body["succeeded"]) == (200, 1)
+    updated = storage.get("1")
+    assert (updated["total"], updated["status"], updated["createdAt"]) == \
+           (12.0, "shipped", _order("1")["createdAt"])
+    assert [order["orderId"] for order in storage.query(status="shipped")[0]] == ["1"]
+
+
+@pytest.mark.parametrize("method, parameters, body, error", [
+    ("GET", {"ids": ""}, None, "The batch is empty"),
+    ("DELETE", {"ids": "1"}, None, "Unsupported method for batch: DELETE"),
+    ("PUT", None, {"orders": [_new_order(str(i)) for i in range(handler.MAX_BATCH_SIZE + 1)]},
+     f"A batch can hold at most {handler.MAX_BATCH_SIZE} orders"),
+])
+def test_batch_rejects_invalid_batches(storage, method, parameters, body, error):
+    assert _handle(_event(method, "/orders/batch", parameters, body)) == (400, {"error": error})
+
+
+class VersionedStorage(handler.OrderStorage):
+    """In memory storage with an ETag per order version, counts the reads."""
+
+    def __init__(self):
+        self.orders = {}
+        self.reads = []
+        self.on_read = None
+
+    def get(self, order_id):
+        return self.get_if_modified(order_id)[0]
+
+    def get_if_modified(self, order_id, etag=None):
+        self.reads.append(etag)
+        if self.on_read is not None:
+            self.on_read()
+        order, version = self.orders.get(order_id, (None, None))
+        if order is None:
+            return None, None, True
+        if etag == version:
+            return None, etag, False
+        return dict(order), version, True
+
+    def put(self, order_id, order):
+        version = self.orders.get(order_id, (None, 0))[1] + 1
+        self.orders[order_id] = (order, version)
+
+    def delete(self, order_id):
+        self.orders.pop(order_id, None)
+
+    def query(self, customer=None, status=None, limit=handler.DEFAULT_PAGE_SIZE, next_token=None):
+        return [], None
+
+
+def test_cache_serves_fresh_orders_from_memory():
+    storage = VersionedStorage()
+    storage.put("1", _order("1"))
+    cache = handler.CachingOrderStorage(storage, ttl_seconds=60)
+
+    first, second = cache.get("1"), cache.get("1")
+
+    assert first is second
+    assert storage.reads == [None]
+    assert cache.stats() == {"hits": 1, "misses": 1, "revalidations": 0, "size": 1}
+
+
+def test_cache_revalidates_expired_orders_with_their_etag():
+    storage = VersionedStorage()
+    storage.put("1", _order("1"))
+    cache = handler.CachingOrderStorage(storage, ttl_seconds=0)
+
+    first, second = cache.get("1"), cache.get("1")
+    storage.put("1", _order("1", status="shipped"))
+    third = cache.get("1")
+
+    assert first is second
+    assert third["status"] == "shipped"
+    assert storage.reads == [None, 1, 1]
+    assert cache.stats()["revalidations"] == 1
+
+
+def test_cache_writes_invalidate_the_order():
+    storage = VersionedStorage()
+    cache = handler.CachingOrderStorage(storage, ttl_seconds=60)
+    cache.put("1", _order("1"))
+    cache.get("1")
+
+    cache.put("1", _order("1", status="shipped"))
+
+    assert cache.get("1")["status"] == "shipped"
+    cache.delete("1")
+    assert cache.get("1") is None
+
+
+def test_cache_does_not_keep_an_order_read_during_a_write():
+    storage = VersionedStorage()
+    storage.put("1", _order("1"))
+    cache = handler.CachingOrderStorage(storage, ttl_seconds=60)
+    storage.on_read = lambda: cache.invalidate("1")
+
+    cache.get("1")
+
+    assert cache.stats()["size"] == 0
+
+
+def test_cache_evicts_the_least_recently_used_order():
+    storage = VersionedStorage()
+    for order_id in ("1", "2", "3"):
+        storage.put(order_id, _order(order_id))
+    cache = handler.CachingOrderStorage(storage, max_entries=2, ttl_seconds=60)
+
+    cache.get("1")
+    cache.get("2")
+    cache.get("1")
+    cache.get("3")
+    storage.reads.clear()
+    cache.get("1")
+    cache.get("2")
+
+    assert storage.reads == [None]
+
+
+class FakePaginator:
+    def __init__(self, objects, page_size):
+        self.objects = objects
+        self.page_size = page_size
+
+    def paginate(self, Bucket, Prefix, StartAfter=None):
+        keys = sorted(key for key in self.objects if key.startswith(Prefix) and key > (StartAfter or ""))
+        for start in range(0, len(keys), self.page_size):
+            yield {"Contents": [{"Key": key} for key in keys[start:start + self.page_size]]}
+
+
+class FakeS3Client:
+    """Answers like S3, including 304 for a matching If-None-Match and listings in pages of page_size keys."""
+
+    class exceptions:
+        class NoSuchKey(Exception):
+            pass
+
+    def __init__(self, page_size=2):
+        self.objects = {}
+        self.page_size = page_size
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = (Body, f'"{len(self.objects)}-{hash(Body)}"')
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+    def get_paginator(self, name):
+        assert name == "list_objects_v2"
+        return FakePaginator(self.objects, self.page_size)
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):
+        if Key not in self.objects:
+            raise self.exceptions.NoSuchKey(Key)
+        body, etag = self.objects[Key]
+        if IfNoneMatch == etag:
+            raise handler.ClientError({"Error": {"Code": "304", "Message": "Not Modified"}}, "GetObject")
+        return {"Body": io.BytesIO(body.encode("utf-8")), "ETag": etag}
+
+
+def test_stale_index_markers_of_concurrent_writers_are_ignored():
+    client = FakeS3Client()
+    storage = handler.S3OrderStorage("orders", client=client)
+    storage.put("1", _order("1", status="shipped"))
+    stale_markers = [key for key in client.objects if key.startswith("indexes/")]
+    # A writer that read the order before it was shipped stores it as created, and deletes no markers
+    storage.put("1", _order("1", status="created"))
+    for key in stale_markers:
+        client.put_object("orders", key, "{}")
+    storage.put("2", _order("2", status="shipped", day=2))
+
+    assert [order["orderId"] for order in storage.query(status="shipped")[0]] == ["2"]
+    assert [order["orderId"] for order in storage.query(customer="Jettro", status="shipped")[0]] == ["2"]
+    assert [order["orderId"] for order in storage.query(customer="Jettro")[0]] == ["2", "1"]
+    assert [order["orderId"] for order in storage.query(status="created")[0]] == ["1"]
+    orders, pages = _all_pages(storage, limit=1, customer="Jettro")
+    assert [order["orderId"] for order in orders] == ["2", "1"]
+
+
+def test_s3_storage_reads_an_unchanged_order_without_a_body():
+    storage = handler.S3OrderStorage("orders", client=FakeS3Client())
+    storage.put("1", _order("1"))
+
+    order, etag, modified = storage.get_if_modified("1")
+    unchanged = storage.get_if_modified("1", etag)
+    missing = storage.get_if_modified("2")
+
+    assert (order["orderId"], modified) == ("1", True)
+    assert unchanged == (None, etag, False)
+    assert missing == (None, None, True)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("[{product=Fries, qty=2}]", [{"product": "Fries", "qty": "2"}]),
+    ("[{product=Fries, large, qty=2}]", [{"product": "Fries, large", "qty": "2"}]),
+    ("[{product=a , b  ,c , qty=2}]", [{"product": "a, b,c", "qty": "2"}]),
+    ('[{product="a, b=c", qty: 1}]', [{"product": "a, b=c", "qty": "1"}]),
+    ('["say \\"hi\\""]', ['say "hi"']),
+    ("{a=[1, 2], b={c=d}}", {"a": ["1", "2"], "b": {"c": "d"}}),
+    ('[{"product": "Cola", "qty": 2}]', [{"product": "Cola", "qty": "2"}]),
+    ("[]", []),
+    ("{}", {}),
+])
+def test_parse_bedrock_value(text, expected):
+    assert handler.parse_bedrock_value(text) == expected
+
+
+def test_parse_bedrock_value_keeps_long_unquoted_values_with_many_commas():
+    value = ", ".join(["x"] * 100000)
+
+    assert handler.parse_bedrock_value(f"[{{product={value}, qty=1}}]") == [{"product": value, "qty": "1"}]
+
+
+@pytest.mark.parametrize("text, message", [
+    ("[{product=Fries", "Expected ',' or '}' at position 15 of 15"),
+    ("[1, 2", "Expected ',' or ']' at position 5 of 5"),
+    ("{=x}", "Expected a key followed by '=' or ':' at position 1 of 4"),
+    ("[1] x", "Unexpected trailing text at position 4 of 5"),
+    ('["abc', "Unterminated string at position 1 of 5"),
+])
+def test_parse_bedrock_value_reports_the_position_of_syntax_errors(text, message):
+    with pytest.raises(handler.BedrockValueSyntaxError, match=re.escape(message)):
+        handler.parse_bedrock_value(text)
+
+
+ORDER_LINES_VALIDATOR = handler.compile_validator(handler.ORDER_SCHEMA["properties"]["orderLines"])
+
+
+def _fuzz_order_lines_parser(rounds):
+    """Round trip random order lines through the Bedrock syntax, and feed the parser mutated input."""
+    bare_product = re.compile(r"[A-Za-z0-9]+(?:,? [A-Za-z0-9]+)*")
+    alphabet = "abc XYZ 019 ,=:{}[]\"'\\"
+
+    def serialize(value):
+        if bare_product.fullmatch(value):
+            return value
+        escaped = value.replace("\\", "\\\\").replace('"', '\\"')
+        return f'"{escaped}"'
+
+    for _ in range(rounds):
+        expected = []
+        for _ in range(random.randint(0, 5)):
+            words = ["".join(random.choices("abcXYZ019", k=random.randint(1, 5)))
+                     for _ in range(random.randint(1, 3))]
+            product = random.choice([" ".join(words), ", ".join(words),
+                                     "".join(random.choices(alphabet, k=random.randint(0, 12)))])
+            line = {"product": product, "qty": random.randint(0, 1000)}
+            if random.random() < 0.3:
+                line["note"] = "".join(random.choices(alphabet, k=random.randint(0, 12)))
+            expected.append(line)
+
+        if random.random() < 0.2:
+            text = json.dumps(expected)
+        else:
+            rendered = []
+            for line in expected:
+                fields = [(random.choice(["product", "item"]) if key == "product" else
+                           random.choice(["qty", "quantity"]) if key == "qty" else key,
+                           serialize(str(value)) if key != "qty" else random.choice([str(value), f"{value}.0"]))
+                          for key, value in line.items()]
+                random.shuffle(fields)
+                rendered.append("{" + ", ".join(f"{key}{random.choice(['=', ' = ', ': '])}{value}"
+                                                 for key, value in fields) + "}")
+            text = "[" + random.choice([", ", ","]).join(rendered) + "]"
+
+        parsed = ORDER_LINES_VALIDATOR(handler.normalize_order({"orderLines": text})["orderLines"], "orderLines", [])
+        assert parsed == expected, (text, parsed, expected)
+
+        mutated = list(text)
+        for _ in range(random.randint(1, 3)):
+            position = random.randint(0, len(mutated))
+            if mutated and random.random() < 0.5:
+                del mutated[min(position, len(mutated) - 1)]
+            else:
+                mutated.insert(position, random.choice(alphabet))
+        try:
+            handler.normalize_order({"orderLines": "".join(mutated)})
+        except handler.BedrockValueSyntaxError:
+            pass
+
+
+def test_order_lines_round_trip_through_the_bedrock_syntax():
+    random.seed(14)
+    _fuzz_order_lines_parser(rounds=500)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("12345678901234567891", 12345678901234567891),
+    ("2.0", 2),
+    ("1e3", 1000),
+    ("2.5", "2.5"),
+    ("many", "many"),
+])
+def test_integers_are_coerced_exactly(value, expected):
+    errors = []
+
+    coerced = handler.compile_validator({"type": "integer"})(value, "qty", errors)
+
+    assert (coerced, type(coerced)) == (expected, type(expected))
+    assert bool(errors) == isinstance(expected, str)
+
+
+def test_order_lines_are_coerced_to_the_schema(storage):
+    event = {"actionGroup": "HandleOrders", "apiPath": "/orders", "httpMethod": "POST",
+             "requestBody": {"content": {"application/json": {"properties": [
+                 {"name": "orderId", "type": "string", "value": "1"},
+                 {"name": "customer", "type": "string", "value": "Jettro"},
+                 {"name": "total", "type": "number", "value": "7.5"},
+                 {"name": "orderLines", "type": "array", "value": "[{item=Fries, large, quantity=2.0}]"},
+             ]}}}}
+
+    assert _handle(event)[0] == 200
+    assert storage.get("1")["orderLines"] == [{"product": "Fries, large", "qty": 2}]
+
+
+def test_order_lines_with_a_syntax_error_are_a_bad_request(storage):
+    event = {"actionGroup": "HandleOrders", "apiPath": "/orders", "httpMethod": "POST",
+             "requestBody": {"content": {"application/json": {"properties": [
+                 {"name": "orderId", "type": "string", "value": "1"},
+                 {"name": "orderLines", "type": "array", "value": "[{item=Fries"},
+             ]}}}}
+
+    status_code, body = _handle(event)
+
+    assert status_code == 400
+    assert "position" in body["error"]
+
+
+def test_an_invalid_order_is_a_bad_request_listing_every_problem(storage):
+    body = {"orderId": "1", "total": "x", "orderLines": [{"product": "Fries", "qty": "many"}]}
+
+    status_code, result = _handle(_event("POST", "/orders", body=body))
+
+    assert status_code == 400
+    assert result == {"error": "Invalid request", "details": [
+        {"field": "customer", "message": "is required"},
+        {"field": "total", "message": "must be of type number"},
+        {"field": "orderLines[0].qty", "message": "must be of type integer"},
+    ]}
+    assert storage.get("1") is None
+
+
+@pytest.mark.parametrize("method, order_lines, details", [
+    ("POST", "[{product=Fries}]", [{"field": "orderLines[0].qty", "message": "is required"}]),
+    ("POST", {"product": "Fries"}, [{"field": "orderLines", "message": "must be a list"}]),
+    ("PUT", "[{product=Fries, qty=many}]", [{"field": "orderLines[0].qty", "message": "must be of type integer"}]),
+    ("PUT", "[{product=Fries", [{"field": "orderLines",
+                                 "message": "is not a valid list: Expected ',' or '}' at position 15 of 15"}]),
+])
+def test_malformed_order_lines_are_a_bad_request(storage, method, order_lines, details):
+    storage.put("1", _order("1"))
+    body = {"orderId": "1", "customer": "Jettro", "total": 7.5, "orderLines": order_lines}
+    event = _event("POST", "/orders", body=body) if method == "POST" else \
+        _event("PUT", "/orders/{id}", {"id": "1"}, body)
+
+    status_code, result = _handle(event)
+
+    assert (status_code, result) == (400, {"error": "Invalid request", "details": details})
+    assert storage.get("1") == _order("1")
+
+
+def _create_event(customer="Jettro Coenradie"):
+    return {"actionGroup": "HandleOrders", "apiPath": "/orders", "httpMethod": "POST",
+            "requestBody": {"content": {"application/json": {"properties": [
+                {"name": "orderId", "type": "string", "value": "1"},
+                {"name": "customer", "type": "string", "value": customer},
+                {"name": "total", "type": "number", "value": "7.5"},
+                {"name": "orderLines", "type": "array", "value": "[{product=Fries, qty=2}]"},
+            ]}}}}
+
+
+def test_sampled_invocations_log_their_payloads_redacted(storage, caplog, monkeypatch):
+    monkeypatch.setattr(handler, "PAYLOAD_LOG_SAMPLE_RATE", 1.0)
+    caplog.set_level(logging.INFO)
+
+    assert _handle(_create_event())[0] == 200
+
+    messages = [record.getMessage() for record in caplog.records]
+    payloads = [message for message in messages if message.startswith(("Event:", "Parsed body:"))]
+    assert len(payloads) == 2
+    assert all("Jettro Coenradie" not in payload and "***" in payload for payload in payloads)
+    assert '"total": 7.5' in payloads[1]
+
+
+def test_payloads_are_not_serialized_when_the_invocation_is_not_sampled(storage, caplog, monkeypatch):
+    redacted = []
+    monkeypatch.setattr(handler, "_redact", lambda value: redacted.append(value) or value)
+    monkeypatch.setattr(handler, "PAYLOAD_LOG_SAMPLE_RATE", 0.0)
+    caplog.set_level(logging.INFO)
+
+    assert _handle(_create_event())[0] == 200
+
+    assert redacted == []
+    assert caplog.records and all("Jettro" not in record.getMessage() for record in caplog.records)
+
+
+def test_payloads_are_redacted_and_truncated_only_when_formatted(monkeypatch):
+    redacted, redact = [], handler._redact
+    monkeypatch.setattr(handler, "_redact", lambda value: redacted.append(value) or redact(value))
+    monkeypatch.setattr(handler, "LOG_MAX_PAYLOAD_CHARS", 20)
+    payload = handler.RedactedPayload({"customer": "Jettro", "note": "x" * 100})
+
+    assert redacted == []
+    assert str(payload) == '{"customer": "***", ... (131 chars)'
+    assert redacted[0] is payload.payload
+
+
+def test_json_log_records_carry_the_invocation_context():
+    handler.start_invocation_logging(_create_event(), type("Context", (), {"aws_request_id": "request-1"})())
+    record = logging.LogRecord("orders", logging.INFO, __file__, 1, "Order created: %s", ("1",), None)
+    handler.InvocationContextFilter().filter(record)
+
+    entry = json.loads(handler.JsonLogFormatter().format(record))
+
+    assert entry["message"] == "Order created: 1"
+    assert (entry["requestId"], entry["apiPath"], entry["httpMethod"]) == ("request-1", "/orders", "POST")
@@ -0,0 +1,110 @@
+import threading
+import time
+
+import pytest
+
+from bedrock_agent.utils.provisioning_engine import ProvisioningStep, retry_with_backoff, run_provisioning_steps
+
+
+class StepLog:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+
+    def step(self, name, result=None, duration=0.01, error=None):
+        def _action(dependency_results):
+            with self.lock:
+                self.events.append(("start", name, dict(dependency_results)))
+            time.sleep(duration)
+            with self.lock:
+                self.events.append(("end", name))
+            if error is not None:
+                raise error
+            return result
+        return _action
+
+    def position(self, event, name):
+        return next(index for index, logged in enumerate(self.events) if logged[:2] == (event, name))
+
+
+def test_steps_start_after_their_dependencies_with_their_results():
+    log = StepLog()
+    steps = [
+        ProvisioningStep("function", log.step("function", "arn:function"), depends_on=("role",)),
+        ProvisioningStep("role", log.step("role", "arn:role")),
+        ProvisioningStep("bucket", log.step("bucket", "bucket")),
+        ProvisioningStep("policy", log.step("policy"), depends_on=("role", "bucket")),
+    ]
+
+    results, durations = run_provisioning_steps(steps)
+
+    assert results == {"role": "arn:role", "bucket": "bucket", "function": "arn:function", "policy": None}
+    assert set(durations) == set(results)
+    assert log.position("end", "role") < log.position("start", "function")
+    assert max(log.position("end", "role"), log.position("end", "bucket")) < log.position("start", "policy")
+    assert ("start", "function", {"role": "arn:role"}) in log.events
+
+
+def test_independent_steps_run_concurrently():
+    barrier = threading.Barrier(2, timeout=5)
+    steps = [ProvisioningStep(name, lambda _: barrier.wait()) for name in ("role", "bucket")]
+
+    # Both steps wait for each other, so this only finishes when they run at the same time
+    results, _ = run_provisioning_steps(steps)
+
+    assert set(results) == {"role", "bucket"}
+
+
+def test_a_failed_step_skips_its_dependents_and_waits_for_running_steps():
+    log = StepLog()
+    steps = [
+        ProvisioningStep("role", log.step("role", error=RuntimeError("role failed"))),
+        ProvisioningStep("bucket", log.step("bucket", duration=0.1)),
+        ProvisioningStep("function", log.step("function"), depends_on=("role",)),
+    ]
+
+    with pytest.raises(RuntimeError, match="role failed"):
+        run_provisioning_steps(steps)
+
+    assert ("end", "bucket") in log.events
+    assert all(event[1] != "function" for event in log.events)
+
+
+@pytest.mark.parametrize("steps, message", [
+    ([ProvisioningStep("a", None), ProvisioningStep("a", None)], "unique"),
+    ([ProvisioningStep("a", None, depends_on=("b",))], "unknown steps: \\['b'\\]"),
+    ([ProvisioningStep("a", None, depends_on=("b",)), ProvisioningStep("b", None, depends_on=("a",))], "cycle"),
+])
+def test_invalid_plans_are_rejected_before_any_step_runs(steps, message):
+    with pytest.raises(ValueError, match=message):
+        run_provisioning_steps(steps)
+
+
+def test_retry_with_backoff_retries_only_retryable_errors():
+    calls = []
+
+    def _flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise TimeoutError("not yet")
+        return "done"
+
+    assert retry_with_backoff(_flaky, lambda e: isinstance(e, TimeoutError), base_delay=0.001) == "done"
+    assert len(calls) == 3
+
+    with pytest.raises(ValueError):
+        retry_with_backoff(lambda: calls.append(1) or int("x"), lambda e: isinstance(e, TimeoutError))
+    assert len(calls) == 4
+
+
+
+def test_retry_with_backoff_gives_up_after_max_attempts():
+    calls = []
+
+    def _failing():
+        calls.append(1)
+        raise TimeoutError("never")
+
+    with pytest.raises(TimeoutError):
+        retry_with_backoff(_failing, lambda e: True, max_attempts=3, base_delay=0.001)
+    assert len(calls) == 3
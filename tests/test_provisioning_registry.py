@@ -0,0 +1,50 @@
+import json
+
+from bedrock_agent.crm import orders_support_agent
+from bedrock_agent.crm.orders_support_agent import ORDER_SUPPORT_AGENT_LAMBDA_NAME, OrderSupportAgent
+from bedrock_agent.utils.provisioning_registry import ProvisioningRegistry
+
+
+def test_values_are_provisioned_once_and_shared_through_the_cache_file(tmp_path):
+    cache_file = str(tmp_path / "provisioning.json")
+    calls = []
+
+    first = ProvisioningRegistry(cache_file).get_or_create("lambda_arn", lambda: calls.append(1) or "arn:1")
+    second = ProvisioningRegistry(cache_file).get_or_create("lambda_arn", lambda: calls.append(1) or "arn:2")
+
+    assert (first, second, len(calls)) == ("arn:1", "arn:1", 1)
+
+
+def test_values_that_are_not_persisted_stay_in_memory(tmp_path):
+    cache_file = tmp_path / "provisioning.json"
+    registry = ProvisioningRegistry(str(cache_file))
+
+    registry.put("lambda_arn", "arn:1")
+    registry.get_or_create("account_id:AKIA1", lambda: "123456789012", persist=False)
+
+    assert registry.get("account_id:AKIA1") == "123456789012"
+    assert list(json.loads(cache_file.read_text())) == ["lambda_arn"]
+    assert ProvisioningRegistry(str(cache_file)).get("account_id:AKIA1") is None
+
+
+def test_expired_values_are_provisioned_again(tmp_path):
+    registry = ProvisioningRegistry(str(tmp_path / "provisioning.json"), ttl_seconds=0)
+
+    registry.put("lambda_arn", "arn:1")
+
+    assert registry.get_or_create("lambda_arn", lambda: "arn:2") == "arn:2"
+
+
+def test_cleaning_up_the_order_agent_forgets_its_lambda(tmp_path, monkeypatch):
+    removed = []
+    monkeypatch.setattr(orders_support_agent, "remove_lambda_function_and_its_resources",
+                        lambda **kwargs: removed.append(kwargs["custom_name"]))
+    monkeypatch.setattr(OrderSupportAgent, "account_id", "123456789012")
+    registry = ProvisioningRegistry(str(tmp_path / "provisioning.json"))
+    key = f"lambda_arn:eu-west-1:123456789012:{ORDER_SUPPORT_AGENT_LAMBDA_NAME}"
+    registry.put(key, "arn:aws:lambda:eu-west-1:123456789012:function:old")
+
+    OrderSupportAgent("eu-west-1", provisioning_registry=registry).clean_up()
+
+    assert removed == [ORDER_SUPPORT_AGENT_LAMBDA_NAME]
+    assert ProvisioningRegistry(registry.cache_file).get(key) is None
@@ -0,0 +1,131 @@
+import threading
+import time
+
+from bedrock_agent.crm.marketing_agent import MarketingAgent
+from bedrock_agent.utils.fake_runtime_client import DEFAULT_ANSWER, FakeInlineAgentRuntimeClient, \
+    sample_request_params
+from bedrock_agent.utils.inline_agent_utils import invoke_inline_agent
+from bedrock_agent.utils.response_cache import DiskBackend, InMemoryBackend, RedisBackend, ResponseCache, \
+    request_cache_key
+from bedrock_agent.utils.trace_events import NullTraceSink
+
+
+def _invoke(client, params, cache):
+    return invoke_inline_agent(client, params, trace_sink=NullTraceSink(), response_cache=cache)
+
+
+def test_cache_key_ignores_the_session():
+    first, second = sample_request_params("Hi"), sample_request_params("Hi")
+
+    assert request_cache_key(first) == request_cache_key({**second, "enableTrace": True})
+    assert request_cache_key(first) != request_cache_key(sample_request_params("Hello"))
+
+
+def test_a_cached_answer_is_returned_without_invoking_the_agent():
+    client, cache = FakeInlineAgentRuntimeClient(), ResponseCache()
+
+    first = _invoke(client, sample_request_params("What is your mission?"), cache)
+    second = _invoke(client, sample_request_params("What is your mission?"), cache)
+
+    assert (first.cached, second.cached) == (False, True)
+    assert second.answer == DEFAULT_ANSWER
+    assert second.request_id == first.request_id
+    assert client.calls == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_continued_turns_and_failed_answers_are_not_cached():
+    class FailingClient(FakeInlineAgentRuntimeClient):
+        def invoke_inline_agent(self, **request_params) -> dict:
+            response = super().invoke_inline_agent(**request_params)
+            response["ResponseMetadata"]["HTTPStatusCode"] = 500
+            return response
+
+    cache = ResponseCache()
+    continued = {**sample_request_params("Hi"), "inlineSessionState": {"invocationId": "1"}}
+    _invoke(FakeInlineAgentRuntimeClient(), continued, cache)
+    _invoke(FailingClient(), sample_request_params("Hi"), cache)
+
+    assert cache.get(continued) is None
+    assert cache.get(sample_request_params("Hi")) is None
+
+
+def test_agents_apply_their_own_cache():
+    client, cache = FakeInlineAgentRuntimeClient(), ResponseCache()
+    first_agent, second_agent = MarketingAgent(response_cache=cache), MarketingAgent(response_cache=cache)
+
+    first = first_agent.invoke(client, "What is your mission?", trace_sink=NullTraceSink())
+    second = second_agent.invoke(client, "What is your mission?", trace_sink=NullTraceSink())
+    uncached = MarketingAgent().invoke(client, "What is your mission?", trace_sink=NullTraceSink())
+
+    assert (first.cached, second.cached, uncached.cached) == (False, True, False)
+    assert client.calls == 2
+
+
+def test_in_memory_backend_expires_and_evicts_entries():
+    backend = InMemoryBackend(max_entries=2)
+    backend.set("expired", "value", ttl_seconds=0)
+    backend.set("a", "1", 60)
+    backend.set("b", "2", 60)
+    backend.get("a")
+    backend.set("c", "3", 60)
+
+    assert [backend.get(key) for key in ("expired", "a", "b", "c")] == [None, "1", None, "3"]
+
+
+def test_disk_backend_shares_answers_between_instances(tmp_path):
+    DiskBackend(str(tmp_path)).set("key", "value", 60)
+    DiskBackend(str(tmp_path)).set("expired", "value", 0)
+    backend = DiskBackend(str(tmp_path))
+
+    assert backend.get("key") == "value"
+    assert backend.get("expired") is None
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["key.json"]
+    backend.clear()
+    assert backend.get("key") is None
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        value = self.values.get(key)
+        return value[0].encode("utf8") if value and value[1] > time.time() else None
+
+    def set(self, key, value, ex):
+        self.values[key] = (value, time.time() + ex)
+
+    def scan_iter(self, match):
+        return [key for key in self.values if key.startswith(match.rstrip("*"))]
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+
+def test_redis_backend_prefixes_and_clears_its_keys():
+    client = FakeRedis()
+    client.set("other", "value", 60)
+    backend = RedisBackend(client)
+
+    backend.set("key", "value", 0.2)
+
+    assert backend.get("key") == "value"
+    assert client.values["bedrock-agent:response:key"][1] - time.time() > 0.5
+    backend.clear()
+    assert list(client.values) == ["other"]
+
+
+def test_counters_add_up_under_concurrent_use():
+    cache = ResponseCache()
+    cache.put(sample_request_params("Hi"), "Hello")
+    threads = [threading.Thread(target=lambda: [cache.get(sample_request_params("Hi" if i % 2 else "Hi!"))
+                                                for i in range(500)]) for _ in range(8)]
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert (cache.hits, cache.misses) == (8 * 250, 8 * 250)
@@ -0,0 +1,111 @@
+import threading
+
+import pytest
+
+from bedrock_agent.utils.retrieval_cache import RetrievalCache, normalize_query
+
+
+class CountingRetriever:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, query):
+        self.queries.append(query)
+        return [f"result for {query}"]
+
+
+def test_normalize_query_ignores_case_punctuation_and_stop_words():
+    assert normalize_query("What is the battery life?") == normalize_query("battery LIFE") == "battery life"
+
+
+def test_equivalent_queries_are_retrieved_once():
+    cache, retrieve = RetrievalCache(), CountingRetriever()
+
+    first = cache.get_or_retrieve("What is the battery life?", retrieve)
+    second = cache.get_or_retrieve("battery life", retrieve)
+
+    assert first == second == ["result for What is the battery life?"]
+    assert len(retrieve.queries) == 1
+    assert cache.stats() == {"hits": 1, "similarHits": 0, "misses": 1, "size": 1}
+
+
+def test_expired_results_are_retrieved_again():
+    cache, retrieve = RetrievalCache(ttl_seconds=0), CountingRetriever()
+
+    cache.get_or_retrieve("battery", retrieve)
+    cache.get_or_retrieve("battery", retrieve)
+
+    assert len(retrieve.queries) == 2
+
+
+def test_the_least_recently_used_query_is_evicted():
+    cache, retrieve = RetrievalCache(max_entries=2), CountingRetriever()
+
+    for query in ("battery", "bluetooth", "battery", "warranty", "battery", "bluetooth"):
+        cache.get_or_retrieve(query, retrieve)
+
+    assert retrieve.queries == ["battery", "bluetooth", "warranty", "bluetooth"]
+
+
+def test_a_new_source_version_clears_the_cache():
+    cache, retrieve = RetrievalCache(), CountingRetriever()
+
+    cache.get_or_retrieve("battery", retrieve, source_version=1)
+    cache.get_or_retrieve("battery", retrieve, source_version=1)
+    cache.get_or_retrieve("battery", retrieve, source_version=2)
+
+    assert len(retrieve.queries) == 2
+
+
+def test_results_of_an_older_source_version_are_not_cached():
+    cache, retrieve = RetrievalCache(), CountingRetriever()
+
+    def _retrieve_while_the_source_changes(query):
+        # Another request sees the new version of the knowledge base while this one is retrieving
+        cache.get_or_retrieve("warranty", retrieve, source_version=2)
+        return retrieve(query)
+
+    cache.get_or_retrieve("battery", _retrieve_while_the_source_changes, source_version=1)
+    cache.get_or_retrieve("battery", retrieve, source_version=2)
+
+    assert retrieve.queries == ["warranty", "battery", "battery"]
+
+
+def test_invalidate_forgets_all_results():
+    cache, retrieve = RetrievalCache(), CountingRetriever()
+    cache.get_or_retrieve("battery", retrieve)
+
+    cache.invalidate()
+
+    assert cache.get("battery") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_near_duplicate_queries_hit_with_an_embedder():
+    pytest.importorskip("numpy")
+    from bedrock_agent.utils.local_knowledge_base import HashingEmbedder
+
+    cache, retrieve = RetrievalCache(embedder=HashingEmbedder()), CountingRetriever()
+
+    cache.get_or_retrieve("battery life of the headphones", retrieve)
+    similar = cache.get_or_retrieve("headphones battery life", retrieve)
+    cache.get_or_retrieve("install the thermostat", retrieve)
+
+    assert similar == ["result for battery life of the headphones"]
+    assert retrieve.queries == ["battery life of the headphones", "install the thermostat"]
+    assert cache.stats()["similarHits"] == 1
+
+
+def test_counters_add_up_under_concurrent_use():
+    cache, retrieve = RetrievalCache(max_entries=8), CountingRetriever()
+    threads = [threading.Thread(target=lambda: [cache.get_or_retrieve(f"query {i % 16}", retrieve)
+                                                for i in range(200)]) for _ in range(8)]
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = cache.stats()
+    assert stats["hits"] + stats["misses"] == 8 * 200
+    assert stats["size"] <= 8
@@ -0,0 +1,85 @@
+from bedrock_agent.crm.marketing_agent import MarketingAgent
+from bedrock_agent.utils.fake_runtime_client import FakeInlineAgentRuntimeClient
+from bedrock_agent.utils.session_manager import SessionManager
+from bedrock_agent.utils.trace_events import NullTraceSink
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _manager(client=None, **kwargs):
+    clock = Clock()
+    return SessionManager(MarketingAgent, client=client, clock=clock, **kwargs), clock
+
+
+def test_a_user_keeps_the_session_between_turns():
+    manager, _ = _manager(FakeInlineAgentRuntimeClient())
+
+    first = manager.invoke("jettro", "Hi", trace_sink=NullTraceSink())
+    second = manager.invoke("jettro", "Who are you?", trace_sink=NullTraceSink())
+
+    assert first.session_id == second.session_id
+    assert manager.session("jettro").turns == 2
+
+
+def test_idle_sessions_are_ended_and_their_agents_reused():
+    client = FakeInlineAgentRuntimeClient()
+    manager, clock = _manager(client, idle_ttl_seconds=10)
+    old_session_id = manager.invoke("jettro", "Hi", trace_sink=NullTraceSink()).session_id
+
+    clock.now = 11
+    assert manager.evict_idle() == 1
+    new_session = manager.session("jeroen")
+
+    assert new_session.session_id != old_session_id
+    stats = manager.stats()
+    assert (stats.agents_created, stats.agents_reused, stats.sessions_evicted) == (1, 1, 1)
+    # One turn and one endSession call
+    assert client.calls == 2
+
+
+def test_the_least_recently_used_session_is_evicted_above_the_maximum():
+    manager, clock = _manager(max_sessions=2)
+
+    for user_id in ("a", "b", "a", "c"):
+        clock.now += 1
+        manager.session(user_id)
+
+    assert len(manager) == 2
+    assert manager.stats().sessions_evicted == 1
+    # b was evicted, its agent waits in the pool for the next new session
+    manager.session("b")
+    assert manager.stats().agents_reused == 1
+
+
+def test_sessions_in_use_are_not_evicted_or_reset():
+    manager, clock = _manager(max_sessions=1, idle_ttl_seconds=10)
+
+    with manager.use("jettro") as session:
+        session_id = session.session_id
+        clock.now = 11
+        manager.session("jeroen")
+        manager.evict_idle()
+        assert manager.end_session("jettro")
+        assert session.session_id == session_id
+        assert manager.stats().pooled_agents == 1
+
+    assert session.turns == 1
+    assert manager.stats().pooled_agents == 2
+    assert manager.session("jettro").session_id != session_id
+
+
+def test_close_ends_all_sessions():
+    manager, _ = _manager()
+    manager.session("a")
+    manager.session("b")
+
+    manager.close()
+
+    assert len(manager) == 0
+    assert manager.stats().sessions_ended == 2